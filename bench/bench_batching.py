@@ -0,0 +1,125 @@
+# Canola2 Jamendo Plugin
+# Authors: Vincent Lark <vincent.lark@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Additional permission under GNU GPL version 3 section 7
+#
+# If you modify this Program, or any covered work, by linking or combining it
+# with Canola2 and its core components (or a modified version of any of those),
+# containing parts covered by the terms of Instituto Nokia de Tecnologia End
+# User Software Agreement, the licensors of this Program grant you additional
+# permission to convey the resulting work.
+
+"""Main loop responsiveness of batched children insertion.
+
+Appends a large result set to a list emulating a notifying model
+children list (each notification costs --notify-cost seconds, as a
+view relayout would) and reports the longest main loop stall, once
+with the plain append loop the folders used before and once with
+BatchAppender steps run as idlers. The frame budget is respected when
+the longest stall of the batched insertion stays under --frame.
+"""
+
+import time
+
+import benchlib
+
+benchlib.add_plugin_path()
+from batching import BatchAppender
+
+
+class NotifyingList(list):
+    """List calling a costly change notification unless frozen."""
+
+    def __init__(self, notify_cost):
+        list.__init__(self)
+        self.notify_cost = notify_cost
+        self.frozen = 0
+        self.pending = False
+        self.notifications = 0
+
+    def _notify(self):
+        self.notifications += 1
+        end = time.time() + self.notify_cost
+        while time.time() < end:
+            pass
+
+    def append(self, item):
+        list.append(self, item)
+        if self.frozen:
+            self.pending = True
+        else:
+            self._notify()
+
+    def freeze(self):
+        self.frozen += 1
+
+    def thaw(self):
+        self.frozen -= 1
+        if not self.frozen and self.pending:
+            self.pending = False
+            self._notify()
+
+
+def run_plain(items, notify_cost):
+    children = NotifyingList(notify_cost)
+    start = time.time()
+    for item in items:
+        children.append(item)
+    elapsed = time.time() - start
+    return {"longest_stall": elapsed, "total": elapsed,
+            "iterations": 1, "notifications": children.notifications}
+
+
+def run_batched(items, notify_cost):
+    children = NotifyingList(notify_cost)
+    appender = BatchAppender(children, items)
+    stalls = []
+    start = time.time()
+    more = True
+    while more:
+        step_start = time.time()
+        more = appender.step()
+        stalls.append(time.time() - step_start)
+    return {"longest_stall": max(stalls), "total": time.time() - start,
+            "iterations": len(stalls), "notifications": children.notifications,
+            "stall_p95": benchlib.percentile(stalls, 95)}
+
+
+def main():
+    parser = benchlib.make_parser("%prog [options]")
+    parser.add_option("--items", type="int", default=5000,
+                      help="number of results to insert")
+    parser.add_option("--notify-cost", type="float", default=0.0002,
+                      help="seconds spent per list notification")
+    parser.add_option("--frame", type="float", default=1 / 60.0,
+                      help="frame budget in seconds")
+    options, args = parser.parse_args()
+
+    items = range(options.items)
+    plain = run_plain(items, options.notify_cost)
+    batched = run_batched(items, options.notify_cost)
+    batched["frame_budget_respected"] = \
+        batched["longest_stall"] <= options.frame
+
+    config = {"items": options.items, "notify_cost": options.notify_cost,
+              "frame": options.frame}
+    benchlib.write_results("batching", config,
+                           {"plain": plain, "batched": batched},
+                           options.output)
+
+
+if __name__ == "__main__":
+    main()
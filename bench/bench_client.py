@@ -0,0 +1,169 @@
+# Canola2 Jamendo Plugin
+# Authors: Vincent Lark <vincent.lark@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Additional permission under GNU GPL version 3 section 7
+#
+# If you modify this Program, or any covered work, by linking or combining it
+# with Canola2 and its core components (or a modified version of any of those),
+# containing parts covered by the terms of Instituto Nokia de Tecnologia End
+# User Software Agreement, the licensors of this Program grant you additional
+# permission to convey the resulting work.
+
+"""End-to-end Client benchmarks against the local stand-in server.
+
+Measures login, time to playlist, scrobble flush throughput and cover
+fetching with no network access. Run from the repository root with the
+Canola SDK in PYTHONPATH:
+
+    python bench/bench_client.py --latency 0.05 --bandwidth 50000 \\
+        -o bench_output.txt
+"""
+
+import os
+import time
+import shutil
+import tempfile
+
+import benchlib
+from standin import StandinServer, StandinConfig
+
+benchlib.add_standins_path()
+benchlib.add_plugin_path()
+from client import Client
+
+
+def make_client(server, hedge=()):
+    client = Client("bench", "bench")
+    client.hedged_endpoints = set(hedge)
+    server.configure_client(client)
+    return client
+
+
+def bench_login(server, iterations, hedge=()):
+    def login():
+        client = make_client(server)
+        client.login()
+        client.logout()
+    return benchlib.summarize(benchlib.measure(login, iterations))
+
+
+def bench_time_to_playlist(server, iterations, hedge=()):
+    client = make_client(server, hedge)
+    client.login()
+    stations = ["lastfm://globaltags/tag%d" % i for i in xrange(iterations)]
+
+    def playlist():
+        client.get_station_tracks(stations.pop())
+
+    tracks = server.config.tracks
+    try:
+        return benchlib.summarize(benchlib.measure(playlist, iterations, 0),
+                                  tracks)
+    finally:
+        client.logout()
+
+
+def bench_scrobble_flush(server, iterations, hedge=(), batch=50):
+    client = make_client(server)
+    client.login()
+    now = int(time.time())
+
+    def flush():
+        for i in xrange(batch):
+            client.submit("Track %d" % i, "Artist", "Album", "", 200,
+                          now - i * 200)
+
+    try:
+        return benchlib.summarize(benchlib.measure(flush, iterations), batch)
+    finally:
+        client.logout()
+
+
+def bench_covers(server, iterations, hedge=(), batch=10):
+    client = make_client(server, hedge)
+    path = tempfile.mkdtemp()
+    counter = [0]
+
+    def fetch():
+        for i in xrange(batch):
+            counter[0] += 1
+            client.fetch_file("%s/cover/%d.jpg" % (server.base_url,
+                                                   counter[0]),
+                              os.path.join(path, "%d.jpg" % counter[0]))
+
+    try:
+        return benchlib.summarize(benchlib.measure(fetch, iterations), batch)
+    finally:
+        shutil.rmtree(path)
+
+
+BENCHMARKS = [("login", bench_login),
+              ("time_to_playlist", bench_time_to_playlist),
+              ("scrobble_flush", bench_scrobble_flush),
+              ("cover_fetch", bench_covers)]
+
+
+def main():
+    parser = benchlib.make_parser("%prog [options] [benchmark ...]")
+    parser.add_option("--latency", type="float", default=0.0,
+                      help="server latency in seconds")
+    parser.add_option("--bandwidth", type="int", default=0,
+                      help="server bandwidth in bytes/s (0: unlimited)")
+    parser.add_option("--error-rate", type="float", default=0.0,
+                      help="probability of a 503 answer")
+    parser.add_option("--slow-rate", type="float", default=0.0,
+                      help="probability of a slow answer")
+    parser.add_option("--slow-latency", type="float", default=1.0,
+                      help="extra latency of slow answers in seconds")
+    parser.add_option("--hedge", action="append", default=[],
+                      help="hedge requests to this endpoint (cover)")
+    parser.add_option("--tracks", type="int", default=5,
+                      help="tracks per playlist")
+    parser.add_option("--cover-size", type="int", default=20000,
+                      help="cover size in bytes")
+    parser.add_option("--compression", default=None,
+                      help="compress text responses (gzip or deflate)")
+    options, args = parser.parse_args()
+
+    config = StandinConfig(latency=options.latency,
+                           bandwidth=options.bandwidth,
+                           error_rate=options.error_rate,
+                           slow_rate=options.slow_rate,
+                           slow_latency=options.slow_latency,
+                           tracks=options.tracks,
+                           cover_size=options.cover_size,
+                           compression=options.compression,
+                           seed=0)
+    server = StandinServer(config)
+    server.start()
+
+    results = {}
+    try:
+        for name, func in BENCHMARKS:
+            if args and name not in args:
+                continue
+            results[name] = func(server, options.iterations,
+                                 options.hedge)
+    finally:
+        server.stop()
+
+    config_dict = config.as_dict()
+    config_dict["hedge"] = options.hedge
+    benchlib.write_results("client", config_dict, results, options.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+# Canola2 Jamendo Plugin
+# Authors: Vincent Lark <vincent.lark@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Additional permission under GNU GPL version 3 section 7
+#
+# If you modify this Program, or any covered work, by linking or combining it
+# with Canola2 and its core components (or a modified version of any of those),
+# containing parts covered by the terms of Instituto Nokia de Tecnologia End
+# User Software Agreement, the licensors of this Program grant you additional
+# permission to convey the resulting work.
+
+"""Segmented and resumed track downloads against the stand-in server.
+
+"plain" fetches each stream with a single request, "segmented" with
+parallel byte range requests; the stand-in throttles every connection
+to --bandwidth so segments add up as they would behind a per
+connection limited server. "resume" cuts the first --disconnects
+responses after --disconnect-after bytes and downloads again until
+the file is complete, reporting attempts and bytes fetched twice.
+Every downloaded file is checked against the served data.
+"""
+
+import os
+import md5
+import shutil
+import tempfile
+
+import benchlib
+
+benchlib.add_standins_path()
+benchlib.add_plugin_path()
+from download import Download, DownloadError
+from standin import StandinConfig, StandinServer
+
+
+def check(server, path):
+    fd = open(path, "rb")
+    try:
+        data = fd.read()
+    finally:
+        fd.close()
+    expected = server.stream_data(server.config.stream_size)
+    if md5.new(data).digest() != md5.new(expected).digest():
+        raise AssertionError("downloaded data differs from the stream")
+
+
+def run_downloads(config, iterations, segments):
+    server = StandinServer(config)
+    server.start()
+    path = tempfile.mkdtemp()
+    counter = [0]
+
+    def fetch():
+        counter[0] += 1
+        target = os.path.join(path, "%d.mp3" % counter[0])
+        Download("%s/stream/%d.mp3" % (server.base_url, counter[0]),
+                 target, segments=segments).run()
+        check(server, target)
+
+    try:
+        return benchlib.summarize(benchlib.measure(fetch, iterations, 0))
+    finally:
+        server.stop()
+        shutil.rmtree(path)
+
+
+def run_resume(config, segments):
+    server = StandinServer(config)
+    server.start()
+    path = tempfile.mkdtemp()
+    target = os.path.join(path, "track.mp3")
+    download = None
+    attempts = 0
+    try:
+        while True:
+            attempts += 1
+            download = Download("%s/stream/0.mp3" % server.base_url, target,
+                                segments=segments)
+            try:
+                download.run()
+                break
+            except DownloadError:
+                if attempts > 100:
+                    raise
+        check(server, target)
+        fetched = server.requests.get("/stream/0.mp3", 0)
+        return {"attempts": attempts, "requests": fetched,
+                "size": config.stream_size}
+    finally:
+        server.stop()
+        shutil.rmtree(path)
+
+
+def main():
+    parser = benchlib.make_parser("%prog [options]")
+    parser.add_option("--bandwidth", type="int", default=200000,
+                      help="per connection bandwidth in bytes/s")
+    parser.add_option("--stream-size", type="int", default=2000000,
+                      help="track size in bytes")
+    parser.add_option("--segments", type="int", default=4,
+                      help="parallel segments")
+    parser.add_option("--disconnect-after", type="int", default=300000,
+                      help="bytes sent before cutting a connection")
+    parser.add_option("--disconnects", type="int", default=3,
+                      help="number of cut connections")
+    options, args = parser.parse_args()
+
+    config = StandinConfig(bandwidth=options.bandwidth,
+                           stream_size=options.stream_size, seed=0)
+    results = {}
+    results["plain"] = run_downloads(config, options.iterations, 1)
+    results["segmented"] = run_downloads(config, options.iterations,
+                                         options.segments)
+
+    config.disconnect_after = options.disconnect_after
+    config.disconnects = options.disconnects
+    results["resume"] = run_resume(config, options.segments)
+
+    config_dict = config.as_dict()
+    config_dict["segments"] = options.segments
+    benchlib.write_results("download", config_dict, results, options.output)
+
+
+if __name__ == "__main__":
+    main()
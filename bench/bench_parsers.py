@@ -0,0 +1,179 @@
+# Canola2 Jamendo Plugin
+# Authors: Vincent Lark <vincent.lark@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Additional permission under GNU GPL version 3 section 7
+#
+# If you modify this Program, or any covered work, by linking or combining it
+# with Canola2 and its core components (or a modified version of any of those),
+# containing parts covered by the terms of Instituto Nokia de Tecnologia End
+# User Software Agreement, the licensors of this Program grant you additional
+# permission to convey the resulting work.
+
+"""Microbenchmarks of the Client response parsers.
+
+Runs the reference parsers (the implementation the Client used before
+the single pass parsing core) and the current ones over synthetic
+payloads, checks both produce the same objects and reports their
+throughput in items per second:
+
+    python bench/bench_parsers.py --tracks 10000 --friends 5000
+"""
+
+import time
+from cStringIO import StringIO
+
+import benchlib
+from standin import make_xspf, make_userfeed
+
+benchlib.add_standins_path()
+benchlib.add_plugin_path()
+import client
+from client import ElementTree, Track, Album, Artist, Friend, to_utf8
+
+
+##############################################################################
+# Reference parsers
+##############################################################################
+
+def ref_split_lines(data):
+    lines = StringIO(data).readlines()
+    return [c.strip() for c in lines]
+
+
+def ref_parse_dict(lines):
+    result = {}
+    for line in lines:
+        key, val = line.split("=", True)
+        result[key] = val.strip()
+    return result
+
+
+def ref_parse_xspf(xml, default_expiry):
+    lst = []
+    tree = ElementTree.fromstring(xml)
+
+    expiry = default_expiry
+    for link in tree.findall("link"):
+        if (link.get("rel") or "").endswith("/expiry"):
+            expiry = int(link.text)
+    expires = time.time() + expiry
+
+    tracklist = tree.find("trackList")
+    for child in tracklist.findall("track"):
+        track = Track(to_utf8(child.find("title").text),
+                      child.find("id").text)
+
+        track.album = Album(to_utf8(child.find("album").text or ""))
+        track.artist = Artist(to_utf8(child.find("creator").text or ""))
+
+        track.url = child.find("location").text
+        track.duration = int(child.find("duration").text)
+        track.image = child.find("image").text
+        track.expires = expires
+
+        lst.append(track)
+
+    return lst
+
+
+def ref_parse_userfeed(xml, cls):
+    lst = []
+    tree = ElementTree.fromstring(xml)
+    for child in tree.getchildren():
+        user = cls(to_utf8(child.get("username")))
+        user.url = child.find("url").text
+        user.image = child.find("image").text
+        lst.append(user)
+
+    return lst
+
+
+##############################################################################
+# Comparison
+##############################################################################
+
+def as_data(obj):
+    """Return a comparable representation of parsed objects."""
+    if isinstance(obj, list):
+        return [as_data(c) for c in obj]
+    if hasattr(obj, "__dict__"):
+        data = dict((k, as_data(v)) for k, v in vars(obj).iteritems())
+        # expiry is relative to parsing time
+        data.pop("expires", None)
+        return (obj.__class__.__name__, data)
+    return (type(obj).__name__, obj)
+
+
+def compare(name, ref, cur, units, iterations):
+    ref_ret, cur_ret = ref(), cur()
+    identical = as_data(ref_ret) == as_data(cur_ret)
+    if not identical:
+        raise AssertionError("%s: parsers results differ" % name)
+
+    before = benchlib.summarize(benchlib.measure(ref, iterations), units)
+    after = benchlib.summarize(benchlib.measure(cur, iterations), units)
+    return {"identical": identical,
+            "units": units,
+            "before": before,
+            "after": after,
+            "speedup": before["mean"] / after["mean"]}
+
+
+def main():
+    parser = benchlib.make_parser("%prog [options]")
+    parser.add_option("--tracks", type="int", default=10000,
+                      help="tracks in the xspf playlist")
+    parser.add_option("--friends", type="int", default=5000,
+                      help="users in the friends feed")
+    parser.add_option("--lines", type="int", default=1000,
+                      help="key=value lines in the handshake response")
+    parser.add_option("--pure-python", action="store_true", default=False,
+                      help="use the python ElementTree instead of the C one")
+    options, args = parser.parse_args()
+
+    if options.pure_python:
+        global ElementTree
+        from xml.etree import ElementTree
+        client.ElementTree = ElementTree
+
+    base_url = "http://localhost"
+    xspf = make_xspf(base_url, "bench", options.tracks)
+    feed = make_userfeed(base_url, "friends", "bench", options.friends)
+    text = "".join("key%d= value %d\n" % (i, i) for i in xrange(options.lines))
+    n = options.iterations
+
+    results = {
+        "xspf": compare("xspf",
+                        lambda: ref_parse_xspf(xspf, 3600),
+                        lambda: client.parse_xspf(xspf, 3600),
+                        options.tracks, n),
+        "friends": compare("friends",
+                           lambda: ref_parse_userfeed(feed, Friend),
+                           lambda: client.parse_userfeed(feed, Friend),
+                           options.friends, n),
+        "lines": compare("lines",
+                         lambda: ref_parse_dict(ref_split_lines(text)),
+                         lambda: client.parse_dict(client.split_lines(text)),
+                         options.lines, n),
+    }
+
+    config = {"tracks": options.tracks, "friends": options.friends,
+              "lines": options.lines, "pure_python": options.pure_python}
+    benchlib.write_results("parsers", config, results, options.output)
+
+
+if __name__ == "__main__":
+    main()
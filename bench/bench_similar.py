@@ -0,0 +1,167 @@
+# Canola2 Jamendo Plugin
+# Authors: Vincent Lark <vincent.lark@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Additional permission under GNU GPL version 3 section 7
+#
+# If you modify this Program, or any covered work, by linking or combining it
+# with Canola2 and its core components (or a modified version of any of those),
+# containing parts covered by the terms of Instituto Nokia de Tecnologia End
+# User Software Agreement, the licensors of this Program grant you additional
+# permission to convey the resulting work.
+
+"""Local similar-artist queries over a synthetic listening history.
+
+--artists artists in --clusters clusters are played --plays times
+each on tag stations mostly of their cluster and scrobbled by
+listeners of their cluster. "observe" times recording one play,
+"similar" a top-k query and "station" assembling a similar-artist
+station; "precision" is the share of the top-k neighbours from the
+artist's own cluster.
+
+The run fails if a station built from the history offers a track that
+was dropped from the track cache or carries a used stream url.
+"""
+
+import os
+import sys
+import random
+import shutil
+import tempfile
+
+import benchlib
+
+benchlib.add_standins_path()
+benchlib.add_plugin_path()
+from terra.core.manager import Manager
+from client import Track, Album, Artist
+from track_cache import TrackCache, track_key
+import similar
+
+
+def make_track(rand, artist):
+    track = Track("Song %d" % rand.randrange(1000))
+    track.artist = Artist("Artist %d" % artist)
+    track.album = Album("Album %d" % artist)
+    track.url = "http://127.0.0.1/stream/%d.mp3" % rand.randrange(10 ** 6)
+    track.image = None
+    track.expires = None
+    return track
+
+
+class Index(dict):
+    def save(self):
+        pass
+
+
+def check_eviction(rand, path):
+    """Return the failures of a station over a cache that evicted one
+    of the played tracks."""
+    engine = similar.SimilarArtists(Manager().canola_db)
+    cache = TrackCache(path, Index(), budget=2)
+    tracks = [make_track(rand, 0) for i in xrange(3)]
+    for track in tracks:
+        filename = os.path.join(path, "download")
+        fd = open(filename, "wb")
+        fd.write("x")
+        fd.close()
+        cache.store(track_key(track), filename)
+        engine.observe_play(track, "lastfm://globaltags/tag0")
+
+    failures = []
+    if cache.contains(track_key(tracks[0])):
+        failures.append("the first track was not evicted")
+    playable = lambda track: cache.contains(track_key(track))
+    for track in engine.get_station_tracks("Artist 0", playable):
+        if not cache.contains(track_key(track)):
+            failures.append("evicted track offered: %s" % track.name)
+        if track.url:
+            failures.append("used stream url offered: %s" % track.url)
+    return failures
+
+
+def main():
+    parser = benchlib.make_parser("%prog [options]")
+    parser.add_option("--artists", type="int", default=500)
+    parser.add_option("--clusters", type="int", default=20)
+    parser.add_option("--plays", type="int", default=10,
+                      help="plays per artist")
+    parser.add_option("--top", type="int", default=similar.SIMILAR_TOP_K)
+    parser.add_option("--no-numpy", action="store_true",
+                      help="use the sparse scoring even if numpy is there")
+    options, args = parser.parse_args()
+
+    if options.no_numpy:
+        similar.numpy = None
+    rand = random.Random(0)
+    engine = similar.SimilarArtists(Manager().canola_db)
+
+    def play():
+        artist = rand.randrange(options.artists)
+        cluster = artist % options.clusters
+        tag = cluster * 3 + rand.randrange(3)
+        if rand.random() < 0.2:
+            tag = rand.randrange(options.clusters * 3)
+        engine.observe_play(make_track(rand, artist),
+                            "lastfm://globaltags/tag%d" % tag)
+        engine.observe_scrobble("Artist %d" % artist, "user%d" % \
+                                    (cluster * 5 + rand.randrange(5)))
+
+    results = {}
+    results["observe"] = benchlib.summarize(benchlib.measure(
+            play, options.artists * options.plays, 0))
+
+    def query():
+        engine.similar("Artist %d" % rand.randrange(options.artists),
+                       options.top)
+    results["similar"] = benchlib.summarize(benchlib.measure(
+            query, options.iterations))
+
+    def station():
+        engine.get_station_tracks("Artist %d" % \
+                                      rand.randrange(options.artists),
+                                  lambda track: True, options.top)
+    results["station"] = benchlib.summarize(benchlib.measure(
+            station, options.iterations))
+
+    hits = total = 0
+    for artist in xrange(0, options.artists, 10):
+        for score, name in engine.similar("Artist %d" % artist, options.top):
+            total += 1
+            if int(name.split()[1]) % options.clusters == \
+                    artist % options.clusters:
+                hits += 1
+    results["precision"] = total and float(hits) / total
+
+    path = tempfile.mkdtemp()
+    try:
+        failures = check_eviction(rand, path)
+    finally:
+        shutil.rmtree(path, True)
+    results["failures"] = failures
+
+    config = {"artists": options.artists, "clusters": options.clusters,
+              "plays": options.plays, "top": options.top,
+              "numpy": similar.numpy is not None}
+    benchlib.write_results("similar", config, results, options.output)
+
+    for failure in failures:
+        print >> sys.stderr, "FAIL: %s" % failure
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+# Canola2 Jamendo Plugin
+# Authors: Vincent Lark <vincent.lark@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Additional permission under GNU GPL version 3 section 7
+#
+# If you modify this Program, or any covered work, by linking or combining it
+# with Canola2 and its core components (or a modified version of any of those),
+# containing parts covered by the terms of Instituto Nokia de Tecnologia End
+# User Software Agreement, the licensors of this Program grant you additional
+# permission to convey the resulting work.
+
+"""Helpers shared by the benchmark scripts.
+
+Results are JSON documents of the form::
+
+    {"suite": "client", "time": ..., "config": {...},
+     "benchmarks": {"name": {"iterations": n, "mean": s, "p50": s, ...}}}
+
+so runs made before and after a change can be compared directly.
+"""
+
+import os
+import sys
+import time
+import platform
+from optparse import OptionParser
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+PLUGIN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           os.pardir, "canola-jamendo")
+STANDINS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             "standins")
+
+
+def add_plugin_path():
+    """Make plugin modules (client, stats, ...) importable.
+    The Canola SDK (terra) must already be in the python path."""
+    if PLUGIN_PATH not in sys.path:
+        sys.path.insert(0, PLUGIN_PATH)
+
+
+def add_standins_path():
+    """Use the headless stand-ins of ecore, terra and Canola instead
+    of the Canola SDK."""
+    if STANDINS_PATH not in sys.path:
+        sys.path.insert(0, STANDINS_PATH)
+
+
+def percentile(samples, p):
+    if not samples:
+        return None
+    lst = sorted(samples)
+    idx = min(len(lst) - 1, int(round((len(lst) - 1) * p / 100.0)))
+    return lst[idx]
+
+
+def summarize(samples, units=None):
+    """Return statistics of a list of durations in seconds.
+
+    @parm units: number of items processed per sample, used to report
+                 throughput in items per second.
+    """
+    total = sum(samples)
+    ret = {"iterations": len(samples),
+           "mean": samples and total / len(samples) or None,
+           "min": samples and min(samples) or None,
+           "max": samples and max(samples) or None,
+           "p50": percentile(samples, 50),
+           "p95": percentile(samples, 95),
+           "p99": percentile(samples, 99)}
+    if units and total:
+        ret["throughput"] = units * len(samples) / total
+    return ret
+
+
+def measure(func, iterations, warmup=1):
+    """Call func iterations times (after warmup calls) and return
+    the list of durations."""
+    for i in xrange(warmup):
+        func()
+
+    samples = []
+    for i in xrange(iterations):
+        start = time.time()
+        func()
+        samples.append(time.time() - start)
+    return samples
+
+
+def make_parser(usage):
+    parser = OptionParser(usage=usage)
+    parser.add_option("-n", "--iterations", type="int", default=20,
+                      help="iterations of each benchmark (default: 20)")
+    parser.add_option("-o", "--output", default=None,
+                      help="write JSON results to file instead of stdout")
+    return parser
+
+
+def write_results(suite, config, benchmarks, output=None):
+    data = {"suite": suite,
+            "time": time.time(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "config": config,
+            "benchmarks": benchmarks}
+    text = json.dumps(data, indent=1, sort_keys=True)
+    if output:
+        fd = open(output, "w")
+        try:
+            fd.write(text + "\n")
+        finally:
+            fd.close()
+    else:
+        print text
+    return data
@@ -0,0 +1,441 @@
+# Canola2 Jamendo Plugin
+# Authors: Vincent Lark <vincent.lark@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Additional permission under GNU GPL version 3 section 7
+#
+# If you modify this Program, or any covered work, by linking or combining it
+# with Canola2 and its core components (or a modified version of any of those),
+# containing parts covered by the terms of Instituto Nokia de Tecnologia End
+# User Software Agreement, the licensors of this Program grant you additional
+# permission to convey the resulting work.
+
+"""Headless soak test of a long listening session.
+
+Runs the plugin on the stand-ins of ecore, terra and Canola (see
+standins/) against the stand-in server, with main loop time running
+--scale times faster than the wall clock. A simulated user tunes
+stations (by artist, tag, group, "Play now" and history), listens,
+skips, pauses, loves and bans tracks while the network drops now and
+then; tracks are scrobbled by the plugin hook as in Canola.
+
+Every --sample-interval simulated seconds the harness records the
+thread count, the resident memory (/proc), the number of live objects
+(gc, and traced memory if tracemalloc is available), the requests
+served and the main loop latency. The first --warmup fraction of the
+session is left out, then the means of the first and second halves of
+the rest are compared: the run fails, with exit status 1, if any of
+them grows beyond its threshold or the main loop is blocked too long.
+"""
+
+import os
+import gc
+import sys
+import random
+import shutil
+import tempfile
+import threading
+
+import benchlib
+
+benchlib.add_standins_path()
+benchlib.add_plugin_path()
+import ecore
+from terra.core.manager import Manager
+from terra.core.plugin_prefs import PluginPrefs
+from standin import StandinConfig, StandinServer
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+TAGS = ["rock", "jazz", "electronic", "folk", "ambient", "punk"]
+ARTISTS = ["Artist %d" % i for i in xrange(8)]
+GROUPS = ["group%d" % i for i in xrange(4)]
+
+
+def get_rss():
+    """Return the resident memory in KB or None if unknown."""
+    try:
+        fd = open("/proc/self/status")
+    except IOError:
+        return None
+    try:
+        for line in fd:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    finally:
+        fd.close()
+    return None
+
+
+def count_types():
+    counts = {}
+    for obj in gc.get_objects():
+        name = type(obj).__name__
+        counts[name] = counts.get(name, 0) + 1
+    return counts
+
+
+class Shell(object):
+    """Canola main window: a stack of controllers and notifications.
+    Dialogs are answered right away, entry dialogs with query."""
+
+    def __init__(self, ui, model):
+        self.ui = ui
+        self.model = model
+        self.controllers = []
+        self.query = ""
+        self.notifies = {}
+
+    def use(self, model):
+        if isinstance(model, self.model.ServiceModelFolder):
+            controller = self.ui.AudioPlayerController(model, None, self)
+            self.controllers.append(controller)
+            controller.transition_in_finished_cb(None, None, None)
+        elif isinstance(model, self.model.HistoryModelFolder):
+            self.controllers.append(
+                self.ui.HistoryListController(model, None, self))
+        else:
+            self.controllers.append(self.ui.ListController(model, None, self))
+
+    def back(self):
+        self.controllers.pop().delete()
+
+    def killall(self):
+        while len(self.controllers) > 1:
+            self.back()
+
+    def show_notify(self, model):
+        name = type(model).__name__
+        self.notifies[name] = self.notifies.get(name, 0) + 1
+        callback = getattr(model, "callback", None)
+        if name == "EntryDialogModel":
+            callback(model, self.query)
+        elif name == "YesNoDialogModel":
+            callback(model, True)
+
+    def get_player(self):
+        if self.controllers and \
+                isinstance(self.controllers[-1],
+                           self.ui.AudioPlayerController):
+            return self.controllers[-1]
+        return None
+
+
+class Session(object):
+    """Simulated user and network of a listening session."""
+
+    def __init__(self, options, server, rand):
+        import ui
+        import model
+        import audio_scrobbler
+
+        self.options = options
+        self.server = server
+        self.rand = rand
+        self.model = model
+        self.shell = Shell(ui, model)
+        self.network = Manager().get_status_notifier("Network")
+        self.actions = {}
+        self.idle_actions = 0
+        self.error_rate = server.config.error_rate
+
+        Manager().add_hook("Hook/Player/Audio",
+                           audio_scrobbler.AudioScrobbler())
+
+        self.jam_manager = model.jam_manager
+        server.configure_client(self.jam_manager)
+        # cool downs are wall clock times
+        breaker = self.jam_manager.prober.breaker
+        breaker.cooldown /= ecore.time_scale
+        breaker.max_cooldown /= ecore.time_scale
+
+    def count(self, action):
+        self.actions[action] = self.actions.get(action, 0) + 1
+
+    def start(self):
+        self.shell.use(self.model.MainModelFolder(None))
+        ecore.timer_add(self.options.action_interval, self.act)
+        self.schedule_drop()
+
+    def stop(self):
+        while self.shell.controllers:
+            self.shell.back()
+        self.jam_manager.ratings.flush()
+        self.jam_manager.logout()
+
+    def tune(self):
+        """Leave the current station and pick another one."""
+        self.shell.killall()
+        root = self.shell.controllers[0]
+        folders = root.model.children
+        if not folders:
+            return
+        model = self.rand.choice([f for f in folders
+                                  if not isinstance(f, (
+                                      self.model.FriendsModelFolder,
+                                      self.model.NeighboursModelFolder))])
+
+        if isinstance(model, self.model.SearchByArtistModelFolder):
+            self.shell.query = self.rand.choice(ARTISTS)
+        elif isinstance(model, self.model.SearchByTagModelFolder):
+            self.shell.query = self.rand.choice(TAGS)
+        elif isinstance(model, self.model.SearchByRadioModelFolder):
+            self.shell.query = self.rand.choice(GROUPS)
+        self.count("tune")
+        root.cb_on_clicked(None, folders.index(model))
+
+        if isinstance(model, self.model.HistoryModelFolder):
+            history = self.shell.controllers[-1]
+            if history.model.children:
+                history.cb_on_clicked(None, self.rand.randrange(
+                        len(history.model.children)))
+
+    def act(self):
+        player = self.shell.get_player()
+        if player is None or not player.init_ok or \
+                player.state not in (player.STATE_PLAYING,
+                                     player.STATE_PAUSED):
+            # nothing plays for a while (no station yet, no tracks,
+            # network errors): tune again
+            self.idle_actions += 1
+            if self.idle_actions >= 3:
+                self.idle_actions = 0
+                self.tune()
+            return True
+        self.idle_actions = 0
+
+        r = self.rand.random()
+        if player.state == player.STATE_PAUSED:
+            self.count("resume")
+            player.resume()
+        elif r < 0.04:
+            self.tune()
+        elif r < 0.16:
+            self.count("skip")
+            player.next()
+        elif r < 0.21:
+            self.count("love")
+            player.cb_love_clicked(None, "", "")
+        elif r < 0.24:
+            self.count("ban")
+            player.cb_ban_clicked(None, "", "")
+        elif r < 0.28:
+            self.count("pause")
+            player.pause()
+        return True
+
+    def schedule_drop(self):
+        delay = self.rand.expovariate(1.0 / self.options.drop_interval)
+        ecore.timer_add(delay, self.drop)
+
+    def drop(self):
+        self.count("network_drop")
+        self.network.status = 0.0
+        self.server.config.error_rate = 1.0
+        ecore.timer_add(self.rand.uniform(60, 300), self.restore)
+        return False
+
+    def restore(self):
+        self.network.status = 1.0
+        self.server.config.error_rate = self.error_rate
+        self.schedule_drop()
+        return False
+
+
+class Sampler(object):
+    """Records samples; live objects by type are counted once the
+    warmup is over, to tell which ones grow."""
+
+    def __init__(self, server, start, warmup):
+        self.server = server
+        self.start = start
+        self.warmup = warmup
+        self.samples = []
+        self.types = None
+
+    def sample(self):
+        gc.collect()
+        latencies = ecore.take_latencies()
+        sample = {"hours": (ecore.time_get() - self.start) / 3600.0,
+                  "threads": threading.activeCount(),
+                  "rss_kb": get_rss(),
+                  "objects": len(gc.get_objects()),
+                  "requests": sum(self.server.requests.values()),
+                  "loop_p95": benchlib.percentile(latencies, 95),
+                  "loop_max": latencies and max(latencies) or None}
+        if tracemalloc is not None:
+            sample["traced_kb"] = tracemalloc.get_traced_memory()[0] / 1024
+        self.samples.append(sample)
+        if self.types is None and sample["hours"] >= self.warmup:
+            self.types = count_types()
+        return True
+
+    def type_growth(self, limit=10):
+        """Return the types whose live objects grew most since the
+        warmup."""
+        if self.types is None:
+            return []
+        gc.collect()
+        lst = [(count - self.types.get(name, 0), name)
+               for name, count in count_types().iteritems()]
+        lst.sort(reverse=True)
+        return [(name, growth) for growth, name in lst[:limit] if growth > 0]
+
+
+def mean(values):
+    values = [v for v in values if v is not None]
+    if not values:
+        return None
+    return float(sum(values)) / len(values)
+
+
+def check(samples, options):
+    """Return the growth of each metric and the failed checks."""
+    first = int(len(samples) * options.warmup)
+    middle = first + (len(samples) - first) / 2
+    early, late = samples[first:middle], samples[middle:]
+    if not early or not late:
+        return {}, ["session too short to compare"]
+
+    growth = {}
+    for name in ("threads", "rss_kb", "traced_kb", "objects"):
+        before = mean([s.get(name) for s in early])
+        after = mean([s.get(name) for s in late])
+        if before is not None and after is not None:
+            growth[name] = after - before
+
+    def rate(lst):
+        hours = lst[-1]["hours"] - lst[0]["hours"]
+        return hours and (lst[-1]["requests"] - lst[0]["requests"]) / hours
+
+    growth["requests_per_hour"] = (rate(early), rate(late))
+
+    failures = []
+    if growth["threads"] > options.max_thread_growth:
+        failures.append("threads grew by %.1f" % growth["threads"])
+    for name in ("rss_kb", "traced_kb"):
+        if growth.get(name, 0) > options.max_memory_growth:
+            failures.append("%s grew by %d KB" % (name, growth[name]))
+    objects = mean([s["objects"] for s in early])
+    if growth["objects"] > objects * options.max_object_growth / 100.0:
+        failures.append("objects grew by %d (%.1f%%)" % \
+                            (growth["objects"],
+                             100.0 * growth["objects"] / objects))
+    before, after = growth["requests_per_hour"]
+    if before and after > before * options.max_request_growth:
+        failures.append("requests per hour grew from %d to %d" % \
+                            (before, after))
+    worst = max([s["loop_p95"] for s in samples[first:]] or [0])
+    if worst > options.max_loop_latency:
+        failures.append("main loop p95 latency reached %.3fs" % worst)
+    return growth, failures
+
+
+def main():
+    parser = benchlib.make_parser("%prog [options]")
+    parser.add_option("--hours", type="float", default=8.0,
+                      help="simulated listening hours (default: 8)")
+    parser.add_option("--scale", type="float", default=300.0,
+                      help="simulated seconds per second (default: 300)")
+    parser.add_option("--seed", type="int", default=0)
+    parser.add_option("--stream-size", type="int", default=65536,
+                      help="track size in bytes")
+    parser.add_option("--latency", type="float", default=0.01,
+                      help="stand-in server latency in seconds")
+    parser.add_option("--error-rate", type="float", default=0.01,
+                      help="stand-in server error rate")
+    parser.add_option("--action-interval", type="float", default=60,
+                      help="simulated seconds between user actions")
+    parser.add_option("--drop-interval", type="float", default=3600,
+                      help="mean simulated seconds between network drops")
+    parser.add_option("--sample-interval", type="float", default=600,
+                      help="simulated seconds between samples")
+    parser.add_option("--warmup", type="float", default=0.25,
+                      help="fraction of the session left out of checks")
+    parser.add_option("--max-thread-growth", type="float", default=3)
+    parser.add_option("--max-memory-growth", type="int", default=8192,
+                      help="KB")
+    parser.add_option("--max-object-growth", type="float", default=10,
+                      help="percent")
+    parser.add_option("--max-request-growth", type="float", default=2,
+                      help="ratio of requests per hour")
+    parser.add_option("--max-loop-latency", type="float", default=0.25,
+                      help="seconds")
+    parser.add_option("-v", "--verbose", action="store_true")
+    options, args = parser.parse_args()
+
+    import logging
+    logging.basicConfig(level=options.verbose and logging.INFO or
+                        logging.CRITICAL)
+
+    # plugin data, prefs and caches go to a scratch home
+    home = tempfile.mkdtemp()
+    os.environ["HOME"] = home
+    if tracemalloc is not None:
+        tracemalloc.start()
+    ecore.time_scale = options.scale
+
+    config = StandinConfig(latency=options.latency,
+                           error_rate=options.error_rate,
+                           stream_size=options.stream_size,
+                           seed=options.seed)
+    server = StandinServer(config)
+    server.start()
+
+    prefs = PluginPrefs("jamendo")
+    prefs["username"] = "soak"
+    prefs["password"] = "secret"
+    prefs.save()
+
+    try:
+        session = Session(options, server, random.Random(options.seed))
+        start = ecore.time_get()
+        sampler = Sampler(server, start, options.hours * options.warmup)
+        sampler.sample()
+        ecore.timer_add(options.sample_interval, sampler.sample)
+        session.start()
+
+        end = start + options.hours * 3600
+        while ecore.time_get() < end:
+            ecore.main_loop_iterate()
+        session.stop()
+        sampler.sample()
+
+        growth, failures = check(sampler.samples, options)
+        config_dict = config.as_dict()
+        config_dict.update(hours=options.hours, scale=options.scale)
+        results = {"samples": sampler.samples,
+                   "growth": growth,
+                   "type_growth": sampler.type_growth(),
+                   "actions": session.actions,
+                   "notifies": session.shell.notifies,
+                   "requests": dict(server.requests),
+                   "failures": failures}
+        benchlib.write_results("soak", config_dict, results, options.output)
+    finally:
+        server.stop()
+        shutil.rmtree(home, True)
+
+    for failure in failures:
+        print >> sys.stderr, "FAIL: %s" % failure
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,395 @@
+# Canola2 Jamendo Plugin
+# Authors: Vincent Lark <vincent.lark@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Additional permission under GNU GPL version 3 section 7
+#
+# If you modify this Program, or any covered work, by linking or combining it
+# with Canola2 and its core components (or a modified version of any of those),
+# containing parts covered by the terms of Instituto Nokia de Tecnologia End
+# User Software Agreement, the licensors of this Program grant you additional
+# permission to convey the resulting work.
+
+"""Local stand-in for the audioscrobbler/Jamendo web services.
+
+Emulates the radio handshake, adjust and xspf endpoints, the user
+feeds, the submission protocol (handshake, now playing, submit), the
+XML-RPC service, covers and streams, with configurable latency,
+bandwidth, error and disconnect injection and payload sizes. Streams
+honour byte range requests. Used by the benchmarks so they run
+without network.
+"""
+
+import re
+import md5
+import gzip
+import time
+import zlib
+import random
+import xmlrpclib
+import threading
+from cStringIO import StringIO
+from urlparse import urlparse
+from cgi import parse_qs
+from SocketServer import ThreadingMixIn
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+
+
+class StandinConfig(object):
+    """Behaviour of the stand-in server.
+
+    @parm latency: seconds to wait before answering each request.
+    @parm bandwidth: bytes per second sent to clients (0 is unlimited).
+    @parm error_rate: probability of answering with a 503 error.
+    @parm slow_rate: probability of adding slow_latency to a request.
+    @parm slow_latency: extra seconds of slow requests.
+    @parm tracks: number of tracks in each xspf playlist.
+    @parm friends: number of users in friends/neighbours feeds.
+    @parm cover_size: size in bytes of each cover image.
+    @parm stream_size: size in bytes of each track stream.
+    @parm bad_stations: station urls that fail to tune.
+    @parm compression: "gzip" or "deflate" to compress text responses
+                       of clients accepting it, None for identity.
+    @parm ranges: whether streams honour Range requests.
+    @parm disconnect_after: close stream connections after sending this
+                            many bytes (0 never does).
+    @parm disconnects: number of stream responses cut by disconnect_after
+                       (None cuts all of them).
+    """
+
+    def __init__(self, latency=0.0, bandwidth=0, error_rate=0.0,
+                 slow_rate=0.0, slow_latency=1.0,
+                 tracks=5, friends=20, cover_size=20000,
+                 stream_size=500000, bad_stations=(), compression=None,
+                 ranges=True, disconnect_after=0, disconnects=None,
+                 seed=None):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.tracks = tracks
+        self.friends = friends
+        self.cover_size = cover_size
+        self.stream_size = stream_size
+        self.bad_stations = list(bad_stations)
+        self.compression = compression
+        self.ranges = ranges
+        self.disconnect_after = disconnect_after
+        self.disconnects = disconnects
+        self.seed = seed
+
+    def as_dict(self):
+        return dict(self.__dict__)
+
+
+def make_xspf(base_url, station, ntracks, first_id=0):
+    lst = ['<?xml version="1.0" encoding="UTF-8"?>',
+           '<playlist version="1">',
+           '<title>%s</title>' % station,
+           '<creator>Stand-in</creator>',
+           '<link rel="http://www.last.fm/expiry">3600</link>',
+           '<trackList>']
+    for i in xrange(first_id, first_id + ntracks):
+        lst.append('<track>'
+                   '<location>%s/stream/%d.mp3</location>'
+                   '<title>Track %d</title>'
+                   '<id>%d</id>'
+                   '<album>Album %d</album>'
+                   '<creator>Artist %d</creator>'
+                   '<duration>%d</duration>'
+                   '<image>%s/cover/%d.jpg</image>'
+                   '</track>' % (base_url, i, i, i, i / 10, i / 20,
+                                 180000 + i, base_url, i))
+    lst.append('</trackList></playlist>')
+    return "\n".join(lst)
+
+
+def compress(body, encoding):
+    if encoding == "deflate":
+        return zlib.compress(body)
+    data = StringIO()
+    fd = gzip.GzipFile(fileobj=data, mode="wb")
+    fd.write(body)
+    fd.close()
+    return data.getvalue()
+
+
+def make_userfeed(base_url, kind, username, nusers):
+    lst = ['<?xml version="1.0" encoding="UTF-8"?>',
+           '<%s user="%s">' % (kind, username)]
+    for i in xrange(nusers):
+        lst.append('<user username="user%d">'
+                   '<url>http://www.last.fm/user/user%d</url>'
+                   '<image>%s/cover/user%d.jpg</image>'
+                   '</user>' % (i, i, base_url, i))
+    lst.append('</%s>' % kind)
+    return "\n".join(lst)
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, body, content_type="text/plain", status=200,
+              headers=None):
+        headers = dict(headers or {})
+        encoding = self.server.config.compression
+        if encoding and content_type.startswith("text/") and \
+                encoding in self.headers.get("Accept-Encoding", ""):
+            body = compress(body, encoding)
+            headers["Content-Encoding"] = encoding
+
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers.iteritems():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self._write(body)
+
+    def _write(self, body):
+        bandwidth = self.server.config.bandwidth
+        if not bandwidth:
+            self.wfile.write(body)
+            return
+
+        # pace each chunk to its send time, so that the last write
+        # ends the response instead of a sleep
+        chunk = max(1, bandwidth / 50)
+        start = time.time()
+        for i in xrange(0, len(body), chunk):
+            time.sleep(max(0, start + float(i) / bandwidth - time.time()))
+            self.wfile.write(body[i:i + chunk])
+
+    def _params(self, path):
+        params = parse_qs(urlparse(path)[4])
+        return dict((k, v[0]) for k, v in params.iteritems())
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return self.rfile.read(length)
+
+    def _route(self, body=None):
+        config = self.server.config
+        path = urlparse(self.path)[2]
+        self.server.count(path)
+
+        if config.latency:
+            time.sleep(config.latency)
+        if config.slow_rate and \
+                self.server.random.random() < config.slow_rate:
+            time.sleep(config.slow_latency)
+
+        if config.error_rate and \
+                self.server.random.random() < config.error_rate:
+            self._send("Service Unavailable", status=503)
+            return
+
+        params = self._params(self.path)
+        base_url = self.server.base_url
+
+        if path == "/radio/handshake.php":
+            self._send("session=standin-session\n"
+                       "stream_url=%s/stream\n"
+                       "base_url=localhost\n"
+                       "base_path=/radio\n" % base_url)
+        elif path == "/radio/adjust.php":
+            url = params.get("url", "")
+            if url in config.bad_stations:
+                self._send("response=FAILED\n")
+            else:
+                self._send("response=OK\nurl=%s\nstationname=%s\n"
+                           "discovery=0\n" % (url, url))
+        elif path == "/radio/xspf.php":
+            first = self.server.next_track_id(config.tracks)
+            self._send(make_xspf(base_url, "standin", config.tracks, first),
+                       "text/xml")
+        elif path.startswith("/1.0/user/"):
+            parts = path.split("/")
+            kind = parts[-1].split(".")[0]
+            self._send(make_userfeed(base_url, kind, parts[3],
+                                     config.friends), "text/xml")
+        elif path == "/1.0/rw/xmlrpc.php":
+            self._xmlrpc(body)
+        elif path == "/":
+            self._send("OK\nstandin-post-session\n%s/np\n%s/submit\n" % \
+                           (base_url, base_url))
+        elif path in ("/np", "/submit"):
+            self._send("OK\n")
+        elif path.startswith("/cover/"):
+            self._send("\xff" * config.cover_size, "image/jpeg")
+        elif path.startswith("/stream/"):
+            self._send_stream(config)
+        else:
+            self._send("Not Found", status=404)
+
+    def _send_stream(self, config):
+        body = self.server.stream_data(config.stream_size)
+        size = len(body)
+        start, end = 0, size - 1
+        status = 200
+        headers = {"ETag": '"standin-%d"' % size}
+        if config.ranges:
+            headers["Accept-Ranges"] = "bytes"
+            match = re.match(r"bytes=(\d+)-(\d*)$",
+                             self.headers.get("Range", ""))
+            if match:
+                start = int(match.group(1))
+                if match.group(2):
+                    end = min(end, int(match.group(2)))
+                if start > end:
+                    self._send("", status=416,
+                               headers={"Content-Range": "bytes */%d" % size})
+                    return
+                status = 206
+                headers["Content-Range"] = "bytes %d-%d/%d" % (start, end,
+                                                               size)
+        body = body[start:end + 1]
+
+        self.send_response(status)
+        self.send_header("Content-Type", "audio/mpeg")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers.iteritems():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command == "HEAD":
+            return
+
+        if config.disconnect_after and self.server.take_disconnect():
+            self._write(body[:config.disconnect_after])
+            self.close_connection = 1
+        else:
+            self._write(body)
+
+    def _xmlrpc(self, body):
+        params, method = xmlrpclib.loads(body)
+        if method == "system.multicall":
+            result = (["OK"] for call in params[0])
+            ret = xmlrpclib.dumps((list(result),), methodresponse=True)
+        else:
+            ret = xmlrpclib.dumps(("OK",), methodresponse=True)
+        self._send(ret, "text/xml")
+
+    def do_GET(self):
+        self._route()
+
+    def do_HEAD(self):
+        self._route()
+
+    def do_POST(self):
+        self._route(self._read_body())
+
+
+class StandinServer(ThreadingMixIn, HTTPServer):
+    """Threaded stand-in server listening on localhost.
+
+    Usage::
+
+        server = StandinServer(StandinConfig(latency=0.05))
+        server.start()
+        server.configure_client(client)
+        ...
+        server.stop()
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, config=None, port=0):
+        HTTPServer.__init__(self, ("127.0.0.1", port), StandinHandler)
+        self.config = config or StandinConfig()
+        self.random = random.Random(self.config.seed)
+        self.requests = {}
+        self._lock = threading.Lock()
+        self._track_id = 0
+        self._streams = {}
+        self._disconnects = self.config.disconnects
+        self._thread = None
+
+    def _get_base_url(self):
+        return "http://127.0.0.1:%d" % self.server_address[1]
+
+    base_url = property(_get_base_url)
+
+    def count(self, path):
+        self._lock.acquire()
+        try:
+            self.requests[path] = self.requests.get(path, 0) + 1
+        finally:
+            self._lock.release()
+
+    def next_track_id(self, count):
+        self._lock.acquire()
+        try:
+            first = self._track_id
+            self._track_id += count
+            return first
+        finally:
+            self._lock.release()
+
+    def stream_data(self, size):
+        """Return size bytes of stream data, the same ones for a given
+        size so that downloads can be checked."""
+        data = self._streams.get(size)
+        if data is None:
+            blocks = [md5.new(str(i)).digest() for i in xrange(size / 16 + 1)]
+            data = self._streams[size] = "".join(blocks)[:size]
+        return data
+
+    def take_disconnect(self):
+        """Return whether the next stream response must be cut."""
+        self._lock.acquire()
+        try:
+            if self._disconnects is None:
+                return True
+            if self._disconnects > 0:
+                self._disconnects -= 1
+                return True
+            return False
+        finally:
+            self._lock.release()
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def configure_client(self, client):
+        """Point a client.Client to this server."""
+        base_url = self.base_url
+        client.url_post_handshake = base_url + "/"
+        client.url_radio_handshake = base_url + "/radio/handshake.php"
+        client.url_userfeed = base_url + "/1.0/user"
+        client.url_xmlrpc = base_url + "/1.0/rw/xmlrpc.php"
+        client.url_radio_xspf = base_url + "/radio/xspf.php"
+        client.url_radio_adjust = base_url + "/radio/adjust.php"
+        client.proxy = xmlrpclib.ServerProxy(client.url_xmlrpc,
+                                             client.transport)
+
+
+if __name__ == "__main__":
+    server = StandinServer(port=8080)
+    print "stand-in server listening on %s" % server.base_url
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,439 @@
+# Canola2 Jamendo Plugin
+# Authors: Vincent Lark <vincent.lark@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Additional permission under GNU GPL version 3 section 7
+#
+# If you modify this Program, or any covered work, by linking or combining it
+# with Canola2 and its core components (or a modified version of any of those),
+# containing parts covered by the terms of Instituto Nokia de Tecnologia End
+# User Software Agreement, the licensors of this Program grant you additional
+# permission to convey the resulting work.
+
+"""Stand-ins for the Canola classes the plugin gets from
+Manager.get_class(), without any user interface.
+
+The audio player controller plays through HeadlessPlayer: it reads the
+whole stream, then "plays" it for the track duration in (scaled) main
+loop time and reports end of stream, or ERROR_PLAYING if the stream
+could not be read. Player hooks are told about media changes, state
+changes and durations as Canola does.
+"""
+
+import urllib2
+import threading
+
+import ecore
+from terra.core.manager import Manager
+from terra.core.model import Model, ModelFolder
+
+from stub import Stub
+
+DEFAULT_DURATION = 180
+
+
+class PluginDefaultIcon(object):
+    terra_type = "Icon/Plugin"
+
+
+class CanolaError(Model):
+    terra_type = "Model/Notify/Error"
+
+    def __init__(self, message):
+        Model.__init__(self, message)
+        self.message = message
+
+
+class YesNoDialogModel(Model):
+    terra_type = "Model/YesNoDialog"
+
+    def __init__(self, message, callback):
+        Model.__init__(self, message)
+        self.message = message
+        self.callback = callback
+
+
+class EntryDialogModel(Model):
+    terra_type = "Model/EntryDialog"
+
+    def __init__(self, title, label, value, callback):
+        Model.__init__(self, title)
+        self.label = label
+        self.value = value
+        self.callback = callback
+
+
+class OptionsModelFolder(ModelFolder):
+    terra_type = "Model/Options/Folder"
+    title = "Options"
+
+    def __init__(self, parent, screen_controller=None):
+        ModelFolder.__init__(self, self.title, parent)
+        self.screen_controller = screen_controller
+
+
+class ActionModelFolder(Model):
+    terra_type = "Model/Options/Action"
+    name = ""
+
+    def __init__(self, parent):
+        Model.__init__(self, self.name, parent)
+
+    def execute(self):
+        return True
+
+
+class MixedListItem(Model):
+    title = ""
+
+    def __init__(self, parent=None):
+        Model.__init__(self, self.title, parent)
+        self.callback_use = None
+        self.callback_update = None
+        self.callback_killall = None
+
+
+class MixedListItemDual(MixedListItem):
+    terra_type = "Model/Settings/Folder/MixedList/Item/Dual"
+
+
+class MixedListItemOnOff(MixedListItem):
+    terra_type = "Model/Settings/Folder/MixedList/Item/OnOff"
+
+
+class BaseAudioLocalModel(Model):
+    """Audio model, not added to the children of its parent: the
+    plugin creates models before appending them in batches."""
+    terra_type = "Model/Media/Audio/Local"
+
+    uri = None
+    title = None
+    album = None
+    artist = None
+    trackno = None
+    thumb = None
+
+    def __init__(self, parent):
+        Model.__init__(self, "")
+        self.parent = parent
+
+
+class PlayerHook(object):
+    terra_type = "Hook/Player"
+
+    def __init__(self):
+        pass
+
+    def media_changed(self, model):
+        pass
+
+    def playing(self):
+        pass
+
+    def paused(self):
+        pass
+
+    def duration_updated(self, duration):
+        pass
+
+
+class Controller(object):
+    def __init__(self, model, canvas, parent):
+        self.model = model
+        self.canvas = canvas
+        self.parent = parent
+        self.view = Stub()
+
+    def back(self):
+        self.parent.back()
+
+    def delete(self):
+        self.view = None
+
+
+class BaseListController(Controller):
+    terra_type = "Controller/Folder"
+
+    def __init__(self, model, canvas, parent):
+        Controller.__init__(self, model, canvas, parent)
+        self.model.load()
+
+    def cb_on_clicked(self, view, index):
+        self.model.current = index
+        self.parent.use(self.model.children[index])
+
+    def delete(self):
+        self.model.unload()
+        Controller.delete(self)
+
+
+class OptionsControllerMixin(object):
+    def __init__(self):
+        pass
+
+    def options_model_get(self):
+        return None
+
+    def delete(self):
+        pass
+
+
+class ModalController(Controller):
+    terra_type = "Controller/Modal"
+
+
+class MixedListController(BaseListController):
+    terra_type = "Controller/Settings/Folder/MixedList"
+
+
+class UsernamePasswordModal(Stub):
+    terra_type = "Widget/Settings/UsernamePasswordModal"
+
+    def __init__(self, parent, title, theme=None, vborder=0):
+        self.username = ""
+        self.password = ""
+
+
+class HeadlessPlayer(object):
+    """Plays uris for the audio player controller."""
+
+    def __init__(self, controller):
+        self.controller = controller
+        self.uri = None
+        self.duration = None
+        self.bytes_read = 0
+        self._generation = 0
+        self._timer = None
+        self._remaining = None
+
+    def _stop_timer(self):
+        if self._timer is not None:
+            self._timer.delete()
+            self._timer = None
+
+    def load(self, uri, duration):
+        self.stop()
+        self.uri = uri
+        self.duration = duration
+        self._remaining = None
+
+    def play(self):
+        if self.uri is None:
+            return
+        if self._remaining is not None:
+            self._start_timer(self._remaining)
+            return
+
+        self._generation += 1
+        generation = self._generation
+        uri = self.uri
+
+        def read():
+            try:
+                if "://" in uri:
+                    fd = urllib2.urlopen(uri)
+                else:
+                    fd = open(uri, "rb")
+                try:
+                    size = 0
+                    while True:
+                        data = fd.read(16384)
+                        if not data:
+                            break
+                        size += len(data)
+                finally:
+                    fd.close()
+            except Exception, e:
+                ecore.post(self._read_finished, generation, e, 0)
+                return
+            ecore.post(self._read_finished, generation, None, size)
+
+        thread = threading.Thread(target=read)
+        thread.setDaemon(True)
+        thread.start()
+
+    def _read_finished(self, generation, exception, size):
+        if generation != self._generation:
+            return
+        if exception is not None or not size:
+            self.controller._player_error(self.controller.ERROR_PLAYING)
+            return
+        self.bytes_read += size
+        self.controller._player_duration(self.duration)
+        self._start_timer(self.duration)
+
+    def _start_timer(self, duration):
+        self._stop_timer()
+        self._started = ecore.time_get()
+        self._remaining = duration
+        generation = self._generation
+
+        def eos():
+            self._timer = None
+            if generation == self._generation:
+                self._remaining = None
+                self.controller._player_eos()
+            return False
+
+        self._timer = ecore.timer_add(duration, eos)
+
+    def pause(self):
+        if self._timer is None:
+            return
+        self._stop_timer()
+        played = ecore.time_get() - self._started
+        self._remaining = max(0, self._remaining - played)
+
+    def stop(self):
+        self._generation += 1
+        self._stop_timer()
+        self._remaining = None
+
+
+class BaseAudioPlayerController(Controller):
+    terra_type = "Controller/Media/Audio"
+    hook_type = "Hook/Player/Audio"
+
+    (STATE_NONE, STATE_PLAYING, STATE_PAUSED, STATE_ERROR) = range(4)
+    (ERROR_PLAYING, ERROR_FILE_NOT_FOUND, ERROR_PLAYER_GENERIC,
+     ERROR_UNKNOWN) = range(4)
+
+    def __init__(self, model, canvas, parent):
+        Controller.__init__(self, model, canvas, parent)
+        self.audio_screen = Stub()
+        self.pl_iface = Stub()
+        self.state = self.STATE_NONE
+        self.volume = 50
+        self.current = 0
+        self.player = HeadlessPlayer(self)
+        self.setup_interface()
+
+    def _hooks(self, name, *args):
+        for hook in Manager().get_hooks(self.hook_type):
+            getattr(hook, name)(*args)
+
+    def setup_interface(self):
+        pass
+
+    def theme_changed(self):
+        pass
+
+    def transition_in_finished_cb(self, obj, emission, source):
+        pass
+
+    def cb_repeat(self):
+        pass
+
+    def cb_shuffle(self):
+        pass
+
+    def disable_trackbar(self):
+        pass
+
+    def update_trackbar(self):
+        pass
+
+    def previous_state(self, enabled=True):
+        pass
+
+    def next_state(self, enabled=True):
+        pass
+
+    def block_controls(self):
+        pass
+
+    def set_volume(self, volume):
+        self.volume = volume
+
+    def setup_view(self):
+        pass
+
+    def update_model(self, model):
+        pass
+
+    def setup_model(self, view=True):
+        self.set_uri(self.model.uri)
+        self.play()
+
+    def set_uri(self, uri, ignored=True):
+        duration = getattr(self.model, "durationfm", None)
+        duration = duration and duration / 1000 or DEFAULT_DURATION
+        self.player.load(uri, duration)
+        self._hooks("media_changed", self.model)
+
+    def _player_state_changed(self, state):
+        self.state = state
+        if state == self.STATE_PLAYING:
+            self._hooks("playing")
+
+    def play(self):
+        self.player.play()
+        self._player_state_changed(self.STATE_PLAYING)
+
+    def pause(self):
+        if self.state != self.STATE_PLAYING:
+            return
+        self.state = self.STATE_PAUSED
+        self.player.pause()
+        self._hooks("paused")
+
+    def resume(self):
+        if self.state == self.STATE_PAUSED:
+            self.play()
+
+    def stop(self):
+        self.state = self.STATE_NONE
+        self.player.stop()
+
+    def next(self):
+        parent = self.model.parent
+        if parent.current + 1 >= len(parent.children):
+            return
+        parent.current += 1
+        self.current = parent.current
+        self.model = parent.children[parent.current]
+        self._change_model()
+        self.update_model(self.model)
+
+    def prev(self):
+        pass
+
+    def _change_model(self):
+        self.setup_model(view=False)
+
+    def _player_duration(self, duration):
+        self._hooks("duration_updated", duration)
+
+    def _player_eos(self, *ignored):
+        self.next()
+
+    def _player_error(self, error_code):
+        self.state = self.STATE_ERROR
+
+    def _error_handler(self, error):
+        self.state = self.STATE_ERROR
+
+    def delete(self):
+        self.stop()
+        Controller.delete(self)
+
+
+CLASSES = dict((cls.terra_type, cls) for cls in (
+        PluginDefaultIcon, CanolaError, YesNoDialogModel, EntryDialogModel,
+        OptionsModelFolder, ActionModelFolder, MixedListItemDual,
+        MixedListItemOnOff, BaseAudioLocalModel, PlayerHook,
+        BaseListController, ModalController, MixedListController,
+        UsernamePasswordModal, BaseAudioPlayerController))
+CLASSES["OptionsControllerMixin"] = OptionsControllerMixin
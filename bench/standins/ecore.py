@@ -0,0 +1,191 @@
+# Canola2 Jamendo Plugin
+# Authors: Vincent Lark <vincent.lark@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Additional permission under GNU GPL version 3 section 7
+#
+# If you modify this Program, or any covered work, by linking or combining it
+# with Canola2 and its core components (or a modified version of any of those),
+# containing parts covered by the terms of Instituto Nokia de Tecnologia End
+# User Software Agreement, the licensors of this Program grant you additional
+# permission to convey the resulting work.
+
+"""Headless stand-in for the ecore main loop.
+
+Provides what the plugin uses -- timers, idlers and time_get() -- plus
+post() for callbacks handed over by other threads, as terra does for
+ThreadedFunction. Timers and time_get() run time_scale times faster
+than the wall clock, so that hours of listening are simulated in
+minutes.
+
+How late timers and posted callbacks run, in wall seconds, is kept
+until take_latencies() is called.
+"""
+
+import time
+import heapq
+import threading
+
+time_scale = 1.0
+
+_lock = threading.Lock()
+_wakeup = threading.Condition(_lock)
+_timers = []
+_idlers = []
+_posted = []
+_latencies = []
+_seq = [0]
+_origin = time.time()
+_running = [False]
+
+
+class Timer(object):
+    def __init__(self, interval, func, args, kargs):
+        self.interval = interval
+        self.func = func
+        self.args = args
+        self.kargs = kargs
+        self.deleted = False
+        self._schedule()
+
+    def _schedule(self):
+        due = time.time() + float(self.interval) / time_scale
+        _lock.acquire()
+        try:
+            _seq[0] += 1
+            heapq.heappush(_timers, (due, _seq[0], self))
+            _wakeup.notify()
+        finally:
+            _lock.release()
+
+    def _run(self):
+        if self.deleted:
+            return
+        if self.func(*self.args, **self.kargs):
+            self._schedule()
+        else:
+            self.deleted = True
+
+    def delete(self):
+        self.deleted = True
+
+    stop = delete
+
+
+class Idler(object):
+    def __init__(self, func, args, kargs):
+        self.func = func
+        self.args = args
+        self.kargs = kargs
+        self.deleted = False
+        _lock.acquire()
+        try:
+            _idlers.append(self)
+            _wakeup.notify()
+        finally:
+            _lock.release()
+
+    def _run(self):
+        if not self.deleted and not self.func(*self.args, **self.kargs):
+            self.deleted = True
+
+    def delete(self):
+        self.deleted = True
+
+
+def timer_add(interval, func, *args, **kargs):
+    return Timer(interval, func, args, kargs)
+
+
+def idler_add(func, *args, **kargs):
+    return Idler(func, args, kargs)
+
+
+def time_get():
+    return (time.time() - _origin) * time_scale
+
+
+def post(func, *args):
+    """Run func(*args) in the main loop, may be called from any thread."""
+    _lock.acquire()
+    try:
+        _posted.append((time.time(), func, args))
+        _wakeup.notify()
+    finally:
+        _lock.release()
+
+
+def take_latencies():
+    """Return and forget the delays of callbacks run so far."""
+    _lock.acquire()
+    try:
+        lst = _latencies[:]
+        del _latencies[:]
+        return lst
+    finally:
+        _lock.release()
+
+
+def main_loop_iterate(timeout=0.1):
+    """Run posted callbacks, due timers and one pass of the idlers.
+    Wait up to timeout seconds if there is nothing to do."""
+    _lock.acquire()
+    try:
+        now = time.time()
+        if not _posted and not _idlers and \
+                (not _timers or _timers[0][0] > now):
+            wait = timeout
+            if _timers:
+                wait = min(wait, _timers[0][0] - now)
+            _wakeup.wait(max(0, wait))
+            now = time.time()
+
+        posted = _posted[:]
+        del _posted[:]
+        due = []
+        while _timers and _timers[0][0] <= now:
+            due.append(heapq.heappop(_timers))
+        _idlers[:] = [i for i in _idlers if not i.deleted]
+        idlers = _idlers[:]
+    finally:
+        _lock.release()
+
+    delays = []
+    for posted_at, func, args in posted:
+        delays.append(time.time() - posted_at)
+        func(*args)
+    for due_at, seq, timer in due:
+        if not timer.deleted:
+            delays.append(time.time() - due_at)
+        timer._run()
+    for idler in idlers:
+        idler._run()
+
+    if delays:
+        _lock.acquire()
+        try:
+            _latencies.extend(delays)
+        finally:
+            _lock.release()
+
+
+def main_loop_begin():
+    _running[0] = True
+    while _running[0]:
+        main_loop_iterate()
+
+
+def main_loop_quit():
+    _running[0] = False
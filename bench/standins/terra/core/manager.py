@@ -0,0 +1,86 @@
+# Canola2 Jamendo Plugin
+# Authors: Vincent Lark <vincent.lark@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Additional permission under GNU GPL version 3 section 7
+#
+# If you modify this Program, or any covered work, by linking or combining it
+# with Canola2 and its core components (or a modified version of any of those),
+# containing parts covered by the terms of Instituto Nokia de Tecnologia End
+# User Software Agreement, the licensors of this Program grant you additional
+# permission to convey the resulting work.
+
+"""Stand-in for terra.core.manager.
+
+Canola classes are looked up in the stand-ins of the canola module.
+Plugin classes taking part in the simulation (the scrobbler hook) are
+added with add_hook().
+"""
+
+import sqlite3
+import threading
+
+from terra.core.singleton import Singleton
+
+
+class StatusNotifier(object):
+    def __init__(self, name, status=1.0):
+        self.name = name
+        self.status = status
+
+
+class Database(object):
+    """canola_db: statements from any thread, rows are returned."""
+
+    def __init__(self, path=":memory:"):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+
+    def execute(self, stmt, args=()):
+        self._lock.acquire()
+        try:
+            cursor = self._conn.execute(stmt, args)
+            rows = cursor.fetchall()
+            self._conn.commit()
+            return rows
+        finally:
+            self._lock.release()
+
+
+class Manager(Singleton):
+    def __init__(self):
+        Singleton.__init__(self)
+        self.canola_db = Database()
+        self.hooks = {}
+        self._notifiers = {}
+        self._classes = None
+
+    def get_class(self, name):
+        if self._classes is None:
+            import canola
+            self._classes = canola.CLASSES
+        return self._classes[name]
+
+    def get_status_notifier(self, name):
+        notifier = self._notifiers.get(name)
+        if notifier is None:
+            notifier = self._notifiers[name] = StatusNotifier(name)
+        return notifier
+
+    def add_hook(self, hook_type, hook):
+        self.hooks.setdefault(hook_type, []).append(hook)
+
+    def get_hooks(self, hook_type):
+        return self.hooks.get(hook_type, [])
@@ -0,0 +1,85 @@
+# Canola2 Jamendo Plugin
+# Authors: Vincent Lark <vincent.lark@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Additional permission under GNU GPL version 3 section 7
+#
+# If you modify this Program, or any covered work, by linking or combining it
+# with Canola2 and its core components (or a modified version of any of those),
+# containing parts covered by the terms of Instituto Nokia de Tecnologia End
+# User Software Agreement, the licensors of this Program grant you additional
+# permission to convey the resulting work.
+
+"""Stand-in for terra.core.model."""
+
+
+class ModelList(list):
+    """Children list, freeze() and thaw() only count."""
+
+    def __init__(self):
+        list.__init__(self)
+        self.frozen = 0
+
+    def freeze(self):
+        self.frozen += 1
+
+    def thaw(self):
+        self.frozen -= 1
+
+
+class Model(object):
+    terra_type = "Model"
+
+    def __init__(self, name, parent=None):
+        self.name = name
+        self.parent = parent
+        if parent is not None:
+            parent.children.append(self)
+
+
+class ModelFolder(Model):
+    terra_type = "Model/Folder"
+
+    def __init__(self, name, parent=None):
+        Model.__init__(self, name, parent)
+        self.children = ModelList()
+        self.current = None
+        self.is_loaded = False
+        self.is_loading = False
+        self.callback_loaded = None
+        self.callback_info = None
+
+    def load(self):
+        if self.is_loaded or self.is_loading:
+            return
+        self.is_loading = True
+        self.do_load()
+
+    def do_load(self):
+        pass
+
+    def inform_loaded(self):
+        self.is_loading = False
+        self.is_loaded = True
+        if self.callback_loaded is not None:
+            self.callback_loaded(self)
+
+    def unload(self):
+        self.is_loading = False
+        self.is_loaded = False
+        self.do_unload()
+
+    def do_unload(self):
+        del self.children[:]
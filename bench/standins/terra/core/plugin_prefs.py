@@ -0,0 +1,67 @@
+# Canola2 Jamendo Plugin
+# Authors: Vincent Lark <vincent.lark@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Additional permission under GNU GPL version 3 section 7
+#
+# If you modify this Program, or any covered work, by linking or combining it
+# with Canola2 and its core components (or a modified version of any of those),
+# containing parts covered by the terms of Instituto Nokia de Tecnologia End
+# User Software Agreement, the licensors of this Program grant you additional
+# permission to convey the resulting work.
+
+"""Stand-in for terra.core.plugin_prefs, kept in ~/.canola/prefs."""
+
+import os
+import cPickle
+import threading
+
+
+def get_prefs_path():
+    return os.path.join(os.path.expanduser("~"), ".canola", "prefs")
+
+
+class PluginPrefs(dict):
+    _lock = threading.Lock()
+
+    def __init__(self, name):
+        dict.__init__(self)
+        self.name = name
+        try:
+            fd = open(self._get_path(), "rb")
+        except IOError:
+            return
+        try:
+            self.update(cPickle.load(fd))
+        finally:
+            fd.close()
+
+    def _get_path(self):
+        return os.path.join(get_prefs_path(), self.name)
+
+    def save(self):
+        path = get_prefs_path()
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        self._lock.acquire()
+        try:
+            fd = open(self._get_path(), "wb")
+            try:
+                cPickle.dump(dict(self), fd, cPickle.HIGHEST_PROTOCOL)
+            finally:
+                fd.close()
+        finally:
+            self._lock.release()
@@ -0,0 +1,42 @@
+# Canola2 Jamendo Plugin
+# Authors: Vincent Lark <vincent.lark@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Additional permission under GNU GPL version 3 section 7
+#
+# If you modify this Program, or any covered work, by linking or combining it
+# with Canola2 and its core components (or a modified version of any of those),
+# containing parts covered by the terms of Instituto Nokia de Tecnologia End
+# User Software Agreement, the licensors of this Program grant you additional
+# permission to convey the resulting work.
+
+"""Stand-in for terra.core.singleton."""
+
+
+class SingletonMeta(type):
+    def __call__(cls, *args, **kargs):
+        instance = cls.__dict__.get("_singleton_instance")
+        if instance is None:
+            instance = type.__call__(cls, *args, **kargs)
+            cls._singleton_instance = instance
+        return instance
+
+
+class Singleton(object):
+    """Classes deriving from it are instantiated only once."""
+    __metaclass__ = SingletonMeta
+
+    def __init__(self):
+        pass
@@ -0,0 +1,54 @@
+# Canola2 Jamendo Plugin
+# Authors: Vincent Lark <vincent.lark@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Additional permission under GNU GPL version 3 section 7
+#
+# If you modify this Program, or any covered work, by linking or combining it
+# with Canola2 and its core components (or a modified version of any of those),
+# containing parts covered by the terms of Instituto Nokia de Tecnologia End
+# User Software Agreement, the licensors of this Program grant you additional
+# permission to convey the resulting work.
+
+"""Stand-in for terra.core.threaded_func."""
+
+import threading
+
+import ecore
+
+
+class ThreadedFunction(object):
+    """Call func(*args) in a thread, then callback(exception, retval)
+    in the main loop."""
+
+    def __init__(self, callback, func, *args, **kargs):
+        self.callback = callback
+        self.func = func
+        self.args = args
+        self.kargs = kargs
+
+    def _run(self):
+        exception = retval = None
+        try:
+            retval = self.func(*self.args, **self.kargs)
+        except Exception, e:
+            exception = e
+        if self.callback is not None:
+            ecore.post(self.callback, exception, retval)
+
+    def start(self):
+        thread = threading.Thread(target=self._run)
+        thread.setDaemon(True)
+        thread.start()
@@ -34,11 +34,11 @@ from terra.core.manager import Manager
 from terra.core.plugin_prefs import PluginPrefs
 from terra.core.threaded_func import ThreadedFunction
 
-from manager import LastfmManager
+from manager import JamendoManager
 
 
 mger = Manager()
-lastfm_manager = LastfmManager()
+jam_manager = JamendoManager()
 PlayerHook = mger.get_class("Hook/Player")
 network = mger.get_status_notifier("Network")
 
@@ -83,18 +83,18 @@ class AudioScrobbler(PlayerHook):
         if length is None:
             length = self._length
 
-        if not lastfm_manager.get_username() or \
-                not lastfm_manager.get_password():
+        if not jam_manager.get_username() or \
+                not jam_manager.get_password():
             log.warning("%s ignored (user or pass empty): %s - %s" % \
                             (dsc, name, album))
             return False
 
-        if not lastfm_manager.scrobble_enabled:
+        if not jam_manager.scrobble_enabled:
             log.warning("%s ignored (scrobble disabled): %s - %s" % \
                             (dsc, name, album))
             return False
 
-        if lastfm_manager.session_id and not lastfm_manager.post_session_id:
+        if jam_manager.session_id and not jam_manager.post_session_id:
             log.warning("%s ignored (no post sessiond id): %s - %s" % \
                             (dsc, name, album))
             return False
@@ -109,7 +109,7 @@ class AudioScrobbler(PlayerHook):
 
     def _now_playing(self):
         if self._validate_cmd() and (network and network.status > 0.0):
-            ThreadedFunction(None, lastfm_manager.now_playing,
+            ThreadedFunction(None, jam_manager.now_playing,
                              self._model.name, self._model.artist,
                              self._model.album, self._model.trackno,
                              self._length).start()
@@ -139,7 +139,7 @@ class AudioScrobbler(PlayerHook):
             if self._validate_cmd(submit=True, length=args[4],
                                   name=args[0], album=args[2]):
                 try:
-                    lastfm_manager.submit(*args)
+                    jam_manager.submit(*args)
                 except Exception, e:
                     log.error("error on submit %s" % e.message)
             self.prefs['submit_cache'] = self.prefs['submit_cache'][1:]
@@ -153,6 +153,8 @@ class AudioScrobbler(PlayerHook):
                 self._length, self.start_time)
 
         self.pending_submits.put(args)
+        jam_manager.similar.observe_scrobble(self._model.artist,
+                                             jam_manager.get_username())
 
         if (network and network.status > 0.0) and not self.sending_submits:
             def cb_finished(*ignored):
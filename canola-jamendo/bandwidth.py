@@ -0,0 +1,110 @@
+# Canola2 Jamendo Plugin
+# Authors: Vincent Lark <vincent.lark@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Additional permission under GNU GPL version 3 section 7
+#
+# If you modify this Program, or any covered work, by linking or combining it
+# with Canola2 and its core components (or a modified version of any of those),
+# containing parts covered by the terms of Instituto Nokia de Tecnologia End
+# User Software Agreement, the licensors of this Program grant you additional
+# permission to convey the resulting work.
+
+import threading
+
+THROUGHPUT_WINDOW = 20 # estimate from the last 20 transfers
+THROUGHPUT_MIN_BYTES = 4096 # smaller responses mostly measure latency
+BITRATE_SAFETY = 0.7 # use at most 70% of the estimate for streaming
+
+# (bytes per second, prefetch depth) from slowest to fastest link
+PREFETCH_LEVELS = [(16000, 0), (64000, 1), (256000, 2)]
+PREFETCH_MAX = 4
+
+
+class ThroughputEstimator(object):
+    """Link throughput estimate learnt from completed transfers.
+
+    Keeps a window of recent samples and returns their median weighted
+    by transferred bytes, so a big download counts more than a small
+    one and a single stalled request does not swing the estimate.
+    """
+
+    def __init__(self, window=THROUGHPUT_WINDOW,
+                 min_bytes=THROUGHPUT_MIN_BYTES):
+        self.window = window
+        self.min_bytes = min_bytes
+        self._samples = [] # (bytes, bytes per second)
+        self._lock = threading.Lock()
+
+    def add_sample(self, nbytes, elapsed):
+        if nbytes < self.min_bytes or elapsed <= 0:
+            return
+
+        self._lock.acquire()
+        try:
+            self._samples.append((nbytes, nbytes / elapsed))
+            if len(self._samples) > self.window:
+                del self._samples[0]
+        finally:
+            self._lock.release()
+
+    def estimate(self):
+        """Return the estimated throughput in bytes per second, or None
+        before any transfer was measured."""
+        self._lock.acquire()
+        try:
+            samples = sorted(self._samples, key=lambda s: s[1])
+        finally:
+            self._lock.release()
+
+        if not samples:
+            return None
+
+        half = sum([s[0] for s in samples]) / 2.0
+        weight = 0
+        for nbytes, rate in samples:
+            weight += nbytes
+            if weight >= half:
+                return rate
+
+    def prefetch_depth(self, default=1):
+        """Return how many items (tracks, covers, playlist segments)
+        to fetch ahead of their use: none on weak links, up to
+        PREFETCH_MAX on fast ones."""
+        rate = self.estimate()
+        if rate is None:
+            return default
+
+        for limit, depth in PREFETCH_LEVELS:
+            if rate < limit:
+                return depth
+        return PREFETCH_MAX
+
+    def select_bitrate(self, bitrates):
+        """Return the highest bitrate (bits per second) that the link
+        sustains without rebuffering, or the lowest one if none does."""
+        if not bitrates:
+            return None
+
+        bitrates = sorted(bitrates)
+        rate = self.estimate()
+        if rate is None:
+            return bitrates[0]
+
+        usable = rate * 8 * BITRATE_SAFETY
+        lst = [b for b in bitrates if b <= usable]
+        if lst:
+            return lst[-1]
+        return bitrates[0]
@@ -0,0 +1,81 @@
+# Canola2 Jamendo Plugin
+# Authors: Vincent Lark <vincent.lark@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Additional permission under GNU GPL version 3 section 7
+#
+# If you modify this Program, or any covered work, by linking or combining it
+# with Canola2 and its core components (or a modified version of any of those),
+# containing parts covered by the terms of Instituto Nokia de Tecnologia End
+# User Software Agreement, the licensors of this Program grant you additional
+# permission to convey the resulting work.
+
+import time
+
+BATCH_SIZE = 50 # append at most 50 items per main loop iteration
+BATCH_BUDGET = 0.008 # or stop after 8ms, half a 60Hz frame
+
+
+class BatchAppender(object):
+    """Append items to a model children list in bounded batches.
+
+    Each step() appends up to batch_size items, or as many as fit in
+    budget seconds, between freeze() and thaw() so views get a single
+    notification per batch. step() returns True while items remain, so
+    it can be used directly as an ecore idler::
+
+        appender = BatchAppender(model.children, items, end_callback)
+        ecore.idler_add(appender.step)
+    """
+
+    def __init__(self, children, items, end_callback=None,
+                 batch_size=BATCH_SIZE, budget=BATCH_BUDGET):
+        self.children = children
+        self.items = items
+        self.end_callback = end_callback
+        self.batch_size = batch_size
+        self.budget = budget
+        self.position = 0
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def finished(self):
+        return self.cancelled or self.position >= len(self.items)
+
+    def step(self):
+        if self.cancelled:
+            return False
+
+        deadline = time.time() + self.budget
+        end = min(len(self.items), self.position + self.batch_size)
+
+        self.children.freeze()
+        try:
+            while self.position < end:
+                self.children.append(self.items[self.position])
+                self.position += 1
+                if time.time() > deadline:
+                    break
+        finally:
+            self.children.thaw()
+
+        if self.position < len(self.items):
+            return True
+
+        if self.end_callback:
+            self.end_callback()
+        return False
@@ -25,14 +25,21 @@
 import os
 import time
 import logging
+import threading
 import xmlrpclib
 from md5 import md5
 from datetime import datetime
 from time import mktime, localtime
 from urllib import urlencode
-from urllib2 import urlopen, Request
+from urllib2 import build_opener, Request
 from terra.utils.encoding import to_utf8
 
+from stats import NetworkStats
+from compression import ACCEPT_ENCODING, decode_response
+from resolver import CachedHTTP, CachedHTTPConnection, CachedHTTPHandler
+from tracing import traced
+from hedge import HedgeBudget, HedgeCancelled, hedged_call
+
 try:
     from xml.etree import cElementTree as ElementTree
 except ImportError:
@@ -44,6 +51,8 @@ except ImportError:
 
 log = logging.getLogger("plugins.canola-jamendo.client")
 
+RATING_METHODS = {"love": "loveTrack", "ban": "banTrack"}
+
 
 class TuningError(Exception):
     pass
@@ -58,6 +67,94 @@ class JamendoException(Exception):
     pass
 
 
+class _Flight(object):
+    """A call in progress, shared by every caller asking for the same key."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.retval = None
+        self.exception = None
+
+
+class _CountingResponse(object):
+    """Response wrapper that counts the bytes read from it."""
+
+    def __init__(self, response):
+        self._response = response
+        self.bytes = 0
+
+    def read(self, *args):
+        data = self._response.read(*args)
+        self.bytes += len(data)
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+
+class StatsTransport(xmlrpclib.Transport):
+    """XML-RPC transport recording its requests in network stats."""
+    endpoint = "rpc"
+
+    def __init__(self, stats):
+        xmlrpclib.Transport.__init__(self)
+        self.stats = stats
+        self.recorder = None
+        self.replayer = None
+        self._bytes_in = 0
+
+    def request(self, host, handler, request_body, verbose=0):
+        measure = self.stats.measure(self.endpoint)
+        url = "http://%s%s" % (host, handler)
+        self._bytes_in = 0
+        try:
+            if self.replayer is not None:
+                data = self.replayer.replay("rpc", url, request_body)
+                self._bytes_in = len(data)
+                ret = xmlrpclib.loads(data)[0]
+            else:
+                ret = xmlrpclib.Transport.request(self, host, handler,
+                                                  request_body, verbose)
+        except Exception, e:
+            measure.failed(e, len(request_body))
+            if self.recorder is not None:
+                if isinstance(e, xmlrpclib.Fault):
+                    data = xmlrpclib.dumps(e, methodresponse=True)
+                    self.recorder.record("rpc", url, request_body, data,
+                                         time.time() - measure.start)
+                else:
+                    self.recorder.record("rpc", url, request_body, None,
+                                         time.time() - measure.start, str(e))
+            raise
+        measure.done(self._bytes_in, len(request_body))
+        if self.recorder is not None:
+            self.recorder.record("rpc", url, request_body,
+                                 xmlrpclib.dumps(ret, methodresponse=True),
+                                 time.time() - measure.start)
+        return ret
+
+    def make_connection(self, host):
+        """Same as xmlrpclib.Transport.make_connection, resolving
+        through the plugin resolver."""
+        chost, extra_headers, x509 = self.get_host_info(host)
+        if not hasattr(self, "_connection"):
+            return CachedHTTP(chost) # python < 2.7, one request each
+
+        # python 2.7 keeps the connection alive between requests
+        self._extra_headers = extra_headers
+        if self._connection and host == self._connection[0]:
+            return self._connection[1]
+        self._connection = host, CachedHTTPConnection(chost)
+        return self._connection[1]
+
+    def parse_response(self, response):
+        response = _CountingResponse(response)
+        try:
+            return xmlrpclib.Transport.parse_response(self, response)
+        finally:
+            self._bytes_in = response.bytes
+
+
 class Client(object):
     client_name = "tst"
     client_version = "0.1"
@@ -68,6 +165,18 @@ class Client(object):
     url_xmlrpc = "http://ws.audioscrobbler.com/1.0/rw/xmlrpc.php"
     url_radio_xspf = "http://ws.audioscrobbler.com/radio/xspf.php"
     url_radio_adjust = "http://ws.audioscrobbler.com/radio/adjust.php"
+    playlist_expiry = 3600 # used if the playlist has no expiry link
+    bad_station_ttl = 6 * 3600 # retry unavailable stations after 6 hours
+    handshake_retries = 3
+    handshake_backoff = 1.0 # seconds before the first retry, then doubled
+    post_session_ttl = 3600 # renew the submission session every hour
+    post_session_retry = 60 # or after a minute if renewing failed
+    hedge_percentile = 95 # hedge requests slower than 95% of their endpoint
+    hedge_min_delay = 0.05 # never hedge sooner than 50ms
+    hedge_min_samples = 20 # requests measured before hedging an endpoint
+    # endpoints whose GET may be sent twice: adjust and xspf are not,
+    # a second xspf request advances the station and skips a segment
+    hedge_safe_endpoints = ("cover",)
 
     def __init__(self, username=None, password=None):
         self._logged = False
@@ -83,37 +192,207 @@ class Client(object):
         self.user_url = None
         self.station_name = None
         self.discovery = 0
-        self.proxy = xmlrpclib.ServerProxy(self.url_xmlrpc)
+        self._bad_stations = {}
+        self._flights = {}
+        self._flights_lock = threading.Lock()
+        self._station_lock = threading.Lock()
+        self._post_timer = None
+        self._post_lock = threading.Lock()
+        self._post_generation = 0 # bumped by logout
+        self.stats = NetworkStats()
+        self.opener = build_opener(CachedHTTPHandler())
+        self.transport = StatsTransport(self.stats)
+        self.hedged_endpoints = set() # opt-in, e.g. set(["cover"])
+        self.mirrors = {} # host -> alternate hosts tried by hedges
+        self.hedge_budget = HedgeBudget()
+        self.multicall_supported = True # cleared if the server refuses it
+        self._mirror_index = 0
+        self.recorder = None
+        self.replayer = None
+        self.proxy = xmlrpclib.ServerProxy(self.url_xmlrpc, self.transport)
 
     def _get_logged(self):
         return self._logged
 
     logged = property(_get_logged)
 
-    def _request(self, _url, **params):
+    def _open(self, url, endpoint):
+        """Return url content in text and record it in network stats.
+
+        Responses are requested gzip or deflate encoded and decoded as
+        they are read; bytes in are counted as received. GET requests
+        to hedged_endpoints are hedged, see hedge.hedged_call. Only
+        idempotent endpoints (hedge_safe_endpoints) are ever hedged.
+
+        @parm url: url address or urllib2.Request.
+        @parm endpoint: name of the endpoint in network stats.
+        """
+        if not isinstance(url, Request):
+            url = Request(url)
+        url.add_header("Accept-Encoding", ACCEPT_ENCODING)
+
+        # recorded traffic must be the same on every run, do not hedge it
+        if endpoint in self.hedged_endpoints and \
+                endpoint in self.hedge_safe_endpoints and \
+                not url.has_data() and \
+                self.recorder is None and self.replayer is None:
+            delay = self._get_hedge_delay(endpoint)
+            if delay is not None:
+                self.hedge_budget.deposit()
+                hedge_url = self._get_mirror_request(url)
+                return hedged_call(
+                    lambda cancel: self._fetch(url, endpoint, cancel),
+                    lambda cancel: self._fetch(hedge_url, endpoint + ":hedge",
+                                               cancel),
+                    delay, self.hedge_budget)
+
+        return self._fetch(url, endpoint)
+
+    def _fetch(self, url, endpoint, cancel=None):
+        """Return the decoded content of a urllib2.Request. If cancel
+        (a threading.Event) gets set, stop reading and raise
+        HedgeCancelled without recording the request."""
+        bytes_out = len(url.get_data() or "")
+        measure = self.stats.measure(endpoint)
+        if self.replayer is not None:
+            try:
+                data = self.replayer.replay("http", url.get_full_url(),
+                                            url.get_data())
+            except Exception, e:
+                measure.failed(e, bytes_out)
+                raise
+            measure.done(len(data), bytes_out)
+            return data
+
+        try:
+            response = _CountingResponse(self.opener.open(url))
+            reader = decode_response(response)
+            if cancel is None:
+                data = reader.read()
+            else:
+                chunks = []
+                chunk = reader.read(16384)
+                while chunk:
+                    if cancel.isSet():
+                        response.close()
+                        raise HedgeCancelled()
+                    chunks.append(chunk)
+                    chunk = reader.read(16384)
+                data = "".join(chunks)
+        except HedgeCancelled:
+            raise
+        except Exception, e:
+            measure.failed(e, bytes_out)
+            if self.recorder is not None:
+                self.recorder.record("http", url.get_full_url(),
+                                     url.get_data(), None,
+                                     time.time() - measure.start, str(e))
+            raise
+        measure.done(response.bytes, bytes_out)
+        if self.recorder is not None:
+            self.recorder.record("http", url.get_full_url(), url.get_data(),
+                                 data, time.time() - measure.start)
+        return data
+
+    def set_recorder(self, recorder):
+        """Record the traffic in recorder (a recording.Recorder), or
+        stop recording if None."""
+        self.recorder = self.transport.recorder = recorder
+
+    def set_replayer(self, replayer):
+        """Answer requests from replayer (a recording.Replayer) instead
+        of the network, or use the network again if None."""
+        self.replayer = self.transport.replayer = replayer
+
+    def _get_hedge_delay(self, endpoint):
+        """Return how long to wait before hedging a request to
+        endpoint, None until enough requests were measured."""
+        ep = self.stats.get(endpoint)
+        if ep is None or ep.count < self.hedge_min_samples:
+            return None
+        return max(self.hedge_min_delay, ep.percentile(self.hedge_percentile))
+
+    def _get_mirror_request(self, req):
+        """Return a copy of req, sent to a mirror of its host if any."""
+        url = req.get_full_url()
+        mirrors = self.mirrors.get(req.get_host())
+        if mirrors:
+            self._mirror_index += 1
+            mirror = mirrors[self._mirror_index % len(mirrors)]
+            url = url.replace(req.get_host(), mirror, 1)
+        return Request(url, headers=dict(req.headers))
+
+    def fetch_file(self, url, path, endpoint="cover"):
+        """Download url into path, through the request layer (and so
+        hedged if endpoint is)."""
+        data = self._open(url, endpoint)
+        tmp = path + ".tmp"
+        fd = open(tmp, "wb")
+        try:
+            fd.write(data)
+        finally:
+            fd.close()
+        os.rename(tmp, path)
+        return path
+
+    def _request(self, _url, _endpoint="other", **params):
         """Return url content in text.
 
         @parm url: url address.
+        @parm _endpoint: name of the endpoint in network stats.
         @parm params: dict of url parameters.
         """
         if params:
             _url = _url + "?" + urlencode(params)
 
         log.debug("requesting url: %s" % str(_url))
-        return urlopen(_url).read()
+        return self._open(_url, _endpoint)
 
-    def _request_lines(self, _url, **params):
+    def _request_lines(self, _url, _endpoint="other", **params):
         """Return url content in text lines.
 
         @parm url: url address.
+        @parm _endpoint: name of the endpoint in network stats.
         @parm params: dict of url parameters.
         """
         if params:
             _url = _url + "?" + urlencode(params)
 
         log.debug("requesting url: %s" % str(_url))
-        lines = urlopen(_url).readlines()
-        return [c.strip() for c in lines]
+        return split_lines(self._open(_url, _endpoint))
+
+    def _single_flight(self, key, func, *args):
+        """Call func(*args) unless a call with the same key is already
+        running, in which case wait for it and share its result."""
+        self._flights_lock.acquire()
+        try:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        finally:
+            self._flights_lock.release()
+
+        if leader:
+            try:
+                try:
+                    flight.retval = func(*args)
+                except Exception, e:
+                    flight.exception = e
+            finally:
+                self._flights_lock.acquire()
+                try:
+                    del self._flights[key]
+                finally:
+                    self._flights_lock.release()
+                flight.done.set()
+        else:
+            log.debug("waiting for request in progress: %s" % str(key))
+            flight.done.wait()
+
+        if flight.exception is not None:
+            raise flight.exception
+        return flight.retval
 
     def check_login(func):
         """Used as decorator to validate login."""
@@ -137,17 +416,8 @@ class Client(object):
         @parm username: Jamendo username
         """
         url = "%s/%s/friends.xml" % (self.url_userfeed, username)
-        xml = self._request(url)
-
-        lst = []
-        tree = ElementTree.fromstring(xml)
-        for child in tree.getchildren():
-            friend = Friend(to_utf8(child.get("username")))
-            friend.url = child.find("url").text
-            friend.image = child.find("image").text
-            lst.append(friend)
-
-        return lst
+        xml = self._request(url, "userfeed")
+        return parse_userfeed(xml, Friend)
 
     def get_neighbours(self, username):
         """Retrieve neighbours of a last.fm user.
@@ -155,17 +425,8 @@ class Client(object):
         @parm username: last.fm username
         """
         url = "%s/%s/neighbours.xml" % (self.url_userfeed, username)
-        xml = self._request(url)
-
-        lst = []
-        tree = ElementTree.fromstring(xml)
-        for child in tree.getchildren():
-            neighbour = Neighbour(to_utf8(child.get("username")))
-            neighbour.url = child.find("url").text
-            neighbour.image = child.find("image").text
-            lst.append(neighbour)
-
-        return lst
+        xml = self._request(url, "userfeed")
+        return parse_userfeed(xml, Neighbour)
 
     def _execute_rpc_method(self, method, *args):
         """Execute xml rpc method from last.fm server.
@@ -198,6 +459,54 @@ class Client(object):
                                      artist_name, track_title)
         return (r == "OK")
 
+    def rate_tracks(self, ratings):
+        """Love or ban several tracks in one system.multicall request.
+        If the server refuses the multicall, ratings are sent one by
+        one, and so are the next ones.
+
+        @parm ratings: list of (action, artist name, track title) with
+                       action "love" or "ban".
+        @return: list of True for accepted ratings and False otherwise.
+        """
+        if self.multicall_supported:
+            try:
+                return self._rate_tracks_multicall(ratings)
+            except xmlrpclib.Fault, e:
+                log.warning("multicall refused (%s), rating tracks "
+                            "one by one" % e)
+                self.multicall_supported = False
+
+        ret = []
+        for action, artist_name, track_title in ratings:
+            method = getattr(self.proxy, RATING_METHODS[action])
+            try:
+                r = self._execute_rpc_method(method, artist_name,
+                                             track_title)
+            except xmlrpclib.Fault, e:
+                log.error("rating %s failed: %s" % \
+                              (str((action, artist_name, track_title)), e))
+                r = None
+            ret.append(r == "OK")
+        return ret
+
+    def _rate_tracks_multicall(self, ratings):
+        token, timestamp = self.get_token_timestamp()
+        multicall = xmlrpclib.MultiCall(self.proxy)
+        for action, artist_name, track_title in ratings:
+            method = getattr(multicall, RATING_METHODS[action])
+            method(self.username, str(timestamp), token,
+                   artist_name, track_title)
+
+        results = multicall()
+        ret = []
+        for i in xrange(len(ratings)):
+            try:
+                ret.append(results[i] == "OK")
+            except xmlrpclib.Fault, e:
+                log.error("rating %s failed: %s" % (str(ratings[i]), e))
+                ret.append(False)
+        return ret
+
     def _check_userpass(func):
         """Used as decorator to check username and password."""
         def new_def(*args, **kwds):
@@ -211,11 +520,43 @@ class Client(object):
 
         return new_def
 
+    def get_bad_station_reason(self, lastfm_url):
+        """Return the error of a recent failed tune of lastfm_url,
+        or None if the station is not known to be unavailable."""
+        entry = self._bad_stations.get(lastfm_url)
+        if entry is None:
+            return None
+        if entry[0] < time.time():
+            self._bad_stations.pop(lastfm_url, None)
+            return None
+        return entry[1]
+
+    def is_bad_station(self, lastfm_url):
+        return self.get_bad_station_reason(lastfm_url) is not None
+
+    def forget_bad_stations(self):
+        """Drop the unavailable stations cache. Availability depends
+        on the subscriber status, so this is done on login changes."""
+        self._bad_stations = {}
+
     def login(self):
         """Complete login to last.fm.
-        Do first and second handshake."""
+        Do first and second handshake. Concurrent calls, such as
+        requests waiting for the session in check_login, share a
+        single login."""
+        self._single_flight(("login",), self._login)
+
+    def _login(self):
+        self.forget_bad_stations()
+
+        # the submission session does not depend on the radio one,
+        # establish it in background instead of waiting for it
+        post = threading.Thread(target=self.refresh_post_session,
+                                args=(self._post_generation,))
+        post.setDaemon(True)
+        post.start()
         try:
-            self.handshake()
+            self._with_retries(self.handshake)
             self._logged = True
         except:
             self._logged = False
@@ -224,11 +565,81 @@ class Client(object):
     def logout(self):
         """Logout from last.fm."""
         self._logged = False
+        self._post_lock.acquire()
+        try:
+            # renewals in flight must not schedule another one
+            self._post_generation += 1
+            self.post_session_id = None
+            timer, self._post_timer = self._post_timer, None
+        finally:
+            self._post_lock.release()
+        if timer is not None:
+            timer.cancel()
+        self.forget_bad_stations()
+
+    def _with_retries(self, func):
+        """Call func, retrying network errors with a growing delay.
+        Refused credentials are not retried."""
+        delay = self.handshake_backoff
+        for attempt in xrange(self.handshake_retries):
+            try:
+                return func()
+            except (AuthenticationError, HandshakeError, ValueError):
+                raise
+            except Exception, e:
+                if attempt == self.handshake_retries - 1:
+                    raise
+                log.warning("%s failed (%s), retrying in %.1fs" % \
+                                (func.__name__, e, delay))
+                time.sleep(delay)
+                delay *= 2
+
+    def refresh_post_session(self, generation=None):
+        """Establish the submission session and schedule its renewal
+        before it goes stale. Network failures are logged and retried
+        later, scrobbles are cached meanwhile; refused credentials are
+        not retried before the next login.
+
+        @parm generation: login the renewal belongs to (defaults to the
+                          current one); nothing is scheduled if the
+                          user logged out since.
+        """
+        if generation is None:
+            generation = self._post_generation
+        try:
+            self._single_flight(("post_handshake",), self._with_retries,
+                                self.second_handshake)
+        except AuthenticationError, e:
+            log.error("submission session refused: %s" % e)
+            delay = None
+        except Exception, e:
+            log.error("unable to get a submission session: %s" % e)
+            delay = self.post_session_retry
+        else:
+            delay = self.post_session_ttl
+        self._schedule_post_refresh(delay, generation)
+
+    def _schedule_post_refresh(self, delay, generation):
+        self._post_lock.acquire()
+        try:
+            if generation != self._post_generation:
+                return
+            if self._post_timer is not None:
+                self._post_timer.cancel()
+                self._post_timer = None
+            if delay is not None:
+                self._post_timer = threading.Timer(delay,
+                                                   self.refresh_post_session,
+                                                   (generation,))
+                self._post_timer.setDaemon(True)
+                self._post_timer.start()
+        finally:
+            self._post_lock.release()
 
     @_check_userpass
     def handshake(self):
         """First last.fm handshake."""
-        ret = self._request_lines(self.url_radio_handshake,
+        ret = self._request_lines(self.url_radio_handshake, "handshake",
                                   platform="linux",
                                   version=self.client_version,
                                   username=self.username,
@@ -249,7 +660,7 @@ class Client(object):
         to get xspf tracks."""
         token, timestamp = self.get_token_timestamp()
 
-        ret = self._request_lines(self.url_post_handshake,
+        ret = self._request_lines(self.url_post_handshake, "handshake",
                                   hs="true", a=token, t=timestamp,
                                   u=self.username, p=self.protocol_version,
                                   c=self.client_name, v=self.client_version)
@@ -276,6 +687,7 @@ class Client(object):
             self._logged = False
             raise AuthenticationError("Bad session error")
 
+    @traced("client.tune")
     @check_login
     def tune(self, lastfm_url):
         """Tune the stream_url to play the specified last.fm url.
@@ -290,8 +702,16 @@ class Client(object):
             lastfm://user/$username/neighbours
             lastfm://user/$username/recommended/100
             lastfm://play/tracks/$trackid,$trackid,$trackid
+
+        Stations the server refused to tune are remembered for
+        bad_station_ttl seconds and fail without a request. Empty
+        answers and network errors are not remembered.
         """
-        lines = self._request_lines(self.url_radio_adjust,
+        reason = self.get_bad_station_reason(lastfm_url)
+        if reason is not None:
+            raise TuningError(reason)
+
+        lines = self._request_lines(self.url_radio_adjust, "adjust",
                                     url=lastfm_url, lang="en",
                                     debug=0, session=self.session_id)
 
@@ -302,46 +722,60 @@ class Client(object):
             self.user_url = params['url']
             self.station_name = params['stationname']
             self.discovery = params.get('discovery', 0)
-        elif response:
+        elif response == "FAILED" and params.get("error") != "8":
+            # the server refused the station (error 8 is maintenance)
+            self._bad_stations[lastfm_url] = \
+                (time.time() + self.bad_station_ttl, response)
             raise TuningError(response)
         else:
-            raise TuningError("Unknown error")
+            raise TuningError(response or "Unknown error")
 
     def tune_user(self, user, feature):
         """Tune stream_url to play last.fm user url."""
         self.tune("lastfm://user/%s/%s" % (user, feature))
 
     def make_dict(self, lines):
-        result = {}
-        for line in lines:
-            key, val = line.split("=", True)
-            result[key] = val.strip()
-        return result
+        return parse_dict(lines)
 
+    @traced("client.get_xspf_tracks")
     @check_login
     def get_xspf_tracks(self):
         """Retrieve xspf tracks from last.fm."""
-        xml = self._request(self.url_radio_xspf,
+        xml = self._request(self.url_radio_xspf, "xspf",
                             sk=self.session_id,
                             desktop=0.1, discovery=0)
+        return parse_xspf(xml, self.playlist_expiry)
 
-        lst = []
-        tree = ElementTree.fromstring(xml)
-        tracklist = tree.find("trackList")
-        for child in tracklist.findall("track"):
-            track = Track(to_utf8(child.find("title").text),
-                          child.find("id").text)
-
-            track.album = Album(to_utf8(child.find("album").text or ""))
-            track.artist = Artist(to_utf8(child.find("creator").text or ""))
-
-            track.url = child.find("location").text
-            track.duration = int(child.find("duration").text)
-            track.image = child.find("image").text
-
-            lst.append(track)
-
-        return lst
+    def _tune_and_fetch(self, lastfm_url):
+        self._station_lock.acquire()
+        try:
+            self.tune(lastfm_url)
+            return self.get_xspf_tracks()
+        finally:
+            self._station_lock.release()
+
+    def get_station_tracks(self, lastfm_url, background=False):
+        """Tune lastfm_url and return its xspf tracks.
+
+        The session plays one station at a time, so tune and fetch are
+        done atomically. Concurrent calls for the same station share a
+        single request. The time taken is recorded in network stats as
+        "time_to_playlist".
+
+        @parm background: the tracks are kept for later (prefetch,
+                          warmup). Such calls never share a request
+                          with foreground ones: both would get the
+                          same segment and it would be played twice.
+        """
+        measure = self.stats.measure("time_to_playlist")
+        try:
+            lst = self._single_flight(("station", lastfm_url, background),
+                                      self._tune_and_fetch, lastfm_url)
+        except Exception, e:
+            measure.failed(e)
+            raise
+        measure.done()
+        return list(lst)
 
     @check_login
     def now_playing(self, track, artist, album="", trackno="", length=""):
@@ -352,7 +786,6 @@ class Client(object):
             raise TypeError("Trackno must be int")
 
         query = {}
-        query['s'] = self.post_session_id
         query['t'] = track
         query['a'] = artist
         query['b'] = album
@@ -360,9 +793,7 @@ class Client(object):
         query['n'] = trackno
         query['m'] = ""
 
-        # need to use 'POST'
-        req = Request(self.now_url, urlencode(query))
-        self._check_response(self._request_lines(req))
+        self._submission_request("now_url", "nowplaying", query)
 
     @check_login
     def submit(self, track, artist, album="", trackno="", length="",
@@ -370,15 +801,14 @@ class Client(object):
 
         if source in ("p", "P"):
             if not length:
-                raise LastfmException("You must specify length")
+                raise JamendoException("You must specify length")
         else:
-            raise LastfmException("Source type not supported")
+            raise JamendoException("Source type not supported")
 
         if not isinstance(time, int):
             raise TypeError("Time must be int")
 
         query = {}
-        query['s'] = self.post_session_id
         query['t[0]'] = track
         query['a[0]'] = artist
         query['b[0]'] = album
@@ -389,9 +819,130 @@ class Client(object):
         query['r[0]'] = ""
         query['m[0]'] = ""
 
-        # need to use 'POST'
-        req = Request(self.post_url, urlencode(query))
-        self._check_response(self._request_lines(req))
+        self._submission_request("post_url", "submit", query)
+
+    def _submission_request(self, url_name, endpoint, query):
+        """POST query to the submission url named url_name. A stale
+        session is renewed and the request sent again once."""
+        if self.post_session_id is None:
+            # login does not wait for the submission session, join the
+            # handshake in flight or start one
+            self.refresh_post_session()
+            if self.post_session_id is None:
+                raise JamendoException("No submission session")
+
+        for attempt in (0, 1):
+            query['s'] = self.post_session_id
+            req = Request(getattr(self, url_name), urlencode(query))
+            ret = self._request_lines(req, endpoint)
+            if "BADSESSION" in ret and attempt == 0:
+                log.warning("submission session expired, renewing it")
+                self.refresh_post_session()
+                continue
+            self._check_response(ret)
+            return
+
+
+##############################################################################
+# Parsers
+##############################################################################
+
+def split_lines(data):
+    """Split a text response in stripped lines."""
+    lines = data.split("\n")
+    if not lines[-1]:
+        lines.pop()
+    return [c.strip() for c in lines]
+
+
+def parse_dict(lines):
+    """Parse key=value lines of handshake and adjust responses."""
+    result = {}
+    for line in lines:
+        key, sep, val = line.partition("=")
+        if not sep:
+            raise ValueError("need more than 1 value to unpack")
+        result[key] = val.strip()
+    return result
+
+
+XSPF_TRACK_FIELDS = ("title", "id", "album", "creator",
+                     "location", "duration", "image")
+
+
+def _track_layout(tags, cache):
+    """Return the position of each XSPF_TRACK_FIELDS element in a track
+    with the given children tags. Tracks of a playlist share the same
+    layout, so it is computed once per tags sequence."""
+    layout = cache.get(tags)
+    if layout is None:
+        positions = {}
+        for i, tag in enumerate(tags):
+            positions.setdefault(tag, i)
+        layout = cache[tags] = [positions[f] for f in XSPF_TRACK_FIELDS]
+    return layout
+
+
+def parse_xspf(xml, default_expiry):
+    """Parse a xspf playlist into a list of Track.
+
+    Each track element is visited once: the position of its fields is
+    looked up in a layout cache keyed by the children tags instead of
+    searching the children for every field.
+
+    @parm xml: playlist contents.
+    @parm default_expiry: validity in seconds of the track urls if the
+                          playlist has no valid expiry link.
+    """
+    tree = ElementTree.fromstring(xml)
+
+    expiry = default_expiry
+    for link in tree.findall("link"):
+        if (link.get("rel") or "").endswith("/expiry"):
+            try:
+                expiry = int(link.text)
+            except (TypeError, ValueError):
+                log.warning("ignoring invalid playlist expiry %r" % link.text)
+    expires = time.time() + expiry
+
+    lst = []
+    layouts = {}
+    utf8 = {}
+    for child in tree.find("trackList").findall("track"):
+        layout = _track_layout(tuple([c.tag for c in child]), layouts)
+        title, id, album, creator, location, duration, image = \
+            [child[i].text for i in layout]
+
+        album = album or ""
+        creator = creator or ""
+        for name in (title, album, creator):
+            if name not in utf8:
+                utf8[name] = to_utf8(name)
+
+        track = Track(utf8[title], id)
+        track.album = Album(utf8[album])
+        track.artist = Artist(utf8[creator])
+        track.url = location
+        track.duration = int(duration)
+        track.image = image
+        track.expires = expires
+
+        lst.append(track)
+
+    return lst
+
+
+def parse_userfeed(xml, cls):
+    """Parse a friends or neighbours feed into a list of cls."""
+    lst = []
+    tree = ElementTree.fromstring(xml)
+    for child in tree:
+        user = cls(to_utf8(child.get("username")))
+        user.url = child.find("url").text
+        user.image = child.find("image").text
+        lst.append(user)
+
+    return lst
 
 
 ##############################################################################
@@ -441,6 +992,8 @@ class Track(object):
         self.playcount = 0
         self.uts_time = 0
         self.image = None
+        self.expires = None
+        self.streams = [] # alternative (bitrate, url) of the track
         self.streamable = False
 
     def __repr__(self):
@@ -471,4 +1024,45 @@ class Album(object):
 
 
 if __name__ == "__main__":
-    client = Client("user", "xxx")
+    import sys
+    from recording import Recorder, Replayer
+
+    usage = "usage: client.py record ARCHIVE USERNAME PASSWORD [STATION ...]\n" \
+        "       client.py replay ARCHIVE [SCALE]"
+
+    if len(sys.argv) < 3 or sys.argv[1] not in ("record", "replay") or \
+            (sys.argv[1] == "record" and len(sys.argv) < 5):
+        print usage
+        sys.exit(1)
+
+    archive = sys.argv[2]
+    recorder = None
+    if sys.argv[1] == "record":
+        username, password = sys.argv[3:5]
+        stations = sys.argv[5:] or ["lastfm://user/%s/personal" % username]
+        client = Client(username, password)
+        recorder = Recorder({"username": username, "stations": stations})
+        client.set_recorder(recorder)
+    else:
+        scale = 1.0
+        if len(sys.argv) > 3:
+            scale = float(sys.argv[3])
+        replayer = Replayer.load(archive, scale)
+        username = replayer.meta["username"]
+        stations = replayer.meta["stations"]
+        client = Client(username, "replay")
+        client.set_replayer(replayer)
+
+    start = time.time()
+    client.login()
+    print "login: %.3fs" % (time.time() - start)
+    for station in stations:
+        t = time.time()
+        tracks = client.get_station_tracks(station)
+        print "%s: %d tracks in %.3fs" % (station, len(tracks), time.time() - t)
+    client.logout()
+    print "session: %.3fs" % (time.time() - start)
+
+    if recorder is not None:
+        recorder.save(archive)
+        print "%d exchanges recorded in %s" % (len(recorder.entries), archive)
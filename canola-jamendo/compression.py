@@ -0,0 +1,98 @@
+# Canola2 Jamendo Plugin
+# Authors: Vincent Lark <vincent.lark@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Additional permission under GNU GPL version 3 section 7
+#
+# If you modify this Program, or any covered work, by linking or combining it
+# with Canola2 and its core components (or a modified version of any of those),
+# containing parts covered by the terms of Instituto Nokia de Tecnologia End
+# User Software Agreement, the licensors of this Program grant you additional
+# permission to convey the resulting work.
+
+import zlib
+
+ACCEPT_ENCODING = "gzip, deflate"
+
+CHUNK_SIZE = 16384
+
+
+class DecompressingReader(object):
+    """File-like object decoding a gzip or deflate response body as it
+    is read, so it can feed incremental parsers.
+
+    @parm fp: response object.
+    @parm encoding: "gzip" or "deflate".
+    """
+
+    def __init__(self, fp, encoding):
+        self.fp = fp
+        self.encoding = encoding
+        self._first = True
+        self._buffer = ""
+        self._eof = False
+        if encoding == "deflate":
+            self._decomp = zlib.decompressobj()
+        else:
+            self._decomp = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def _decompress(self, data):
+        try:
+            return self._decomp.decompress(data)
+        except zlib.error:
+            if not (self._first and self.encoding == "deflate"):
+                raise
+            # some servers send raw deflate data without zlib header
+            self._decomp = zlib.decompressobj(-zlib.MAX_WBITS)
+            return self._decomp.decompress(data)
+
+    def _fill(self, size):
+        while not self._eof and (size < 0 or len(self._buffer) < size):
+            data = self.fp.read(CHUNK_SIZE)
+            if not data:
+                self._buffer += self._decomp.flush()
+                self._eof = True
+                break
+            self._buffer += self._decompress(data)
+            self._first = False
+
+    def read(self, size=-1):
+        self._fill(size)
+        if size < 0:
+            data, self._buffer = self._buffer, ""
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def info(self):
+        return self.fp.info()
+
+    def geturl(self):
+        return self.fp.geturl()
+
+    def close(self):
+        self.fp.close()
+
+
+def decode_response(response):
+    """Return a file-like object reading the decoded body of response.
+    Identity encoded responses are returned as they are."""
+    encoding = response.info().get("Content-Encoding", "")
+    encoding = encoding.strip().lower()
+    if encoding in ("gzip", "x-gzip"):
+        return DecompressingReader(response, "gzip")
+    elif encoding == "deflate":
+        return DecompressingReader(response, "deflate")
+    return response
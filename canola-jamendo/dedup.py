@@ -0,0 +1,183 @@
+# Canola2 Jamendo Plugin
+# Authors: Vincent Lark <vincent.lark@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Additional permission under GNU GPL version 3 section 7
+#
+# If you modify this Program, or any covered work, by linking or combining it
+# with Canola2 and its core components (or a modified version of any of those),
+# containing parts covered by the terms of Instituto Nokia de Tecnologia End
+# User Software Agreement, the licensors of this Program grant you additional
+# permission to convey the resulting work.
+
+"""Recently played tracks per station, to drop repeats from refills.
+
+A track is recognized by its id or by a signature of its artist and
+title, normalized so that case, accents, punctuation and bracketed
+suffixes such as "(Radio Edit)" do not matter. The last DEDUP_RECENT
+tracks of a station are kept exactly; all tracks played on the
+station also go into a Bloom filter, which remembers long sessions in
+a fixed 2KB at the price of a small false positive rate.
+"""
+
+import re
+import md5
+import threading
+import unicodedata
+from array import array
+
+from terra.utils.encoding import to_utf8
+
+
+DEDUP_RECENT = 200 # tracks remembered exactly per station
+DEDUP_STATIONS = 20 # stations remembered
+BLOOM_BITS = 16384 # 0.2% false positives after 1000 tracks
+BLOOM_HASHES = 4
+
+_brackets = re.compile(r"[\(\[].*?[\)\]]")
+# "feat." and the like only after a word, so "Feat of Clay" is kept
+_feat = re.compile(r"[\s\(\[](feat\.|ft\.|featuring\b).*$")
+_punctuation = re.compile(r"[^\w\s]", re.UNICODE)
+
+
+def _normalize(value):
+    if not isinstance(value, unicode):
+        value = unicode(value, "utf-8", "replace")
+    value = unicodedata.normalize("NFKD", value.lower())
+    value = u"".join([c for c in value if not unicodedata.combining(c)])
+    value = _feat.sub(u"", _brackets.sub(u"", value))
+    value = _punctuation.sub(u" ", value)
+    return u" ".join(value.split())
+
+
+def track_signature(artist, title):
+    """Return the fuzzy signature of a track."""
+    return to_utf8(u"%s\t%s" % (_normalize(artist or ""),
+                                _normalize(title or "")))
+
+
+class BloomFilter(object):
+    def __init__(self, bits=BLOOM_BITS, hashes=BLOOM_HASHES):
+        self.bits = bits
+        self.hashes = hashes
+        self._array = array("B", [0]) * (bits / 8)
+
+    def _positions(self, key):
+        digest = md5.new(key).digest()
+        for i in xrange(self.hashes):
+            value = (ord(digest[2 * i]) << 8) | ord(digest[2 * i + 1])
+            yield value % self.bits
+
+    def add(self, key):
+        for pos in self._positions(key):
+            self._array[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key):
+        for pos in self._positions(key):
+            if not self._array[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+
+class PlayedSet(object):
+    """Tracks played on one station."""
+
+    def __init__(self, size=DEDUP_RECENT):
+        self.size = size
+        self._order = []
+        self._ids = set()
+        self._signatures = set()
+        self._bloom = BloomFilter()
+
+    def add(self, track_id, signature):
+        self._order.append((track_id, signature))
+        if track_id:
+            self._ids.add(track_id)
+        self._signatures.add(signature)
+        self._bloom.add(signature)
+
+        if len(self._order) > self.size:
+            old_id, old_signature = self._order.pop(0)
+            self._ids.discard(old_id)
+            self._signatures.discard(old_signature)
+
+    def contains(self, track_id, signature):
+        return (track_id and track_id in self._ids) or \
+            signature in self._signatures or signature in self._bloom
+
+
+class PlayedTracks(object):
+    """Played tracks of the last DEDUP_STATIONS stations."""
+
+    def __init__(self, max_stations=DEDUP_STATIONS):
+        self.max_stations = max_stations
+        self._stations = {}
+        self._order = []
+        self._lock = threading.Lock()
+
+    def _key(self, track):
+        artist = track.artist is not None and track.artist.name or ""
+        return track.mbid, track_signature(artist, track.name)
+
+    def mark(self, url, track):
+        """Remember track as played on station url."""
+        self._lock.acquire()
+        try:
+            played = self._stations.get(url)
+            if played is None:
+                played = self._stations[url] = PlayedSet()
+            else:
+                self._order.remove(url)
+            self._order.append(url)
+            if len(self._order) > self.max_stations:
+                del self._stations[self._order.pop(0)]
+            played.add(*self._key(track))
+        finally:
+            self._lock.release()
+
+    def filter(self, url, tracks):
+        """Return tracks without the ones played on station url and
+        the repeats inside tracks. If all of them were played, they
+        are returned rather than leaving the station empty, still
+        without the repeats."""
+        ret = self.unplayed(url, tracks)
+        if not ret:
+            return self._dedupe(None, tracks)
+        return ret
+
+    def unplayed(self, url, tracks):
+        """Same as filter, but may return an empty list."""
+        self._lock.acquire()
+        try:
+            return self._dedupe(self._stations.get(url), tracks)
+        finally:
+            self._lock.release()
+
+    def _dedupe(self, played, tracks):
+        """Return tracks without the ones in played (a PlayedSet or
+        None) and the repeats inside tracks."""
+        seen = set()
+        ret = []
+        for track in tracks:
+            track_id, signature = self._key(track)
+            if (played is not None and
+                played.contains(track_id, signature)) or \
+                    (track_id and track_id in seen) or signature in seen:
+                continue
+            seen.add(signature)
+            if track_id:
+                seen.add(track_id)
+            ret.append(track)
+        return ret
@@ -0,0 +1,398 @@
+# Canola2 Jamendo Plugin
+# Authors: Vincent Lark <vincent.lark@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Additional permission under GNU GPL version 3 section 7
+#
+# If you modify this Program, or any covered work, by linking or combining it
+# with Canola2 and its core components (or a modified version of any of those),
+# containing parts covered by the terms of Instituto Nokia de Tecnologia End
+# User Software Agreement, the licensors of this Program grant you additional
+# permission to convey the resulting work.
+
+"""Resumable downloads in parallel byte range segments.
+
+A Download fetches url into path. When the server accepts byte ranges
+the file is split in up to DOWNLOAD_SEGMENTS segments fetched by
+parallel requests. Progress of each segment is saved in path.state so
+an interrupted download resumes where it stopped; the data itself is
+written in path.tmp and renamed to path once its size (and md5 when
+known) has been verified.
+"""
+
+import os
+import md5
+import urllib2
+import logging
+import threading
+
+from terra.core.threaded_func import ThreadedFunction
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+
+log = logging.getLogger("plugins.canola-jamendo.download")
+
+DOWNLOAD_SEGMENTS = 4
+DOWNLOAD_MIN_SEGMENT = 256 * 1024 # do not split below 256KB per segment
+DOWNLOAD_CHUNK = 16384
+DOWNLOAD_SAVE_EVERY = 32 # save progress every 32 chunks (512KB)
+
+
+class DownloadError(Exception):
+    pass
+
+
+def parse_content_range(value):
+    """Return the total length of a "bytes start-end/total"
+    Content-Range header, or None if unknown."""
+    if not value:
+        return None
+    total = value.rpartition("/")[2].strip()
+    if not total.isdigit():
+        return None
+    return int(total)
+
+
+class Download(object):
+    """Download of url into path, see module documentation.
+
+    @parm url: remote url.
+    @parm path: destination file.
+    @parm opener: urllib2 opener (defaults to urllib2.build_opener()).
+    @parm segments: maximum number of parallel range requests.
+    @parm md5sum: expected md5 hex digest of the file, if known.
+    @parm stats: NetworkStats to record transfers in ("download").
+    """
+
+    def __init__(self, url, path, opener=None, segments=DOWNLOAD_SEGMENTS,
+                 md5sum=None, stats=None):
+        self.url = url
+        self.path = path
+        self.opener = opener or urllib2.build_opener()
+        self.segments = segments
+        self.md5sum = md5sum
+        self.stats = stats
+        self.length = None
+        self.cancelled = False
+        self._state = None
+        self._lock = threading.Lock()
+
+    tmp_path = property(lambda self: self.path + ".tmp")
+    state_path = property(lambda self: self.path + ".state")
+
+    def cancel(self):
+        self.cancelled = True
+
+    def _get_progress(self):
+        """Return (bytes done, total length or None)."""
+        if self._state is None:
+            return (0, self.length)
+        done = sum([s[2] for s in self._state["segments"]])
+        return (done, self.length)
+
+    progress = property(_get_progress)
+
+    # state ##################################################################
+
+    def _load_state(self):
+        if not os.path.exists(self.state_path) or \
+                not os.path.exists(self.tmp_path):
+            return None
+        try:
+            fd = open(self.state_path)
+            try:
+                state = json.load(fd)
+            finally:
+                fd.close()
+        except (IOError, ValueError), e:
+            log.warning("ignoring broken download state: %s" % e)
+            return None
+        if state.get("url") != self.url:
+            return None
+        return state
+
+    def _save_state(self):
+        self._lock.acquire()
+        try:
+            tmp = self.state_path + ".new"
+            fd = open(tmp, "w")
+            try:
+                json.dump(self._state, fd)
+            finally:
+                fd.close()
+            os.rename(tmp, self.state_path)
+        finally:
+            self._lock.release()
+
+    def _probe(self):
+        """Return (length, accepts ranges, validator) of the url.
+        Servers refusing HEAD are asked for an open range instead."""
+        req = urllib2.Request(self.url)
+        req.get_method = lambda: "HEAD"
+        try:
+            response = self.opener.open(req)
+        except urllib2.HTTPError, e:
+            if e.code not in (405, 501):
+                raise
+            log.warning("HEAD refused (%d), probing %s with a range "
+                        "request" % (e.code, self.url))
+            return self._probe_range()
+        try:
+            info = response.info()
+            length = info.get("Content-Length")
+            ranges = info.get("Accept-Ranges", "").lower() == "bytes"
+            validator = info.get("ETag") or info.get("Last-Modified")
+        finally:
+            response.close()
+        if length is not None:
+            length = int(length)
+        return length, ranges, validator
+
+    def _probe_range(self):
+        """Probe with a "bytes=0-" GET, closed before the body is read.
+        The length is taken from Content-Range if the server answered
+        with a range."""
+        req = urllib2.Request(self.url)
+        req.add_header("Range", "bytes=0-")
+        response = self.opener.open(req)
+        try:
+            info = response.info()
+            validator = info.get("ETag") or info.get("Last-Modified")
+            if response.code == 206:
+                length = parse_content_range(info.get("Content-Range"))
+                ranges = True
+            else:
+                length = info.get("Content-Length")
+                if length is not None:
+                    length = int(length)
+                ranges = info.get("Accept-Ranges", "").lower() == "bytes"
+        finally:
+            response.close()
+        return length, ranges, validator
+
+    def _new_state(self, length, ranges, validator):
+        if not ranges or not length:
+            count = 1
+        else:
+            count = max(1, min(self.segments, length / DOWNLOAD_MIN_SEGMENT))
+
+        segments = []
+        if length:
+            size = length / count
+            for i in xrange(count):
+                start = i * size
+                end = (i == count - 1) and length - 1 or start + size - 1
+                segments.append([start, end, 0])
+        else:
+            segments.append([0, None, 0])
+
+        fd = open(self.tmp_path, "wb")
+        try:
+            if length:
+                fd.truncate(length)
+        finally:
+            fd.close()
+
+        return {"url": self.url, "length": length, "ranges": ranges,
+                "validator": validator, "segments": segments}
+
+    # transfer ###############################################################
+
+    def _fetch_segment(self, segment, errors):
+        start, end, done = segment
+        if end is not None and start + done > end:
+            return
+
+        req = urllib2.Request(self.url)
+        if self._state["ranges"]:
+            if end is None:
+                req.add_header("Range", "bytes=%d-" % (start + done))
+            else:
+                req.add_header("Range", "bytes=%d-%d" % (start + done, end))
+
+        fd = response = None
+        measure = self.stats and self.stats.measure("download")
+        received = 0
+        try:
+            response = self.opener.open(req)
+            if self._state["ranges"] and response.code != 206:
+                raise DownloadError("server ignored range request")
+
+            fd = open(self.tmp_path, "r+b")
+            fd.seek(start + done)
+            chunks = 0
+            while not self.cancelled:
+                if end is None:
+                    size = DOWNLOAD_CHUNK
+                else:
+                    size = min(DOWNLOAD_CHUNK, end + 1 - start - segment[2])
+                    if size <= 0:
+                        break
+                data = response.read(size)
+                if not data:
+                    break
+                fd.write(data)
+                received += len(data)
+                segment[2] += len(data)
+                chunks += 1
+                if chunks % DOWNLOAD_SAVE_EVERY == 0:
+                    fd.flush()
+                    self._save_state()
+
+            if end is not None and not self.cancelled and \
+                    start + segment[2] <= end:
+                raise DownloadError("connection closed at byte %d" % \
+                                        (start + segment[2]))
+            if measure:
+                measure.done(received)
+        except Exception, e:
+            if measure:
+                measure.failed(e)
+            errors.append(e)
+        if fd is not None:
+            fd.close()
+        if response is not None:
+            response.close()
+
+    def run(self):
+        """Download the file, blocking. Return its path."""
+        state = self._load_state()
+        length, ranges, validator = self._probe()
+
+        if state is not None and (state["length"] != length or
+                                  state["validator"] != validator or
+                                  not state["ranges"]):
+            log.warning("remote file changed, restarting %s" % self.url)
+            state = None
+
+        if state is None:
+            state = self._new_state(length, ranges, validator)
+        else:
+            log.warning("resuming %s at %d bytes" % \
+                            (self.url, sum([s[2] for s in state["segments"]])))
+
+        self.length = length
+        self._state = state
+        self._save_state()
+
+        errors = []
+        threads = []
+        for segment in state["segments"]:
+            t = threading.Thread(target=self._fetch_segment,
+                                 args=(segment, errors))
+            t.setDaemon(True)
+            t.start()
+            threads.append(t)
+        for t in threads:
+            t.join()
+
+        self._save_state()
+        if self.cancelled:
+            raise DownloadError("download cancelled")
+        if errors:
+            raise errors[0]
+
+        self._verify()
+        os.rename(self.tmp_path, self.path)
+        os.unlink(self.state_path)
+        return self.path
+
+    def _verify(self):
+        size = os.path.getsize(self.tmp_path)
+        if self.length is not None and size != self.length:
+            self._discard()
+            raise DownloadError("size mismatch: %d != %d" % \
+                                    (size, self.length))
+
+        if self.md5sum:
+            digest = md5.new()
+            fd = open(self.tmp_path, "rb")
+            try:
+                data = fd.read(DOWNLOAD_CHUNK)
+                while data:
+                    digest.update(data)
+                    data = fd.read(DOWNLOAD_CHUNK)
+            finally:
+                fd.close()
+            if digest.hexdigest() != self.md5sum:
+                self._discard()
+                raise DownloadError("md5 mismatch")
+
+    def _discard(self):
+        for path in (self.tmp_path, self.state_path):
+            if os.path.exists(path):
+                os.unlink(path)
+
+
+class DownloadManager(object):
+    """Runs downloads in threads, at most max_active at a time.
+
+    Completion is reported like ThreadedFunction does, by calling
+    end_callback(exception, retval) from the main loop.
+    """
+
+    def __init__(self, opener=None, stats=None, max_active=2):
+        self.opener = opener
+        self.stats = stats
+        self.max_active = max_active
+        self._active = {}
+        self._queue = []
+
+    def add(self, url, path, end_callback=None, md5sum=None):
+        """Queue a download of url into path and return it. If path is
+        already being downloaded, the existing download is returned."""
+        for download, callbacks in self._active.values() + self._queue:
+            if download.path == path:
+                if end_callback:
+                    callbacks.append(end_callback)
+                return download
+
+        download = Download(url, path, self.opener, md5sum=md5sum,
+                            stats=self.stats)
+        self._queue.append((download, end_callback and [end_callback] or []))
+        self._schedule()
+        return download
+
+    def cancel(self, path):
+        for download, callbacks in self._active.values() + self._queue:
+            if download.path == path:
+                download.cancel()
+        self._queue = [q for q in self._queue if q[0].path != path]
+
+    def is_active(self, path):
+        return path in self._active or \
+            path in [q[0].path for q in self._queue]
+
+    def _schedule(self):
+        while self._queue and len(self._active) < self.max_active:
+            download, callbacks = self._queue.pop(0)
+            self._start(download, callbacks)
+
+    def _start(self, download, callbacks):
+        def finished(exception, retval):
+            del self._active[download.path]
+            if exception is not None:
+                log.error("download of %s failed: %s" % \
+                              (download.url, exception))
+            for cb in callbacks:
+                cb(exception, retval)
+            self._schedule()
+
+        self._active[download.path] = (download, callbacks)
+        ThreadedFunction(finished, download.run).start()
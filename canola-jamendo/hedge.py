@@ -0,0 +1,123 @@
+# Canola2 Jamendo Plugin
+# Authors: Vincent Lark <vincent.lark@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Additional permission under GNU GPL version 3 section 7
+#
+# If you modify this Program, or any covered work, by linking or combining it
+# with Canola2 and its core components (or a modified version of any of those),
+# containing parts covered by the terms of Instituto Nokia de Tecnologia End
+# User Software Agreement, the licensors of this Program grant you additional
+# permission to convey the resulting work.
+
+"""Hedged requests.
+
+A request that has not answered after a delay (a high percentile of
+its endpoint latency) is sent a second time, possibly to a mirror;
+the first answer wins and the other request is cancelled. Hedges are
+paid from a HedgeBudget so they add at most a few percent of load.
+
+Both requests may reach the server, so only idempotent requests
+(covers) may be hedged.
+"""
+
+import Queue
+import threading
+
+
+HEDGE_RATIO = 0.05 # hedges allowed per hedgeable request
+HEDGE_BURST = 5 # hedges that may be sent in a row
+
+
+class HedgeCancelled(Exception):
+    pass
+
+
+class HedgeBudget(object):
+    """Token bucket: every hedgeable request deposits ratio tokens,
+    every hedge withdraws one."""
+
+    def __init__(self, ratio=HEDGE_RATIO, burst=HEDGE_BURST):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = float(burst)
+        self.sent = 0
+        self.won = 0
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        self._lock.acquire()
+        try:
+            self.tokens = min(self.burst, self.tokens + self.ratio)
+        finally:
+            self._lock.release()
+
+    def withdraw(self):
+        self._lock.acquire()
+        try:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            self.sent += 1
+            return True
+        finally:
+            self._lock.release()
+
+
+def hedged_call(call, hedge, delay, budget):
+    """Return call(cancel), or hedge(cancel) if call has not returned
+    after delay seconds and the budget allows a hedge, whichever ends
+    first successfully. cancel is a threading.Event set when the other
+    one won; functions should then raise HedgeCancelled. If both fail
+    the first error is raised."""
+    results = Queue.Queue()
+
+    def run(func, cancel):
+        try:
+            results.put((func, None, func(cancel)))
+        except Exception, e:
+            results.put((func, e, None))
+
+    cancels = {}
+
+    def start(func):
+        cancels[func] = threading.Event()
+        t = threading.Thread(target=run, args=(func, cancels[func]))
+        t.setDaemon(True)
+        t.start()
+
+    start(call)
+    try:
+        func, error, retval = results.get(True, delay)
+    except Queue.Empty:
+        if not budget.withdraw():
+            func, error, retval = results.get()
+        else:
+            start(hedge)
+            func, error, retval = results.get()
+            if error is not None:
+                first_error = error
+                func, error, retval = results.get()
+                if error is not None:
+                    raise first_error
+            for other, cancel in cancels.iteritems():
+                if other is not func:
+                    cancel.set()
+            if func is hedge:
+                budget.won += 1
+
+    if error is not None:
+        raise error
+    return retval
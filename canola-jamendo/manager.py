@@ -22,10 +22,33 @@
 # User Software Agreement, the licensors of this Program grant you additional
 # permission to convey the resulting work.
 
+import os
+import ecore
+import logging
+
+from terra.core.manager import Manager
 from terra.core.singleton import Singleton
 from terra.core.plugin_prefs import PluginPrefs
+from terra.core.threaded_func import ThreadedFunction
 
 from client import Client
+from suggest import SuggestionStore
+from playlist_cache import PlaylistCache
+from tracing import tracer
+from resolver import resolver, KNOWN_HOSTS, DNS_SAVED_HOSTS
+from track_cache import TrackCache, TRACK_CACHE_BUDGET
+from download import DownloadManager
+from proxy import StreamProxy
+from warmup import StationWarmup, WARMUP_BUDGET
+from ratings import RatingQueue, RATINGS_FLUSH_DELAY
+from dedup import PlayedTracks
+from probe import StreamProber
+from similar import SimilarArtists
+from utils import get_data_path
+
+log = logging.getLogger("plugins.canola-jamendo.manager")
+
+STATS_DUMP_INTERVAL = 600 # dump network stats every 10 minutes
 
 
 class JamendoManager(Singleton, Client):
@@ -36,6 +59,38 @@ class JamendoManager(Singleton, Client):
         self.prefs = PluginPrefs("jamendo")
         self.username = self.get_preference("username", "")
         self.password = self.get_preference("password", "")
+        self.suggestions = SuggestionStore(self.prefs)
+        self.playlists = PlaylistCache()
+        self.played = PlayedTracks()
+        self.similar = SimilarArtists(Manager().canola_db)
+        self.tracks = TrackCache(os.path.join(get_data_path(), "tracks"),
+                                 PluginPrefs("jamendo_tracks"),
+                                 self.get_preference("track_cache_budget",
+                                                     TRACK_CACHE_BUDGET))
+        self.downloads = DownloadManager(self.opener, self.stats)
+        self.streams = StreamProxy(self.opener, self.stats)
+        self.prober = StreamProber(self.opener, self.stats)
+        self.warmup = StationWarmup(self, self.playlists,
+                                    self.get_preference("warmup_budget",
+                                                        WARMUP_BUDGET))
+        self.ratings = RatingQueue(self, self.prefs)
+        if self.ratings.pending:
+            self.ratings.schedule(RATINGS_FLUSH_DELAY)
+
+        self.hedged_endpoints = set(self.get_preference("hedging", []))
+        self.mirrors = self.get_preference("mirrors", {})
+
+        tracer.metrics = self.stats
+        tracer.enabled = self.get_preference("tracing", False)
+
+        # resolve service hosts and the ones used last time in background
+        saved = self.get_preference("dns_hosts", [])[:DNS_SAVED_HOSTS]
+        hosts = set(KNOWN_HOSTS) | set(saved)
+        ThreadedFunction(None, resolver.prefetch, hosts).start()
+
+        self._stats_timer = None
+        self.start_stats_dump(self.get_preference("stats_dump_interval",
+                                                  STATS_DUMP_INTERVAL))
 
     def is_logged(self):
         return self.logged
@@ -50,11 +105,58 @@ class JamendoManager(Singleton, Client):
         self.prefs[name] = value
         self.prefs.save()
 
+    def get_network_stats(self):
+        """Return per endpoint request counts, latency percentiles
+        (p50/p95/p99 in seconds), bytes in/out and error classes."""
+        return self.stats.snapshot()
+
+    def get_stats_path(self):
+        return os.path.join(get_data_path(), "network_stats.json")
+
+    def dump_network_stats(self, path=None):
+        try:
+            self.stats.dump(path or self.get_stats_path())
+        except Exception, e:
+            log.error("unable to dump network stats: %s" % e)
+
+    def start_stats_dump(self, interval):
+        """Dump network stats to get_stats_path() every interval
+        seconds. Zero disables it."""
+        if self._stats_timer is not None:
+            self._stats_timer.delete()
+            self._stats_timer = None
+
+        if not interval:
+            return
+
+        def cb_dump():
+            self.dump_network_stats()
+            self.prefs["dns_hosts"] = resolver.get_hosts()
+            self.prefs.save()
+            return True
+
+        self._stats_timer = ecore.timer_add(interval, cb_dump)
+
+    def set_tracing(self, enabled):
+        tracer.enabled = enabled
+        self.set_preference("tracing", enabled)
+
+    def get_trace_path(self):
+        return os.path.join(get_data_path(), "trace.json")
+
+    def export_trace(self, path=None):
+        """Write the play path trace in Chrome trace event format."""
+        path = path or self.get_trace_path()
+        tracer.export(path)
+        return path
+
     def get_username(self):
         return self.username
 
     def set_username(self, value):
         self.username = value
+        self.forget_bad_stations()
+        self.playlists.clear()
         self.set_preference("username", value)
 
     def get_password(self):
@@ -62,4 +164,13 @@ class JamendoManager(Singleton, Client):
 
     def set_password(self, value):
         self.password = value
+        self.forget_bad_stations()
         self.set_preference("password", value)
+
+    def _get_scrobble_enabled(self):
+        return self.get_preference("scrobble_enabled", True)
+
+    def _set_scrobble_enabled(self, value):
+        self.set_preference("scrobble_enabled", value)
+
+    scrobble_enabled = property(_get_scrobble_enabled, _set_scrobble_enabled)
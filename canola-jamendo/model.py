@@ -24,7 +24,7 @@
 
 import os
 import time
-import urllib
+import ecore
 import urllib2
 import socket
 import logging
@@ -35,9 +35,14 @@ from terra.core.model import ModelFolder
 from terra.utils.encoding import to_utf8
 from terra.core.threaded_func import ThreadedFunction
 
-from client import TuningError
+from client import TuningError, HandshakeError, AuthenticationError
+from batching import BatchAppender
+from tracing import tracer
+from track_cache import track_key
+from warmup import WARMUP_STATIONS
+from similar import SIMILAR_MIN_TRACKS
 from manager import JamendoManager
-from utils import get_cover_path, normalize_path
+from utils import get_cover_file
 
 mger = Manager()
 jam_manager = JamendoManager()
@@ -55,6 +60,21 @@ TAG_LAST_PLAYED = "last_played_songs"
 (SERVICE_PERSONAL, SERVICE_SIMILAR_ARTISTS,
 SERVICE_TAG, SERVICE_RADIO) = range(4)
 
+STATION_URLS = {
+    SERVICE_PERSONAL: "lastfm://user/%s/personal",
+    SERVICE_SIMILAR_ARTISTS: "lastfm://artist/%s",
+    SERVICE_TAG: "lastfm://globaltags/%s",
+    SERVICE_RADIO: "lastfm://group/%s",
+}
+
+
+def station_url(model_type, model_parm):
+    """Return the station url of a service or None if unknown."""
+    fmt = STATION_URLS.get(model_type)
+    if fmt is None or model_parm is None:
+        return None
+    return fmt % model_parm
+
 
 class Icon(PluginDefaultIcon):
     terra_type = "Icon/Folder/Task/Audio/Jamendo"
@@ -79,34 +99,86 @@ class AudioLocalModel(BaseAudioLocalModel):
         self.view_count = 0
         self.playcount = 0
         self.local_path = None
+        self.track = None
         self.parent = parent
 
     def ban_track(self):
-        def request(session, artist, title):
-            return session.ban_track(artist, title)
-
-        def request_finished(exception, retval):
-            log.warning("track marked as banned: " + str(retval))
-
         log.warning("marking track as banned %s/%s" % (self.artist, self.title))
-        ThreadedFunction(request_finished, request,
-                         lastfm_manager, self.artist, self.title).start()
+        jam_manager.ratings.add("ban", self.artist, self.title)
 
     def love_track(self):
-        def request(session, artist, title):
-            return session.love_track(artist, title)
+        log.warning("marking track as loved %s/%s" % (self.artist, self.title))
+        jam_manager.ratings.add("love", self.artist, self.title)
+
+    def is_cached(self):
+        return jam_manager.tracks.contains(track_key(self))
+
+    def get_cached_path(self):
+        """Return the local copy of the track or None."""
+        return jam_manager.tracks.lookup(track_key(self))
+
+    def store_track(self, pinned=False):
+        """Download the track into the track cache in background.
+
+        Interrupted downloads resume from where they stopped the next
+        time the track is stored.
+        """
+        key = track_key(self)
+        cache = jam_manager.tracks
+        if cache.contains(key):
+            if pinned:
+                cache.pin(key)
+            return
+        if not self.remote_uri:
+            return
+
+        def download_finished(exception, retval):
+            if exception is not None:
+                log.error("unable to cache %s: %s" % (key, exception))
+            elif cache.contains(key):
+                # an earlier caller of the same download stored it
+                if pinned:
+                    cache.pin(key)
+                self.local_path = cache.get_path(key)
+            else:
+                self.local_path = cache.store(key, retval, pinned)
 
-        def request_finished(exception, retval):
-            log.warning("track marked as loved: " + str(retval))
+        jam_manager.downloads.add(self.remote_uri,
+                                  cache.get_partial_path(key),
+                                  download_finished)
 
-        log.warning("marking track as loved %s/%s" % (self.artist, self.title))
-        ThreadedFunction(request_finished, request,
-                         lastfm_manager, self.artist, self.title).start()
+    def stream_track(self):
+        """Return the uri to play the track from: a local proxy url
+        that stores the track in the track cache while it plays, or
+        the remote uri if the proxy can not be started."""
+        key = track_key(self)
+        cache = jam_manager.tracks
+
+        def stream_finished(exception, retval):
+            if exception is not None:
+                log.error("unable to cache %s: %s" % (key, exception))
+                return None
+            if cache.contains(key):
+                os.unlink(retval)
+            else:
+                cache.store(key, retval)
+            self.local_path = cache.get_path(key)
+            return self.local_path
+
+        try:
+            return jam_manager.streams.stream(self.remote_uri,
+                                            cache.get_stream_path(key),
+                                            stream_finished)
+        except socket.error, e:
+            log.error("unable to start stream proxy: %s" % e)
+            return self.remote_uri
+
+    def pin_track(self):
+        """Keep the track on disk for offline listening."""
+        self.store_track(pinned=True)
 
     def request_cover(self, end_callback=None):
-        thumb = os.path.join(get_cover_path(),
-                             "%s - %s.jpg" % (normalize_path(self.artist),
-                                              normalize_path(self.title)))
+        thumb = get_cover_file(self.artist, self.title)
 
         if os.path.exists(thumb):
             self.thumb = self.cover = thumb
@@ -119,12 +191,9 @@ class AudioLocalModel(BaseAudioLocalModel):
 
         def refresh(remote_url, local_path):
             try:
-                urllib.urlretrieve(remote_url, local_path)
-            except:
-                pass
-            if os.path.exists(local_path):
-                return local_path
-            else:
+                return jam_manager.fetch_file(remote_url, local_path)
+            except Exception, e:
+                log.error("unable to fetch cover %s: %s" % (remote_url, e))
                 return None
 
         def refresh_finished(exception, retval):
@@ -143,6 +212,7 @@ class PromptModelFolder(ModelFolder):
     prompt_title = ""
     prompt_label = ""
     prompt_value = ""
+    service_type = None
     query = None
 
     def __init__(self, name, parent):
@@ -154,6 +224,27 @@ class PromptModelFolder(ModelFolder):
         if self.callback_notify:
             self.callback_notify(CanolaError(value))
 
+    def suggest(self, prefix, limit=5):
+        """Return previous queries of this prompt starting with prefix."""
+        if self.service_type is None:
+            return []
+        HistoryModelFolder.seed_suggestions(self.service_type)
+        lst = jam_manager.suggestions.suggest(self.service_type,
+                                              prefix, limit * 2)
+        # do not suggest stations known to be unavailable
+        lst = [v for v in lst if not jam_manager.is_bad_station(
+                station_url(self.service_type, v))]
+        return lst[:limit]
+
+    def get_prompt_label(self):
+        """Return the prompt label followed by the previous queries.
+        The entry itself is left to the user."""
+        lst = self.suggest("", 3)
+        if not lst:
+            return self.prompt_label
+        return "%s<br>Recent: %s" % (self.prompt_label,
+                                     ", ".join(to_utf8(v) for v in lst))
+
 
 class ServiceModelFolder(PromptModelFolder):
     terra_type = "Model/Folder/Task/Audio/Jamendo/Service"
@@ -165,8 +256,10 @@ class ServiceModelFolder(PromptModelFolder):
         PromptModelFolder.__init__(self, name, parent)
         self.changed = False
         self.callback_search_finished = None
-        self.username = lastfm_manager.get_username()
-        self.password = lastfm_manager.get_password()
+        self._appender = None
+        self._prefetching = False
+        self.username = jam_manager.get_username()
+        self.password = jam_manager.get_password()
 
     def reload(self):
         self.children.freeze()
@@ -179,15 +272,22 @@ class ServiceModelFolder(PromptModelFolder):
 
     def search(self, end_callback=None):
         if not self.threaded_search:
-            for c in self.do_search():
+            lst = self.do_search() or []
+            self.observe_artists(lst)
+            for c in lst:
                 self.children.append(c)
             return
 
         def refresh():
-            return self.do_search()
+            span = tracer.begin("search thread", folder=self.name)
+            try:
+                return self.do_search()
+            finally:
+                span.end()
 
         def refresh_finished(exception, retval):
             log.warning("search finished")
+            search_span.end()
 
             if not self.is_loading:
                 log.info("model is not loading")
@@ -218,9 +318,10 @@ class ServiceModelFolder(PromptModelFolder):
                 if self.callback_no_track_found:
                     self.callback_no_track_found()
 
-            for item in retval:
-                self.children.append(item)
+            self.observe_artists(retval or [])
+            self._append_children(retval or [], search_completed)
 
+        def search_completed():
             if end_callback:
                 end_callback()
 
@@ -229,24 +330,140 @@ class ServiceModelFolder(PromptModelFolder):
 
             self.inform_loaded()
 
+        if self._appender is not None:
+            self._appender.cancel()
+            self._appender = None
+
+        search_span = tracer.begin("search", folder=self.name)
         self.is_loading = True
         ThreadedFunction(refresh_finished, refresh).start()
 
+    def _append_children(self, items, end_callback):
+        """Append search results in batches from idle callbacks, so
+        large result sets do not block the main loop."""
+        span = tracer.begin("children append", count=len(items))
+
+        def appended():
+            span.end()
+            self._appender = None
+            end_callback()
+
+        appender = BatchAppender(self.children, items, appended)
+
+        def step():
+            if not self.is_loading:
+                appender.cancel()
+                self._appender = None
+            return appender.step()
+
+        # first batch right away, the rest when the main loop is idle
+        if step():
+            self._appender = appender
+            ecore.idler_add(step)
+
+    def get_station_url(self):
+        return station_url(self.service_type, self.query)
+
     def do_search(self):
         raise NotImplementedError("must be implemented by subclasses")
 
+    def fetch_tracks(self, url):
+        """Return the tracks of a station.
+
+        Unplayed tracks kept from a previous visit, or else the ones
+        found locally (see local_tracks), are returned at once and the
+        next playlist segment is fetched in the background.
+        """
+        # the user picked a station, leave the network to it
+        jam_manager.warmup.stop()
+
+        lst = jam_manager.playlists.take(url)
+        if lst:
+            log.warning("resuming %d cached tracks of %s" % (len(lst), url))
+        else:
+            lst = self.local_tracks(url)
+            if not lst:
+                return jam_manager.get_station_tracks(url)
+            log.warning("assembled %d local tracks for %s" % (len(lst), url))
+
+        # on weak links the next segment is only fetched when needed
+        if jam_manager.stats.throughput.prefetch_depth() > 0:
+            self.prefetch_segment()
+        return lst
+
+    def local_tracks(self, url):
+        """Return tracks of the station found without the server or
+        None to fetch them."""
+        return None
+
+    def prefetch_segment(self):
+        """Fetch the next playlist segment of the station in background
+        and keep it in the playlist cache for the next reload."""
+        url = self.get_station_url()
+        if url is None or self._prefetching:
+            return
+
+        def refill_finished(exception, retval):
+            self._prefetching = False
+            if exception is not None:
+                log.error("unable to refill %s: %s" % (url, exception))
+                return
+            jam_manager.playlists.put(url, retval)
+
+        self._prefetching = True
+        ThreadedFunction(refill_finished, jam_manager.get_station_tracks,
+                         url, True).start()
+
+    def cache_unplayed(self, start):
+        """Keep children from start on to resume the station later."""
+        tracks = [c.track for c in self.children[start:]
+                  if getattr(c, "track", None) is not None]
+        jam_manager.playlists.put(self.get_station_url(), tracks, front=True)
+
     def update_history(self):
         raise NotImplementedError("must be implemented by subclasses")
 
     def parse_entry_list(self, lst):
+        span = tracer.begin("parse_entry_list", count=len(lst))
+        try:
+            return self._parse_entry_list(lst)
+        finally:
+            span.end()
+
+    def _parse_entry_list(self, lst):
+        url = self.get_station_url()
+        if url is not None:
+            count = len(lst)
+            lst = jam_manager.played.filter(url, lst)
+            if len(lst) < count:
+                log.warning("dropped %d tracks already played on %s" % \
+                                (count - len(lst), url))
+
         return [self._create_model_from_entry(c) for c in lst]
 
+    def observe_artists(self, models):
+        """Make artists of the search results known to the suggestion
+        index. Called from the main loop, the index is not locked."""
+        for c in models:
+            name = getattr(c, "artist", None)
+            if name:
+                jam_manager.suggestions.observe(SERVICE_SIMILAR_ARTISTS, name)
+
+    def _select_stream(self, data):
+        """Return the stream url of the bitrate the link sustains."""
+        if not data.streams:
+            return data.url
+
+        streams = dict(data.streams)
+        bitrate = jam_manager.stats.throughput.select_bitrate(streams.keys())
+        return streams[bitrate]
+
     def _create_model_from_entry(self, data):
         model = AudioLocalModel(self)
 
+        model.track = data
         model.id = data.mbid
-        model.uri = data.url
-        model.remote_uri = data.url
+        model.uri = model.remote_uri = self._select_stream(data)
         model.title = data.name
         if data.album is not None:
             model.album = data.album.name
@@ -274,29 +491,23 @@ class PlayNowModelFolder(ServiceModelFolder):
     def __init__(self, name, parent):
         ServiceModelFolder.__init__(self, name, parent)
 
-    def do_search(self):
-        lst = lastfm_manager.get_preference(TAG_LAST_PLAYED)
+    def get_station_url(self):
+        lst = jam_manager.get_preference(TAG_LAST_PLAYED)
         if lst is None:
             return None
 
-        param = lst.get(lastfm_manager.get_username().lower(), None)
+        param = lst.get(jam_manager.get_username().lower(), None)
         if param is None:
             return None
 
-        model_type, model_parm = param
+        return station_url(*param)
 
-        if model_type == SERVICE_PERSONAL:
-            lastfm_manager.tune_user(model_parm, "personal")
-        elif model_type == SERVICE_TAG:
-            lastfm_manager.tune("lastfm://globaltags/%s" % model_parm)
-        elif model_type == SERVICE_RADIO:
-            lastfm_manager.tune("lastfm://group/%s" % model_parm)
-        elif model_type == SERVICE_SIMILAR_ARTISTS:
-            lastfm_manager.tune("lastfm://artist/%s" % model_parm)
-        else:
+    def do_search(self):
+        url = self.get_station_url()
+        if url is None:
             return None
 
-        lst = lastfm_manager.get_xspf_tracks()
+        lst = self.fetch_tracks(url)
         return self.parse_entry_list(lst)
 
     def update_history(self):
@@ -305,16 +516,19 @@ class PlayNowModelFolder(ServiceModelFolder):
 
 class PersonalModelFolder(ServiceModelFolder):
     terra_type = "Model/Folder/Task/Audio/Jamendo/Service/Personal"
+    service_type = SERVICE_PERSONAL
 
     def __init__(self, name, parent, username):
         ServiceModelFolder.__init__(self, name, parent)
         self.username = username
 
+    def get_station_url(self):
+        return station_url(self.service_type, self.username)
+
     def do_search(self):
         log.warning("searching for user radio: '%s'" % self.username)
 
-        lastfm_manager.tune_user(self.username, "personal")
-        lst = lastfm_manager.get_xspf_tracks()
+        lst = self.fetch_tracks(self.get_station_url())
         return self.parse_entry_list(lst)
 
     def update_history(self):
@@ -327,6 +541,7 @@ class SearchByTagModelFolder(ServiceModelFolder):
     prompt_title = "Music Tagged"
     prompt_label = "Enter a global tag"
     prompt_value = ""
+    service_type = SERVICE_TAG
 
     def __init__(self, name, parent):
         ServiceModelFolder.__init__(self, name, parent)
@@ -334,8 +549,7 @@ class SearchByTagModelFolder(ServiceModelFolder):
     def do_search(self):
         log.warning("searching for tag: '%s'" % self.query)
 
-        lastfm_manager.tune("lastfm://globaltags/%s" % self.query)
-        lst = lastfm_manager.get_xspf_tracks()
+        lst = self.fetch_tracks(self.get_station_url())
         return self.parse_entry_list(lst)
 
     def update_history(self):
@@ -348,6 +562,7 @@ class SearchByRadioModelFolder(ServiceModelFolder):
     prompt_title = "Group Radio"
     prompt_label = "Enter the group name"
     prompt_value = ""
+    service_type = SERVICE_RADIO
 
     def __init__(self, name, parent):
         ServiceModelFolder.__init__(self, name, parent)
@@ -355,8 +570,7 @@ class SearchByRadioModelFolder(ServiceModelFolder):
     def do_search(self):
         log.warning("searching for radio: '%s'" % self.query)
 
-        lastfm_manager.tune("lastfm://group/%s" % self.query)
-        lst = lastfm_manager.get_xspf_tracks()
+        lst = self.fetch_tracks(self.get_station_url())
         return self.parse_entry_list(lst)
 
     def update_history(self):
@@ -369,6 +583,7 @@ class SearchByArtistModelFolder(ServiceModelFolder):
     prompt_title = "Artist Similar to"
     prompt_label = "Enter an artist name"
     prompt_value = ""
+    service_type = SERVICE_SIMILAR_ARTISTS
 
     def __init__(self, name, parent):
         ServiceModelFolder.__init__(self, name, parent)
@@ -376,10 +591,28 @@ class SearchByArtistModelFolder(ServiceModelFolder):
     def do_search(self):
         log.warning("searching for similar artists: '%s'" % self.query)
 
-        lastfm_manager.tune("lastfm://artist/%s" % self.query)
-        lst = lastfm_manager.get_xspf_tracks()
+        lst = self.fetch_tracks(self.get_station_url())
         return self.parse_entry_list(lst)
 
+    def local_tracks(self, url):
+        """Assemble the station from cached tracks of the artist and
+        of the most similar ones (see similar.SimilarArtists), leaving
+        out the ones already played on this station. The server is
+        asked instead if there are too few of them, unless the network
+        is down; it is always asked once they have all been played
+        here."""
+        online = not network or network.status > 0.0
+
+        def playable(track):
+            # played tracks have no usable stream url, only a cached copy
+            return jam_manager.tracks.contains(track_key(track))
+
+        lst = jam_manager.similar.get_station_tracks(self.query, playable)
+        lst = jam_manager.played.unplayed(url, lst)
+        if not lst or (len(lst) < SIMILAR_MIN_TRACKS and online):
+            return None
+        return lst
+
     def update_history(self):
         HistoryModelFolder.insert(SERVICE_SIMILAR_ARTISTS, self.query)
 
@@ -392,8 +625,8 @@ class FriendsModelFolder(ServiceModelFolder):
 
     def do_search(self):
         lst = []
-        username = lastfm_manager.get_username()
-        for c in lastfm_manager.get_friends(username):
+        username = jam_manager.get_username()
+        for c in jam_manager.get_friends(username):
             lst.append(PersonalModelFolder(c.username, None, c.username))
         return lst
 
@@ -406,8 +639,8 @@ class NeighboursModelFolder(ServiceModelFolder):
 
     def do_search(self):
         lst = []
-        username = lastfm_manager.get_username()
-        for c in lastfm_manager.get_neighbours(username):
+        username = jam_manager.get_username()
+        for c in jam_manager.get_neighbours(username):
             lst.append(PersonalModelFolder(c.username, None, c.username))
         return lst
 
@@ -440,6 +673,10 @@ class HistoryModelFolder(ModelFolder):
                          WHERE username = ?
                          ORDER BY visit_time DESC""" % table_name
 
+    stmt_select_type = """SELECT model_parm, visit_time
+                          FROM %s
+                          WHERE username = ? AND model_type = ?""" % table_name
+
     stmt_delete_all = """DELETE FROM %s""" % table_name
 
     def __init__(self, name, parent):
@@ -448,7 +685,7 @@ class HistoryModelFolder(ModelFolder):
 
     @classmethod
     def insert(cls, model_type, model_parm):
-        username = lastfm_manager.get_username()
+        username = jam_manager.get_username()
 
         try:
             cls.db.execute(cls.stmt_insert,
@@ -457,15 +694,30 @@ class HistoryModelFolder(ModelFolder):
             cls.db.execute(cls.stmt_update,
                            (time.time(), username, model_type, model_parm))
 
-        lst = lastfm_manager.get_preference(TAG_LAST_PLAYED)
+        lst = jam_manager.get_preference(TAG_LAST_PLAYED)
         if lst is None:
             lst = {}
         lst[username.lower()] = (model_type, model_parm)
-        lastfm_manager.set_preference(TAG_LAST_PLAYED, lst)
+        jam_manager.set_preference(TAG_LAST_PLAYED, lst)
+
+        jam_manager.suggestions.record(model_type, model_parm)
+        jam_manager.suggestions.save()
+
+    @classmethod
+    def seed_suggestions(cls, model_type):
+        """Make sure history entries are known to the suggestion index."""
+        if not jam_manager.suggestions.needs_seed(model_type):
+            return
+
+        username = jam_manager.get_username()
+        rows = cls.db.execute(cls.stmt_select_type, (username, model_type))
+        for model_parm, visit_time in rows or ():
+            jam_manager.suggestions.seed(model_type, model_parm, visit_time)
+        jam_manager.suggestions.save()
 
     @classmethod
     def select_model_all(cls):
-        username = lastfm_manager.get_username()
+        username = jam_manager.get_username()
         rows = cls.db.execute(cls.stmt_select_all, (username,))
         return rows
 
@@ -489,7 +741,10 @@ class HistoryModelFolder(ModelFolder):
         for row in history_list:
             model_type = row[0]
             model_parm = row[1]
-            self.create_model_from_type(model_type, model_parm, self)
+            model = self.create_model_from_type(model_type, model_parm, self)
+            if model is not None and \
+                    jam_manager.is_bad_station(model.get_station_url()):
+                model.name = "%s (unavailable)" % model.name
 
     @classmethod
     def create_model_from_type(cls, model_type, model_parm, parent=None, name=None):
@@ -524,38 +779,83 @@ class MainModelFolder(Task, ModelFolder):
         ModelFolder.__init__(self, "Last.fm", parent)
 
     def do_load(self):
-        def refresh():
-            # try to login if user/pass are not empty
-            if lastfm_manager.get_username() and lastfm_manager.get_password():
-                lastfm_manager.login()
-            return lastfm_manager.is_logged()
-
-        def refresh_finished(exception, retval):
-            if not retval or exception:
-                self.inform_loaded()
-                if network and network.status > 0.0:
-                    not_logged_message = "You are not logged in.<br>"\
-                        "Log in on Settings > Internet media > Last.fm"
-                    self.callback_info(not_logged_message)
+        """Show the folders at once and log in in background.
+
+        Folders needing the session wait for the login in progress
+        (see Client.check_login); they are removed only if the
+        credentials are refused. After a network error they stay and
+        opening one logs in again.
+        """
+        def login_finished(exception, retval):
+            if exception is None:
+                if jam_manager.is_logged():
+                    self.warm_stations()
                 else:
-                    self.callback_info("No network available")
+                    # the folders log in again when opened
+                    log.warning("logged out while logging in, "
+                                "not warming stations")
                 return
 
-            lst = lastfm_manager.get_preference(TAG_LAST_PLAYED)
-            if lst and lst.has_key(lastfm_manager.get_username().lower()):
-                PlayNowModelFolder("Play now", self)
+            log.error("login failed: %s" % exception)
+            if not isinstance(exception, (AuthenticationError,
+                                          HandshakeError, ValueError)):
+                self.callback_info("Unable to connect to server.<br>"
+                                   "Check your connection and try again.")
+                return
 
-            SearchByArtistModelFolder("Search by artist", self)
-            SearchByTagModelFolder("Search by tag", self)
-            SearchByRadioModelFolder("Search by radio", self)
-            FriendsModelFolder("Friends", self)
-            NeighboursModelFolder("Neighbours", self)
-            HistoryModelFolder("History", self)
+            self.children.freeze()
+            del self.children[:]
+            self.children.thaw()
+            self.not_logged()
 
+        if not jam_manager.get_username() or \
+                not jam_manager.get_password():
             self.inform_loaded()
+            self.not_logged()
+            return
 
-        self.is_loading = True
-        ThreadedFunction(refresh_finished, refresh).start()
+        self.create_folders()
+        self.inform_loaded()
+        if jam_manager.is_logged():
+            self.warm_stations()
+        else:
+            ThreadedFunction(login_finished, jam_manager.login).start()
+
+    def not_logged(self):
+        if network and network.status > 0.0:
+            not_logged_message = "You are not logged in.<br>"\
+                "Log in on Settings > Internet media > Last.fm"
+            self.callback_info(not_logged_message)
+        else:
+            self.callback_info("No network available")
+
+    def create_folders(self):
+        lst = jam_manager.get_preference(TAG_LAST_PLAYED)
+        if lst and lst.has_key(jam_manager.get_username().lower()):
+            PlayNowModelFolder("Play now", self)
+
+        SearchByArtistModelFolder("Search by artist", self)
+        SearchByTagModelFolder("Search by tag", self)
+        SearchByRadioModelFolder("Search by radio", self)
+        FriendsModelFolder("Friends", self)
+        NeighboursModelFolder("Neighbours", self)
+        HistoryModelFolder("History", self)
+
+    def warm_stations(self):
+        """Prefetch the last played station and the most recent
+        history stations in background."""
+        urls = []
+        lst = jam_manager.get_preference(TAG_LAST_PLAYED)
+        if lst:
+            param = lst.get(jam_manager.get_username().lower())
+            if param is not None:
+                urls.append(station_url(*param))
+
+        rows = list(HistoryModelFolder.select_model_all() or ())
+        for model_type, model_parm in rows[:WARMUP_STATIONS]:
+            urls.append(station_url(model_type, model_parm))
+
+        jam_manager.warmup.start(urls)
 
 
 ################################################################################
@@ -581,17 +881,17 @@ class UserPassOptionsModel(MixedListItemDual):
 
     def __init__(self, parent=None):
         MixedListItemDual.__init__(self, parent)
-        self.username = lastfm_manager.get_username()
-        self.password = lastfm_manager.get_password()
+        self.username = jam_manager.get_username()
+        self.password = jam_manager.get_password()
 
     def get_title(self):
-        if not lastfm_manager.is_logged():
+        if not jam_manager.is_logged():
             return "Login to Last.fm"
         else:
-            return "Logged as %s" % lastfm_manager.get_username()
+            return "Logged as %s" % jam_manager.get_username()
 
     def get_left_button_text(self):
-        if not lastfm_manager.is_logged():
+        if not jam_manager.is_logged():
             return "Log on"
         else:
             return "Log off"
@@ -605,8 +905,8 @@ class UserPassOptionsModel(MixedListItemDual):
 
     def on_left_button_clicked(self):
         if not self.is_logged():
-            self.username = lastfm_manager.get_username()
-            self.password = lastfm_manager.get_password()
+            self.username = jam_manager.get_username()
+            self.password = jam_manager.get_password()
             self.callback_use(self)
         else:
             self.logout()
@@ -619,10 +919,10 @@ class UserPassOptionsModel(MixedListItemDual):
         self.callback_use(self)
 
     def logout(self):
-        lastfm_manager.logout()
+        jam_manager.logout()
 
     def is_logged(self):
-        return lastfm_manager.is_logged()
+        return jam_manager.is_logged()
 
 
 MixedListItemOnOff = mger.get_class("Model/Settings/Folder/MixedList/Item/OnOff")
@@ -634,14 +934,14 @@ class ScrobblerOptionsModel(MixedListItemOnOff):
         MixedListItemOnOff.__init__(self, parent)
 
     def get_state(self):
-        return (self.title, lastfm_manager.scrobble_enabled)
+        return (self.title, jam_manager.scrobble_enabled)
 
     def on_clicked(self):
-        self.set_scrobbler(not lastfm_manager.scrobble_enabled)
+        self.set_scrobbler(not jam_manager.scrobble_enabled)
         self.callback_update(self)
 
     def set_scrobbler(self, enable):
-        lastfm_manager.scrobble_enabled = enable
+        jam_manager.scrobble_enabled = enable
 
 
 class HistoryOptionsModel(OptionsModelFolder):
@@ -30,11 +30,11 @@ import logging
 from terra.core.manager import Manager
 from terra.core.threaded_func import ThreadedFunction
 
-from manager import LastfmManager
+from manager import JamendoManager
 from client import HandshakeError, AuthenticationError
 
 manager = Manager()
-lastfm_manager = LastfmManager()
+jam_manager = JamendoManager()
 network = manager.get_status_notifier("Network")
 ModalController = manager.get_class("Controller/Modal")
 UsernamePasswordModal = manager.get_class("Widget/Settings/UsernamePasswordModal")
@@ -77,8 +77,8 @@ class UserPassController(ModalController):
         if not self.view.username or not self.view.password:
             return
 
-        lastfm_manager.set_username(self.view.username)
-        lastfm_manager.set_password(self.view.password)
+        jam_manager.set_username(self.view.username)
+        jam_manager.set_password(self.view.password)
 
         def refresh(session):
             session.login()
@@ -90,7 +90,7 @@ class UserPassController(ModalController):
 
             if exception is None:
                 self.model.title = "Logged as %s" % \
-                    lastfm_manager.get_username()
+                    jam_manager.get_username()
 
                 self.view.message("You are now logged in")
                 ecore.timer_add(1.5, cb_close)
@@ -104,7 +104,7 @@ class UserPassController(ModalController):
                 ecore.timer_add(1.5, cb_close)
 
         self.view.message_wait("  Trying to login...")
-        ThreadedFunction(refresh_finished, refresh, lastfm_manager).start()
+        ThreadedFunction(refresh_finished, refresh, jam_manager).start()
 
     def delete(self):
         self.view.delete()
@@ -0,0 +1,106 @@
+# Canola2 Jamendo Plugin
+# Authors: Vincent Lark <vincent.lark@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Additional permission under GNU GPL version 3 section 7
+#
+# If you modify this Program, or any covered work, by linking or combining it
+# with Canola2 and its core components (or a modified version of any of those),
+# containing parts covered by the terms of Instituto Nokia de Tecnologia End
+# User Software Agreement, the licensors of this Program grant you additional
+# permission to convey the resulting work.
+
+import time
+import threading
+
+PLAYLIST_CACHE_STATIONS = 10 # keep playlists of 10 stations
+PLAYLIST_CACHE_TRACKS = 50 # keep up to 50 tracks per station
+
+
+class PlaylistCache(object):
+    """Unplayed tracks of recently visited stations.
+
+    Stations are kept in least recently used order and tracks are
+    dropped once their stream url expires (see Track.expires).
+    Thread safe, so refills can be stored from worker threads.
+    """
+
+    def __init__(self, max_stations=PLAYLIST_CACHE_STATIONS,
+                 max_tracks=PLAYLIST_CACHE_TRACKS):
+        self.max_stations = max_stations
+        self.max_tracks = max_tracks
+        self._order = [] # station urls, most recent last
+        self._tracks = {}
+        self._lock = threading.Lock()
+
+    def _touch(self, url):
+        if url in self._order:
+            self._order.remove(url)
+        self._order.append(url)
+        while len(self._order) > self.max_stations:
+            del self._tracks[self._order.pop(0)]
+
+    def _valid(self, lst):
+        now = time.time()
+        return [t for t in lst if t.expires is None or t.expires > now]
+
+    def put(self, url, tracks, front=False):
+        """Store unplayed tracks of a station.
+
+        @parm url: station url.
+        @parm tracks: list of client.Track.
+        @parm front: play these tracks before the ones already stored.
+        """
+        if url is None or not tracks:
+            return
+
+        self._lock.acquire()
+        try:
+            lst = self._tracks.get(url, [])
+            if front:
+                lst = list(tracks) + lst
+            else:
+                lst = lst + list(tracks)
+            self._tracks[url] = self._valid(lst)[:self.max_tracks]
+            self._touch(url)
+        finally:
+            self._lock.release()
+
+    def take(self, url):
+        """Remove and return the valid cached tracks of a station."""
+        self._lock.acquire()
+        try:
+            lst = self._tracks.pop(url, None)
+            if lst is None:
+                return []
+            self._order.remove(url)
+            return self._valid(lst)
+        finally:
+            self._lock.release()
+
+    def count(self, url):
+        self._lock.acquire()
+        try:
+            return len(self._valid(self._tracks.get(url, [])))
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self._order = []
+            self._tracks = {}
+        finally:
+            self._lock.release()
@@ -0,0 +1,186 @@
+# Canola2 Jamendo Plugin
+# Authors: Vincent Lark <vincent.lark@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Additional permission under GNU GPL version 3 section 7
+#
+# If you modify this Program, or any covered work, by linking or combining it
+# with Canola2 and its core components (or a modified version of any of those),
+# containing parts covered by the terms of Instituto Nokia de Tecnologia End
+# User Software Agreement, the licensors of this Program grant you additional
+# permission to convey the resulting work.
+
+"""Pre-flight checks of upcoming stream urls.
+
+StreamProber sends HEAD requests for the next tracks in parallel, so
+dead urls are dropped before the player tries to open them. Stream
+urls may be valid for a single play, so only HEAD is used: servers not
+answering HEAD are assumed alive. A CircuitBreaker per host stops
+probing, and playing, from a host after repeated failures, for a
+cooldown that doubles while the host keeps failing.
+"""
+
+import time
+import urllib2
+import logging
+import threading
+from urlparse import urlparse
+
+
+log = logging.getLogger("plugins.canola-jamendo.probe")
+
+PROBE_AHEAD = 3 # tracks probed after the current one
+PROBE_TIMEOUT = 5 # seconds waited for probe answers
+PROBE_TTL = 300 # seconds a probe result is trusted
+BREAKER_THRESHOLD = 3 # consecutive failures opening the breaker
+BREAKER_COOLDOWN = 30 # first cooldown in seconds, doubled after each trial
+BREAKER_MAX_COOLDOWN = 600
+
+
+def get_host(url):
+    return urlparse(url)[1]
+
+
+class CircuitBreaker(object):
+    """Failure counts per host. After threshold consecutive failures
+    a host is blocked for a cooldown. Once it ends, a success unblocks
+    the host and a single failure blocks it again for twice as long."""
+
+    def __init__(self, threshold=BREAKER_THRESHOLD,
+                 cooldown=BREAKER_COOLDOWN,
+                 max_cooldown=BREAKER_MAX_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self._hosts = {} # host -> [failures, blocked until, cooldown]
+        self._lock = threading.Lock()
+
+    def allow(self, host):
+        self._lock.acquire()
+        try:
+            entry = self._hosts.get(host)
+            return entry is None or entry[1] <= time.time()
+        finally:
+            self._lock.release()
+
+    def success(self, host):
+        self._lock.acquire()
+        try:
+            self._hosts.pop(host, None)
+        finally:
+            self._lock.release()
+
+    def failure(self, host):
+        self._lock.acquire()
+        try:
+            entry = self._hosts.setdefault(host, [0, 0, self.cooldown])
+            entry[0] += 1
+            if entry[0] >= self.threshold:
+                log.warning("blocking %s for %ds" % (host, entry[2]))
+                entry[1] = time.time() + entry[2]
+                entry[2] = min(entry[2] * 2, self.max_cooldown)
+        finally:
+            self._lock.release()
+
+
+class StreamProber(object):
+    def __init__(self, opener=None, stats=None, breaker=None):
+        self.opener = opener or urllib2.build_opener()
+        self.stats = stats
+        self.breaker = breaker or CircuitBreaker()
+        self._results = {} # url -> (expires, alive)
+        self._lock = threading.Lock()
+
+    def allow(self, url):
+        """Return whether url is worth trying: its host is not blocked
+        and it was not found dead recently."""
+        if not self.breaker.allow(get_host(url)):
+            return False
+        self._lock.acquire()
+        try:
+            entry = self._results.get(url)
+        finally:
+            self._lock.release()
+        return entry is None or entry[0] < time.time() or entry[1]
+
+    def failed(self, url):
+        """Record that url could not be played."""
+        self._store(url, False)
+        self.breaker.failure(get_host(url))
+
+    def _store(self, url, alive):
+        self._lock.acquire()
+        try:
+            now = time.time()
+            for key in [k for k, v in self._results.iteritems()
+                        if v[0] < now]:
+                del self._results[key]
+            self._results[url] = (now + PROBE_TTL, alive)
+        finally:
+            self._lock.release()
+
+    def probe(self, url):
+        """Check url with a HEAD request, blocking. Return whether it
+        looks playable."""
+        host = get_host(url)
+        if not self.breaker.allow(host):
+            return False
+
+        req = urllib2.Request(url)
+        req.get_method = lambda: "HEAD"
+        measure = self.stats and self.stats.measure("probe")
+        try:
+            self.opener.open(req).close()
+            alive = True
+        except urllib2.HTTPError, e:
+            # servers not implementing HEAD tell nothing about the url
+            alive = e.code in (405, 501)
+        except Exception, e:
+            alive = False
+
+        if measure:
+            if alive:
+                measure.done()
+            else:
+                measure.failed(e)
+
+        if alive:
+            self.breaker.success(host)
+        elif not isinstance(e, urllib2.HTTPError) or e.code >= 500:
+            # only server and network errors count against the host
+            self.breaker.failure(host)
+        self._store(url, alive)
+        return alive
+
+    def probe_many(self, urls, timeout=PROBE_TIMEOUT):
+        """Probe urls in parallel. Return a dict of url to whether it
+        looks playable, without the ones not answered in time."""
+        results = {}
+
+        def run(url):
+            results[url] = self.probe(url)
+
+        threads = []
+        for url in set(urls):
+            t = threading.Thread(target=run, args=(url,))
+            t.setDaemon(True)
+            t.start()
+            threads.append(t)
+
+        deadline = time.time() + timeout
+        for t in threads:
+            t.join(max(0, deadline - time.time()))
+
+        return dict(results)
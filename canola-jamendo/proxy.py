@@ -0,0 +1,411 @@
+# Canola2 Jamendo Plugin
+# Authors: Vincent Lark <vincent.lark@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Additional permission under GNU GPL version 3 section 7
+#
+# If you modify this Program, or any covered work, by linking or combining it
+# with Canola2 and its core components (or a modified version of any of those),
+# containing parts covered by the terms of Instituto Nokia de Tecnologia End
+# User Software Agreement, the licensors of this Program grant you additional
+# permission to convey the resulting work.
+
+"""Local HTTP proxy sharing one download between player and cache.
+
+The player is given a 127.0.0.1 url instead of the remote one. The
+proxy fetches the track once, writing it to a file as it arrives, and
+serves that file to the player connections, waiting for the bytes not
+received yet. Seeking inside (or just ahead of) the received part is
+served from the file; seeking further away is passed through to the
+server with a range request. Once the whole track is received it is
+handed over to the caller, usually to be stored in the track cache.
+"""
+
+import os
+import re
+import time
+import socket
+import struct
+import urllib2
+import logging
+import threading
+from SocketServer import ThreadingMixIn
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+
+from terra.core.threaded_func import ThreadedFunction
+
+
+log = logging.getLogger("plugins.canola-jamendo.proxy")
+
+STREAM_CHUNK = 16384
+STREAM_TIMEOUT = 30 # give up on a stalled upstream after 30 seconds
+STREAM_SEEK_AHEAD = 256 * 1024 # wait for seeks up to 256KB ahead
+
+
+class StreamError(Exception):
+    pass
+
+
+class TeeStream(object):
+    """Download of url into path readable while it goes on."""
+
+    def __init__(self, url, path, opener, stats=None):
+        self.url = url
+        self.path = path
+        self.opener = opener
+        self.stats = stats
+        self.length = None
+        self.content_type = "audio/mpeg"
+        self.received = 0
+        self.finished = False
+        self.error = None
+        self.cancelled = False
+        self._ready = False
+        self._cond = threading.Condition()
+
+    def cancel(self):
+        self._cond.acquire()
+        try:
+            self.cancelled = True
+            self._cond.notifyAll()
+        finally:
+            self._cond.release()
+
+    def _update(self, **kargs):
+        self._cond.acquire()
+        try:
+            self.__dict__.update(kargs)
+            self._cond.notifyAll()
+        finally:
+            self._cond.release()
+
+    def run(self):
+        """Download the stream, blocking. Return its path."""
+        measure = self.stats and self.stats.measure("stream")
+        response = fd = None
+        try:
+            try:
+                response = self.opener.open(self.url, timeout=STREAM_TIMEOUT)
+                info = response.info()
+                length = info.get("Content-Length")
+                fd = open(self.path, "wb")
+                self._update(_ready=True,
+                             length=length and int(length) or None,
+                             content_type=info.get("Content-Type",
+                                                   self.content_type))
+
+                while not self.cancelled:
+                    data = response.read(STREAM_CHUNK)
+                    if not data:
+                        break
+                    fd.write(data)
+                    fd.flush()
+                    self._update(received=self.received + len(data))
+
+                if self.cancelled:
+                    raise StreamError("stream cancelled")
+                if self.length is not None and self.received != self.length:
+                    raise StreamError("stream truncated at %d bytes" % \
+                                          self.received)
+            except Exception, e:
+                if measure:
+                    measure.failed(e)
+                if fd is not None:
+                    fd.close()
+                    fd = None
+                    os.unlink(self.path)
+                self._update(finished=True, error=e)
+                raise
+        finally:
+            if fd is not None:
+                fd.close()
+            if response is not None:
+                response.close()
+
+        if measure:
+            measure.done(self.received)
+        self._update(finished=True)
+        return self.path
+
+    def open(self):
+        """Wait for the download to start and return a file reading
+        it, None if it failed or did not start within STREAM_TIMEOUT.
+        The file stays readable after the download is moved away."""
+        deadline = time.time() + STREAM_TIMEOUT
+        self._cond.acquire()
+        try:
+            while not self._ready and not self.finished and \
+                    not self.cancelled:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    log.error("no answer from %s" % self.url)
+                    return None
+                self._cond.wait(remaining)
+            # a failed download removed the file
+            if not self._ready or self.error is not None:
+                return None
+            return open(self.path, "rb")
+        finally:
+            self._cond.release()
+
+    def wait(self, offset):
+        """Wait until bytes after offset are received and return how
+        many are available, 0 at the end of the stream. Raise
+        StreamError if the download failed or stalled before."""
+        self._cond.acquire()
+        try:
+            while self.received <= offset and not self.finished and \
+                    not self.cancelled:
+                received = self.received
+                self._cond.wait(STREAM_TIMEOUT)
+                if self.received == received and not self.finished:
+                    raise StreamError("stream stalled at %d bytes" % \
+                                          received)
+            if self.received <= offset and self.error is not None:
+                raise StreamError(str(self.error))
+            return max(0, self.received - offset)
+        finally:
+            self._cond.release()
+
+
+class StreamHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.0"
+
+    def log_message(self, format, *args):
+        log.debug("proxy: " + format % args)
+
+    def _parse_range(self, length):
+        match = re.match(r"bytes=(\d+)-(\d*)$", self.headers.get("Range", ""))
+        if not match or length is None:
+            return None
+        start = int(match.group(1))
+        end = length - 1
+        if match.group(2):
+            end = min(end, int(match.group(2)))
+        return start, end
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        stream = self.server.proxy.get_stream(self.path)
+        if stream is None:
+            self.send_error(404)
+            return
+
+        reader = stream.open()
+        if reader is None:
+            self.send_error(502)
+            return
+
+        try:
+            length = stream.length
+            byte_range = self._parse_range(length)
+            if byte_range is None:
+                start, end = 0, length is not None and length - 1 or None
+            else:
+                start, end = byte_range
+                if start > end:
+                    self.send_response(416)
+                    self.send_header("Content-Range", "bytes */%d" % length)
+                    self.end_headers()
+                    return
+                if start > stream.received + STREAM_SEEK_AHEAD:
+                    self._passthrough(stream, start, end)
+                    return
+
+            if byte_range is None:
+                self.send_response(200)
+            else:
+                self.send_response(206)
+                self.send_header("Content-Range",
+                                 "bytes %d-%d/%d" % (start, end, length))
+            self.send_header("Content-Type", stream.content_type)
+            if length is not None:
+                self.send_header("Accept-Ranges", "bytes")
+                self.send_header("Content-Length", str(end - start + 1))
+            self.end_headers()
+            if self.command == "HEAD":
+                return
+
+            self._copy(stream, reader, start, end)
+        finally:
+            reader.close()
+
+    def _abort(self):
+        """Reset the player connection when closed, so that a failed
+        stream is an error to the player instead of the end of the
+        track (the length may be unknown)."""
+        self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER,
+                                   struct.pack("ii", 1, 0))
+        self.server.aborted.add(self.connection)
+
+    def _copy(self, stream, reader, offset, end):
+        reader.seek(offset)
+        while end is None or offset <= end:
+            try:
+                available = stream.wait(offset)
+            except StreamError, e:
+                log.error("aborting %s: %s" % (stream.url, e))
+                self._abort()
+                break
+            if not available:
+                break
+            size = min(available, STREAM_CHUNK)
+            if end is not None:
+                size = min(size, end + 1 - offset)
+            data = reader.read(size)
+            if not data:
+                break
+            try:
+                self.wfile.write(data)
+            except socket.error:
+                break # player went away
+            offset += len(data)
+
+    def _passthrough(self, stream, start, end):
+        """Serve a range far from the received part directly from
+        the server, without caching it."""
+        req = urllib2.Request(stream.url)
+        req.add_header("Range", "bytes=%d-%d" % (start, end))
+        try:
+            response = self.server.proxy.opener.open(req,
+                                                     timeout=STREAM_TIMEOUT)
+        except Exception, e:
+            log.error("unable to seek in %s: %s" % (stream.url, e))
+            self.send_error(502)
+            return
+
+        try:
+            self.send_response(response.code)
+            for name in ("Content-Type", "Content-Length", "Content-Range"):
+                if response.info().get(name):
+                    self.send_header(name, response.info()[name])
+            self.end_headers()
+            if self.command == "HEAD":
+                return
+
+            data = response.read(STREAM_CHUNK)
+            while data:
+                try:
+                    self.wfile.write(data)
+                except socket.error:
+                    break
+                data = response.read(STREAM_CHUNK)
+        finally:
+            response.close()
+
+
+class StreamServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, proxy):
+        HTTPServer.__init__(self, ("127.0.0.1", 0), StreamHandler)
+        self.proxy = proxy
+        self.aborted = set() # connections to reset instead of closing
+
+    def shutdown_request(self, request):
+        # python 2.7 shuts the socket down before closing it, which
+        # the player would take for the end of the track
+        if request in self.aborted:
+            self.aborted.discard(request)
+            self.close_request(request)
+        else:
+            HTTPServer.shutdown_request(self, request)
+
+
+class StreamProxy(object):
+    """Serves TeeStreams to the player on a local port, started with
+    the first stream.
+
+    Usage::
+
+        def finished(exception, path):
+            ...
+            return new_path # where path was moved, if it was
+
+        uri = proxy.stream(remote_uri, path, finished)
+    """
+
+    def __init__(self, opener=None, stats=None):
+        self.opener = opener or urllib2.build_opener()
+        self.stats = stats
+        self._server = None
+        self._streams = {}
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def _start(self):
+        self._server = StreamServer(self)
+        thread = threading.Thread(target=self._server.serve_forever)
+        thread.setDaemon(True)
+        thread.start()
+
+    def get_stream(self, path):
+        self._lock.acquire()
+        try:
+            return self._streams.get(path)
+        finally:
+            self._lock.release()
+
+    def stream(self, url, path, end_callback=None):
+        """Start streaming url into path and return the local url the
+        player reads it from.
+
+        Only one track plays at a time, so unfinished streams are
+        cancelled. end_callback(exception, path) is called from the
+        main loop once the download ends; if it moves the file it
+        returns the new path, which is served from then on.
+        """
+        if self._server is None:
+            self._start()
+
+        self.cancel_streams()
+        self._count += 1
+        local_path = "/%d.mp3" % self._count
+        stream = TeeStream(url, path, self.opener, self.stats)
+
+        def finished(exception, retval):
+            if not end_callback:
+                return
+            # readers must not open the file while it is moved
+            stream._cond.acquire()
+            try:
+                new_path = end_callback(exception, retval)
+                if new_path:
+                    stream.path = new_path
+            finally:
+                stream._cond.release()
+
+        self._lock.acquire()
+        try:
+            self._streams[local_path] = stream
+        finally:
+            self._lock.release()
+
+        ThreadedFunction(finished, stream.run).start()
+        return "http://127.0.0.1:%d%s" % (self._server.server_address[1],
+                                         local_path)
+
+    def cancel_streams(self):
+        """Cancel unfinished streams and forget all of them."""
+        self._lock.acquire()
+        try:
+            for stream in self._streams.itervalues():
+                if not stream.finished:
+                    stream.cancel()
+            self._streams.clear()
+        finally:
+            self._lock.release()
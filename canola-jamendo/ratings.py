@@ -0,0 +1,125 @@
+# Canola2 Jamendo Plugin
+# Authors: Vincent Lark <vincent.lark@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Additional permission under GNU GPL version 3 section 7
+#
+# If you modify this Program, or any covered work, by linking or combining it
+# with Canola2 and its core components (or a modified version of any of those),
+# containing parts covered by the terms of Instituto Nokia de Tecnologia End
+# User Software Agreement, the licensors of this Program grant you additional
+# permission to convey the resulting work.
+
+"""Love/ban actions queued in the preferences until sent.
+
+Ratings are not sent one by one: they are saved, merged (the last
+action on a track wins) and sent in a single XML-RPC multicall a few
+seconds after the last one, so rating several tracks costs one
+request. Actions that could not be sent because of network errors
+stay saved and are retried later, waiting longer after each failure,
+also after a restart. Ratings the server answers with a fault are
+dropped.
+"""
+
+import ecore
+import logging
+import xmlrpclib
+
+from terra.core.threaded_func import ThreadedFunction
+
+
+log = logging.getLogger("plugins.canola-jamendo.ratings")
+
+RATINGS_FLUSH_DELAY = 5 # seconds waiting for more ratings before sending
+RATINGS_RETRY_DELAY = 300 # seconds before sending again after a failure
+RATINGS_RETRY_MAX = 6 * 3600 # the delay doubles up to 6 hours
+
+
+class RatingQueue(object):
+    """Pending ratings of a client, kept in prefs[key] as a list of
+    [action, artist, title] with action "love" or "ban"."""
+
+    def __init__(self, client, prefs, key="pending_ratings"):
+        self.client = client
+        self.prefs = prefs
+        self.key = key
+        self._timer = None
+        self._sending = False
+        self._retry_delay = RATINGS_RETRY_DELAY
+
+    def _get_pending(self):
+        return self.prefs.get(self.key, [])
+
+    pending = property(_get_pending)
+
+    def add(self, action, artist, title):
+        """Queue a rating, replacing a previous one of the same track."""
+        artist, title = artist or "", title or ""
+        track = (artist.lower(), title.lower())
+        pending = [p for p in self.pending
+                   if (p[1].lower(), p[2].lower()) != track]
+        pending.append([action, artist, title])
+        self.prefs[self.key] = pending
+        self.prefs.save()
+        self.schedule(RATINGS_FLUSH_DELAY)
+
+    def schedule(self, delay):
+        """Send pending ratings after delay seconds."""
+        if self._timer is not None:
+            self._timer.delete()
+
+        def cb_flush():
+            self._timer = None
+            self.flush()
+            return False
+
+        self._timer = ecore.timer_add(delay, cb_flush)
+
+    def flush(self):
+        """Send pending ratings now, in background."""
+        batch = self.pending
+        if self._sending or not batch:
+            return
+
+        def flush_finished(exception, retval):
+            self._sending = False
+            if isinstance(exception, xmlrpclib.Fault):
+                # sending the same batch again would get the same fault
+                log.error("dropping %d ratings refused by the server: %s" % \
+                              (len(batch), exception))
+            elif exception is not None:
+                log.error("unable to send %d ratings, retrying in %ds: %s" % \
+                              (len(batch), self._retry_delay, exception))
+                self.schedule(self._retry_delay)
+                self._retry_delay = min(self._retry_delay * 2,
+                                        RATINGS_RETRY_MAX)
+                return
+            else:
+                for rating, ok in zip(batch, retval):
+                    if not ok:
+                        log.error("rating refused: %s" % str(rating))
+
+            self._retry_delay = RATINGS_RETRY_DELAY
+            # ratings added while sending are kept
+            self.prefs[self.key] = [p for p in self.pending
+                                    if p not in batch]
+            self.prefs.save()
+            if self.pending:
+                self.schedule(RATINGS_FLUSH_DELAY)
+
+        log.warning("sending %d ratings" % len(batch))
+        self._sending = True
+        ThreadedFunction(flush_finished, self.client.rate_tracks,
+                         [tuple(p) for p in batch]).start()
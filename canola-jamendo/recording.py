@@ -0,0 +1,163 @@
+# Canola2 Jamendo Plugin
+# Authors: Vincent Lark <vincent.lark@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Additional permission under GNU GPL version 3 section 7
+#
+# If you modify this Program, or any covered work, by linking or combining it
+# with Canola2 and its core components (or a modified version of any of those),
+# containing parts covered by the terms of Instituto Nokia de Tecnologia End
+# User Software Agreement, the licensors of this Program grant you additional
+# permission to convey the resulting work.
+
+"""Record and replay of the client network traffic.
+
+A Recorder set on a Client (Client.set_recorder) keeps every HTTP and
+XML-RPC exchange with its timing; saved, it makes a small gzipped
+JSON fixture archive. A Replayer loaded from that archive
+(Client.set_replayer) answers the same requests without network, with
+the recorded delays multiplied by scale (0 answers at once), so that
+performance tests run deterministically offline.
+
+Requests are matched by kind, url path and query (without the host
+and the parameters changing on every run such as session ids and
+tokens, credentials) or XML-RPC method names; repeated requests are
+answered in the recorded order.
+"""
+
+import cgi
+import gzip
+import time
+import urllib
+import xmlrpclib
+import threading
+from urlparse import urlparse
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+
+ARCHIVE_VERSION = 1
+VOLATILE_PARAMS = ("a", "t", "s", "sk", "session", "passwordmd5")
+
+
+class ReplayError(Exception):
+    pass
+
+
+def request_key(kind, url, body=None):
+    """Return the key matching a request with its recording."""
+    if kind == "rpc":
+        params, method = xmlrpclib.loads(body)
+        if method == "system.multicall":
+            method += ":" + ",".join([c["methodName"] for c in params[0]])
+        return "rpc " + method
+
+    parts = urlparse(url)
+    params = cgi.parse_qsl(parts[4])
+    params = [(k, v) for k, v in params if k not in VOLATILE_PARAMS]
+    params.sort()
+    key = "%s %s" % (kind, parts[2])
+    if params:
+        key += "?" + urllib.urlencode(params)
+    return key
+
+
+class Recorder(object):
+    def __init__(self, meta=None):
+        self.meta = meta or {}
+        self.entries = []
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    def record(self, kind, url, body, data, elapsed, error=None):
+        """Record an exchange.
+
+        @parm kind: "http" or "rpc".
+        @parm url: requested url.
+        @parm body: request body or None.
+        @parm data: response content (marshalled response for rpc).
+        @parm elapsed: seconds the request took.
+        @parm error: error message if the request failed.
+        """
+        entry = [request_key(kind, url, body),
+                 round(time.time() - self.started - elapsed, 4),
+                 round(elapsed, 4), error,
+                 (data or "").decode("latin-1")]
+        self._lock.acquire()
+        try:
+            self.entries.append(entry)
+        finally:
+            self._lock.release()
+
+    def save(self, path):
+        fd = gzip.open(path, "wb")
+        try:
+            json.dump({"version": ARCHIVE_VERSION, "meta": self.meta,
+                       "entries": self.entries}, fd, separators=(",", ":"))
+        finally:
+            fd.close()
+
+
+class Replayer(object):
+    """Answers requests from recorded entries.
+
+    @parm scale: factor applied to the recorded delays.
+    """
+
+    def __init__(self, entries, meta=None, scale=1.0):
+        self.meta = meta or {}
+        self.scale = scale
+        self._pending = {}
+        for entry in entries:
+            self._pending.setdefault(entry[0], []).append(entry)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path, scale=1.0):
+        fd = gzip.open(path, "rb")
+        try:
+            archive = json.load(fd)
+        finally:
+            fd.close()
+        if archive.get("version") != ARCHIVE_VERSION:
+            raise ReplayError("unsupported archive version %s" % \
+                                  archive.get("version"))
+        return cls(archive["entries"], archive.get("meta"), scale)
+
+    def remaining(self):
+        return sum([len(v) for v in self._pending.itervalues()])
+
+    def replay(self, kind, url, body=None):
+        """Return the recorded response of a request, after its
+        scaled delay. Recorded failures raise IOError."""
+        key = request_key(kind, url, body)
+        self._lock.acquire()
+        try:
+            entries = self._pending.get(key)
+            if not entries:
+                raise ReplayError("no recorded answer for %s" % key)
+            entry = entries.pop(0)
+        finally:
+            self._lock.release()
+
+        key, offset, elapsed, error, data = entry
+        if self.scale:
+            time.sleep(elapsed * self.scale)
+        if error is not None:
+            raise IOError(error)
+        return data.encode("latin-1")
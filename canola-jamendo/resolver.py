@@ -0,0 +1,230 @@
+# Canola2 Jamendo Plugin
+# Authors: Vincent Lark <vincent.lark@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Additional permission under GNU GPL version 3 section 7
+#
+# If you modify this Program, or any covered work, by linking or combining it
+# with Canola2 and its core components (or a modified version of any of those),
+# containing parts covered by the terms of Instituto Nokia de Tecnologia End
+# User Software Agreement, the licensors of this Program grant you additional
+# permission to convey the resulting work.
+
+"""Caching name resolution for the plugin http connections.
+
+Answers of getaddrinfo are kept for DNS_TTL seconds. When a refresh
+fails the last good answer is served for up to DNS_STALE_TTL seconds
+instead of failing the request. Connections to hosts with several
+addresses race them (alternating address families, each attempt
+started CONNECT_STAGGER seconds after the previous one) and keep the
+first socket that connects.
+"""
+
+import time
+import socket
+import httplib
+import urllib2
+import logging
+import threading
+
+log = logging.getLogger("plugins.canola-jamendo.resolver")
+
+DNS_TTL = 300 # getaddrinfo does not expose record ttls
+DNS_STALE_TTL = 24 * 3600
+CONNECT_STAGGER = 0.25
+DNS_SAVED_HOSTS = 20 # hosts resolved ahead on the next start
+
+KNOWN_HOSTS = ("post.audioscrobbler.com", "ws.audioscrobbler.com")
+
+
+class Resolver(object):
+    def __init__(self, ttl=DNS_TTL, stale_ttl=DNS_STALE_TTL):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._cache = {} # (host, port) -> (resolved time, addrinfo list)
+        self._lock = threading.Lock()
+
+    def _lookup(self, host, port):
+        return socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+
+    def getaddrinfo(self, host, port):
+        key = (host, port)
+        entry = self._cache.get(key)
+        now = time.time()
+        if entry is not None and now - entry[0] < self.ttl:
+            return entry[1]
+
+        try:
+            infos = self._lookup(host, port)
+        except socket.error, e:
+            if entry is not None and now - entry[0] < self.stale_ttl:
+                log.warning("unable to resolve %s (%s), using last "
+                            "known addresses" % (host, e))
+                return entry[1]
+            raise
+
+        self._lock.acquire()
+        try:
+            # drop answers too old to be served, even as stale ones
+            for k, v in self._cache.items():
+                if now - v[0] >= self.stale_ttl:
+                    del self._cache[k]
+            self._cache[key] = (now, infos)
+        finally:
+            self._lock.release()
+        return infos
+
+    def prefetch(self, hosts, port=80):
+        """Resolve hosts ahead of their first request."""
+        for host in hosts:
+            try:
+                self.getaddrinfo(host, port)
+            except socket.error, e:
+                log.warning("unable to prefetch %s: %s" % (host, e))
+
+    def get_hosts(self, limit=DNS_SAVED_HOSTS):
+        """Return up to limit hosts, most recently resolved first."""
+        entries = sorted(self._cache.items(), key=lambda i: -i[1][0])
+        hosts = []
+        for (host, port), entry in entries:
+            if host not in hosts:
+                hosts.append(host)
+        return hosts[:limit]
+
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self._cache = {}
+        finally:
+            self._lock.release()
+
+
+resolver = Resolver()
+
+
+def _interleave(infos):
+    """Alternate address families, first family first."""
+    families = []
+    by_family = {}
+    for info in infos:
+        if info[0] not in by_family:
+            families.append(info[0])
+            by_family[info[0]] = []
+        by_family[info[0]].append(info)
+
+    lst = []
+    while by_family:
+        for family in families:
+            if by_family.get(family):
+                lst.append(by_family[family].pop(0))
+            if family in by_family and not by_family[family]:
+                del by_family[family]
+    return lst
+
+
+def _connect(info, timeout, source_address=None):
+    family, socktype, proto, canonname, address = info
+    sock = socket.socket(family, socktype, proto)
+    if isinstance(timeout, (int, float)):
+        sock.settimeout(timeout)
+    try:
+        if source_address:
+            sock.bind(source_address)
+        sock.connect(address)
+    except:
+        sock.close()
+        raise
+    return sock
+
+
+def create_connection(address, timeout=None, source_address=None):
+    """Return a socket connected to (host, port) using the cached
+    resolver, racing the addresses of multi-address hosts.
+
+    @parm source_address: (host, port) to bind the socket to.
+    """
+    host, port = address
+    infos = _interleave(resolver.getaddrinfo(host, port))
+    if len(infos) == 1:
+        return _connect(infos[0], timeout, source_address)
+
+    cond = threading.Condition()
+    state = {"sock": None, "error": None, "pending": len(infos)}
+
+    def attempt(info):
+        try:
+            sock = _connect(info, timeout, source_address)
+        except Exception, e:
+            # any failure must be counted or the caller waits forever
+            sock = None
+            error = e
+
+        cond.acquire()
+        try:
+            state["pending"] -= 1
+            if sock is None:
+                state["error"] = error
+            elif state["sock"] is None:
+                state["sock"] = sock
+                sock = None
+            cond.notifyAll()
+        finally:
+            cond.release()
+
+        if sock is not None:
+            sock.close() # lost the race
+
+    cond.acquire()
+    try:
+        for info in infos:
+            if state["sock"] is not None:
+                break
+            t = threading.Thread(target=attempt, args=(info,))
+            t.setDaemon(True)
+            t.start()
+            cond.wait(CONNECT_STAGGER)
+
+        while state["sock"] is None and state["pending"] > 0:
+            cond.wait()
+    finally:
+        cond.release()
+
+    if state["sock"] is None:
+        raise state["error"] or socket.error("unable to connect to %s" % host)
+    return state["sock"]
+
+
+class CachedHTTPConnection(httplib.HTTPConnection):
+    """HTTPConnection resolving through the plugin resolver. Same as
+    httplib.HTTPConnection.connect otherwise: source_address and the
+    CONNECT tunnel of python 2.7 are kept."""
+
+    def connect(self):
+        self.sock = create_connection((self.host, self.port),
+                                      getattr(self, "timeout", None),
+                                      getattr(self, "source_address", None))
+        if getattr(self, "_tunnel_host", None):
+            self._tunnel()
+
+
+class CachedHTTP(httplib.HTTP):
+    """httplib.HTTP resolving through the plugin resolver, used by
+    xmlrpclib before python 2.7."""
+    _connection_class = CachedHTTPConnection
+
+
+class CachedHTTPHandler(urllib2.HTTPHandler):
+    def http_open(self, req):
+        return self.do_open(CachedHTTPConnection, req)
@@ -0,0 +1,352 @@
+# Canola2 Jamendo Plugin
+# Authors: Vincent Lark <vincent.lark@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Additional permission under GNU GPL version 3 section 7
+#
+# If you modify this Program, or any covered work, by linking or combining it
+# with Canola2 and its core components (or a modified version of any of those),
+# containing parts covered by the terms of Instituto Nokia de Tecnologia End
+# User Software Agreement, the licensors of this Program grant you additional
+# permission to convey the resulting work.
+
+"""Similar artists computed locally from the listening history.
+
+Each artist is described by a sparse vector of features: the tag,
+group and similar-artist stations its tracks were played on and its
+listeners -- the user, through scrobbles, and the users whose personal
+stations played it. Features are weighted by play count times inverse
+artist frequency, so that the ones shared by every artist count
+little, and artists are ranked by the cosine of their vectors.
+
+Vectors and the played tracks of each artist are kept in canola_db
+and updated as tracks play, so that a similar-artist station can be
+assembled without asking the server: tracks of the artist and of its
+nearest neighbours that are in the track cache. Stream urls are good
+for one use and these tracks have all been played, so their urls are
+not kept.
+
+Scores are computed over an inverted index of the features, touching
+only artists sharing one with the query; if numpy is available the
+normalized artist matrix is built once per change and queried with a
+single product.
+"""
+
+import re
+import math
+import time
+import heapq
+import threading
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from terra.utils.encoding import to_utf8
+
+from client import Track, Album, Artist
+from suggest import normalize_query
+
+SIMILAR_TOP_K = 10 # neighbours of the artist put in a local station
+SIMILAR_MIN_TRACKS = 5 # fewer playable tracks go to the server instead
+SIMILAR_STATION_TRACKS = 20 # tracks in a local station
+SIMILAR_MAX_TRACKS = 20 # tracks kept per artist
+
+_station_features = [
+    (re.compile(r"^lastfm://globaltags/(.+)$"), "tag:"),
+    (re.compile(r"^lastfm://group/(.+)$"), "group:"),
+    (re.compile(r"^lastfm://user/(.+)/personal$"), "user:"),
+    (re.compile(r"^lastfm://artist/(.+?)(/similarartists)?$"), "artist:"),
+]
+
+
+def station_feature(url):
+    """Return the feature of the artists played on a station, None if
+    it tells nothing about them."""
+    for regexp, prefix in _station_features:
+        match = regexp.match(url or "")
+        if match:
+            return prefix + normalize_query(match.group(1))
+    return None
+
+
+def listener_feature(username):
+    return "user:" + normalize_query(username)
+
+
+class SimilarArtists(object):
+    """Artist vectors and tracks, kept in memory and in db.
+
+    Updated from the main loop, queried from any thread.
+    """
+    stmt_create_features = """CREATE TABLE IF NOT EXISTS jamendo_artist_features
+                              (
+                                 artist   VARCHAR,
+                                 feature  VARCHAR,
+                                 weight   REAL,
+                                 primary key(artist, feature)
+                              )"""
+
+    stmt_create_tracks = """CREATE TABLE IF NOT EXISTS jamendo_artist_tracks
+                            (
+                               artist    VARCHAR,
+                               title     VARCHAR,
+                               performer VARCHAR,
+                               name      VARCHAR,
+                               mbid      VARCHAR,
+                               album     VARCHAR,
+                               location  VARCHAR,
+                               duration  INTEGER,
+                               image     VARCHAR,
+                               expires   REAL,
+                               seen      REAL,
+                               primary key(artist, title)
+                            )"""
+
+    stmt_select_features = """SELECT artist, feature, weight
+                              FROM jamendo_artist_features"""
+
+    stmt_insert_feature = """INSERT INTO jamendo_artist_features
+                             (artist, feature, weight) VALUES (?, ?, ?)"""
+
+    stmt_update_feature = """UPDATE jamendo_artist_features SET weight = ?
+                             WHERE artist = ? AND feature = ?"""
+
+    stmt_select_tracks = """SELECT artist, title, performer, name, mbid,
+                                   album, location, duration, image, expires
+                            FROM jamendo_artist_tracks
+                            ORDER BY seen"""
+
+    stmt_delete_track = """DELETE FROM jamendo_artist_tracks
+                           WHERE artist = ? AND title = ?"""
+
+    stmt_insert_track = """INSERT INTO jamendo_artist_tracks
+                           (artist, title, performer, name, mbid, album,
+                            location, duration, image, expires, seen)
+                           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"""
+
+    def __init__(self, db, max_tracks=SIMILAR_MAX_TRACKS):
+        self.db = db
+        self.max_tracks = max_tracks
+        self._vectors = {} # artist -> {feature: plays}
+        self._index = {} # feature -> {artist: plays}
+        self._names = {} # artist -> name as played
+        # artist -> rows of jamendo_artist_tracks from title on (tuples
+        # take less memory than Tracks), least recently played first
+        self._tracks = {}
+        self._dense = None
+        self._lock = threading.Lock()
+
+        self.db.execute(self.stmt_create_features)
+        self.db.execute(self.stmt_create_tracks)
+        self._load()
+
+    def _load(self):
+        for artist, feature, weight in self.db.execute(
+            self.stmt_select_features) or ():
+            self._add(artist, feature, weight)
+
+        for row in self.db.execute(self.stmt_select_tracks) or ():
+            self._names[row[0]] = row[2]
+            self._tracks.setdefault(row[0], []).append(tuple(row[1:]))
+
+    def _make_track(self, row):
+        title, performer, name, mbid, album, location, duration, \
+            image, expires = row
+        # sqlite hands back unicode, keep utf-8 like the client (track_key)
+        track = Track(to_utf8(name), mbid)
+        track.artist = Artist(to_utf8(performer))
+        track.album = Album(to_utf8(album))
+        track.url = None # used, older databases may still have it
+        track.duration = duration
+        track.image = image
+        track.expires = expires
+        return track
+
+    def _add(self, artist, feature, weight):
+        vector = self._vectors.setdefault(artist, {})
+        vector[feature] = vector.get(feature, 0) + weight
+        self._index.setdefault(feature, {})[artist] = vector[feature]
+        self._names.setdefault(artist, artist)
+        self._dense = None
+        return vector[feature]
+
+    def __len__(self):
+        return len(self._vectors)
+
+    def observe(self, artist, features):
+        """Count one play of artist with each of features."""
+        if not artist:
+            return
+        key = normalize_query(artist)
+
+        self._lock.acquire()
+        try:
+            # names as played win over the lowercase ones of queries
+            if artist != key or key not in self._names:
+                self._names[key] = artist
+            weights = [(f, self._add(key, f, 1)) for f in features if f]
+        finally:
+            self._lock.release()
+
+        for feature, weight in weights:
+            if weight == 1:
+                self.db.execute(self.stmt_insert_feature,
+                                (key, feature, weight))
+            else:
+                self.db.execute(self.stmt_update_feature,
+                                (weight, key, feature))
+
+    def observe_play(self, track, station_url):
+        """Record a track played on a station."""
+        artist = track.artist and track.artist.name
+        if not artist:
+            return
+        feature = station_feature(station_url)
+        features = [feature]
+        if feature and feature.startswith("artist:"):
+            # the seed of a similar-artist station shares its feature
+            self.observe(feature[len("artist:"):], features)
+        self.observe(artist, features)
+        self._store_track(normalize_query(artist), track)
+
+    def observe_scrobble(self, artist, username):
+        """Record a track of artist listened to by username."""
+        if username:
+            self.observe(artist, [listener_feature(username)])
+
+    def _store_track(self, key, track):
+        title = normalize_query(track.name or "")
+        # the stream url was used when the track was streamed or cached
+        row = (title, track.artist.name, track.name, track.mbid,
+               track.album and track.album.name, None,
+               getattr(track, "duration", 0), track.image, track.expires)
+        self._lock.acquire()
+        try:
+            lst = [r for r in self._tracks.get(key, ()) if r[0] != title]
+            lst.append(row)
+            dropped = lst[:-self.max_tracks]
+            self._tracks[key] = lst[-self.max_tracks:]
+        finally:
+            self._lock.release()
+
+        self.db.execute(self.stmt_delete_track, (key, title))
+        for old in dropped:
+            self.db.execute(self.stmt_delete_track, (key, old[0]))
+        self.db.execute(self.stmt_insert_track,
+                        (key, ) + row + (time.time(), ))
+
+    def _idf(self, feature, count):
+        return math.log(1.0 + float(count) / len(self._index[feature]))
+
+    def _weights(self, artist, count):
+        return dict((f, w * self._idf(f, count))
+                    for f, w in self._vectors[artist].iteritems())
+
+    def _norm(self, weights):
+        return math.sqrt(sum(w * w for w in weights.itervalues()))
+
+    def _similar_sparse(self, key, k):
+        count = len(self._vectors)
+        query = self._weights(key, count)
+        scores = {}
+        for feature, weight in query.iteritems():
+            idf = self._idf(feature, count)
+            for other, plays in self._index[feature].iteritems():
+                if other != key:
+                    scores[other] = scores.get(other, 0) + \
+                        weight * plays * idf
+
+        qnorm = self._norm(query)
+        lst = [(score / (qnorm * self._norm(self._weights(other, count))),
+                other) for other, score in scores.iteritems()]
+        return heapq.nlargest(k, lst)
+
+    def _get_dense(self):
+        if self._dense is None:
+            artists = sorted(self._vectors)
+            features = dict((f, i) for i, f in enumerate(self._index))
+            count = len(artists)
+            idf = numpy.zeros(len(features))
+            for feature, i in features.iteritems():
+                idf[i] = self._idf(feature, count)
+
+            matrix = numpy.zeros((count, len(features)))
+            for row, artist in enumerate(artists):
+                for feature, plays in self._vectors[artist].iteritems():
+                    matrix[row, features[feature]] = plays
+            matrix *= idf
+            norms = numpy.sqrt((matrix * matrix).sum(1))
+            norms[norms == 0] = 1
+            matrix /= norms[:, numpy.newaxis]
+            rows = dict((artist, i) for i, artist in enumerate(artists))
+            self._dense = (artists, rows, matrix)
+        return self._dense
+
+    def _similar_dense(self, key, k):
+        artists, rows, matrix = self._get_dense()
+        row = rows[key]
+        scores = matrix.dot(matrix[row])
+        scores[row] = 0
+        lst = [(scores[i], artists[i])
+               for i in numpy.argsort(-scores)[:k] if scores[i] > 0]
+        return lst
+
+    def similar(self, artist, k=SIMILAR_TOP_K):
+        """Return up to k (score, name) of the artists most similar to
+        artist, best first; score is a cosine between 0 and 1."""
+        key = normalize_query(artist)
+        self._lock.acquire()
+        try:
+            if key not in self._vectors:
+                return []
+            if numpy is not None:
+                lst = self._similar_dense(key, k)
+            else:
+                lst = self._similar_sparse(key, k)
+            return [(float(score), self._names[other])
+                    for score, other in lst]
+        finally:
+            self._lock.release()
+
+    def get_station_tracks(self, artist, playable, k=SIMILAR_TOP_K,
+                           count=SIMILAR_STATION_TRACKS):
+        """Return up to count tracks of artist and its k most similar
+        artists, taking turns between artists, the most similar first.
+
+        @parm playable: function telling whether a track can be played.
+        """
+        artists = [artist] + [name for score, name in self.similar(artist, k)]
+
+        self._lock.acquire()
+        try:
+            queues = []
+            for name in artists:
+                lst = [self._make_track(r)
+                       for r in self._tracks.get(normalize_query(name), ())]
+                lst = [t for t in lst if playable(t)]
+                lst.reverse() # least recently played first out
+                if lst:
+                    queues.append(lst)
+        finally:
+            self._lock.release()
+
+        tracks = []
+        while queues and len(tracks) < count:
+            for lst in queues:
+                tracks.append(lst.pop())
+            queues = [lst for lst in queues if lst]
+        return tracks[:count]
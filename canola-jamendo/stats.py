@@ -0,0 +1,182 @@
+# Canola2 Jamendo Plugin
+# Authors: Vincent Lark <vincent.lark@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Additional permission under GNU GPL version 3 section 7
+#
+# If you modify this Program, or any covered work, by linking or combining it
+# with Canola2 and its core components (or a modified version of any of those),
+# containing parts covered by the terms of Instituto Nokia de Tecnologia End
+# User Software Agreement, the licensors of this Program grant you additional
+# permission to convey the resulting work.
+
+import os
+import time
+import threading
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+from bandwidth import ThroughputEstimator
+
+
+# latency bucket upper bounds in seconds, growing by 1.5 from 1ms to ~2min
+LATENCY_BUCKETS = [0.001 * 1.5 ** i for i in range(30)] + [float("inf")]
+
+
+class EndpointStats(object):
+    """Counters and latency histogram of one logical endpoint."""
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.errors = {}
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+
+    def add(self, elapsed, bytes_in=0, bytes_out=0, error=None):
+        self.count += 1
+        self.bytes_in += bytes_in
+        self.bytes_out += bytes_out
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+        if error is not None:
+            name = error.__class__.__name__
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if elapsed <= bound:
+                self.buckets[i] += 1
+                break
+
+    def percentile(self, p):
+        """Return the latency (seconds) below which p% of requests
+        finished, interpolated inside the histogram bucket."""
+        if not self.count:
+            return None
+
+        rank = self.count * p / 100.0
+        seen = 0
+        lower = 0.0
+        for i, n in enumerate(self.buckets):
+            upper = LATENCY_BUCKETS[i]
+            if n and seen + n >= rank:
+                upper = min(upper, self.max_time)
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+            lower = upper
+        return lower
+
+    def snapshot(self):
+        return {"count": self.count,
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+                "errors": dict(self.errors),
+                "mean": self.count and self.total_time / self.count or None,
+                "p50": self.percentile(50),
+                "p95": self.percentile(95),
+                "p99": self.percentile(99)}
+
+
+class Measure(object):
+    """Running request, see NetworkStats.measure."""
+
+    def __init__(self, stats, endpoint):
+        self.stats = stats
+        self.endpoint = endpoint
+        self.start = time.time()
+
+    def done(self, bytes_in=0, bytes_out=0):
+        self.stats.record(self.endpoint, time.time() - self.start,
+                          bytes_in, bytes_out)
+
+    def failed(self, error, bytes_out=0):
+        self.stats.record(self.endpoint, time.time() - self.start,
+                          0, bytes_out, error)
+
+
+class NetworkStats(object):
+    """Per endpoint network statistics (handshake, adjust, xspf, ...).
+
+    Usage::
+
+        m = stats.measure("xspf")
+        try:
+            data = fetch()
+        except Exception, e:
+            m.failed(e)
+            raise
+        m.done(len(data))
+    """
+
+    def __init__(self):
+        self._endpoints = {}
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.throughput = ThroughputEstimator()
+
+    def measure(self, endpoint):
+        return Measure(self, endpoint)
+
+    def record(self, endpoint, elapsed, bytes_in=0, bytes_out=0, error=None):
+        self._lock.acquire()
+        try:
+            ep = self._endpoints.get(endpoint)
+            if ep is None:
+                ep = self._endpoints[endpoint] = EndpointStats(endpoint)
+            ep.add(elapsed, bytes_in, bytes_out, error)
+        finally:
+            self._lock.release()
+
+        if error is None:
+            self.throughput.add_sample(bytes_in, elapsed)
+
+    def get(self, endpoint):
+        return self._endpoints.get(endpoint)
+
+    def snapshot(self):
+        """Return a dict of endpoint name to its counters."""
+        self._lock.acquire()
+        try:
+            return dict((name, ep.snapshot())
+                        for name, ep in self._endpoints.iteritems())
+        finally:
+            self._lock.release()
+
+    def reset(self):
+        self._lock.acquire()
+        try:
+            self._endpoints = {}
+            self.started = time.time()
+        finally:
+            self._lock.release()
+
+    def dump(self, path):
+        data = {"started": self.started,
+                "time": time.time(),
+                "throughput": self.throughput.estimate(),
+                "endpoints": self.snapshot()}
+        tmp = path + ".tmp"
+        fd = open(tmp, "w")
+        try:
+            json.dump(data, fd, indent=1, sort_keys=True)
+        finally:
+            fd.close()
+        os.rename(tmp, path)
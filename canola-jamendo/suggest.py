@@ -0,0 +1,218 @@
+# Canola2 Jamendo Plugin
+# Authors: Vincent Lark <vincent.lark@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Additional permission under GNU GPL version 3 section 7
+#
+# If you modify this Program, or any covered work, by linking or combining it
+# with Canola2 and its core components (or a modified version of any of those),
+# containing parts covered by the terms of Instituto Nokia de Tecnologia End
+# User Software Agreement, the licensors of this Program grant you additional
+# permission to convey the resulting work.
+
+import time
+import heapq
+from bisect import bisect_left
+
+SUGGEST_MAX_ENTRIES = 500 # keep 500 entries per prompt
+SUGGEST_HALF_LIFE = 7 * 24 * 3600 # weight of a use halves in a week
+SUGGEST_SHORT_PREFIX = 2 # rank prefixes up to 2 characters ahead
+SUGGEST_SHORT_TOP = 10 # values kept per short prefix
+SUGGEST_RANK_TTL = 3600 # rank short prefixes again after an hour
+
+
+def normalize_query(value):
+    """Return the index key of value, always unicode so keys of
+    utf-8 and unicode queries compare and sort together."""
+    if isinstance(value, str):
+        value = value.decode("utf-8", "replace")
+    return u" ".join(value.lower().split())
+
+
+class PrefixIndex(object):
+    """Prefix index over the queries entered in prompt dialogs.
+
+    Keys are kept in a sorted list so a prefix lookup is two bisects
+    plus a scan over the matching slice. Entries are ranked by
+    frequency decayed by the time since their last use. Prefixes of
+    up to SUGGEST_SHORT_PREFIX characters match most of the index, so
+    their best SUGGEST_SHORT_TOP keys are ranked in a single pass
+    after a change and looked up without a scan.
+    """
+
+    def __init__(self, max_entries=SUGGEST_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._keys = []
+        self._entries = {} # key -> [value, count, last_used]
+        self._short = None # short prefix -> best keys, None when stale
+        self._short_time = 0
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, value, count=1, last_used=None):
+        """Record one use of value.
+
+        @parm value: query as entered by the user.
+        @parm count: number of uses to add (0 just makes it known).
+        @parm last_used: timestamp of the use (defaults to now).
+        """
+        key = normalize_query(value)
+        if not key:
+            return
+        value = value.strip()
+
+        if last_used is None:
+            last_used = count and time.time() or 0
+
+        self._short = None
+        entry = self._entries.get(key)
+        if entry is None:
+            self._entries[key] = [value, count, last_used]
+            self._keys.insert(bisect_left(self._keys, key), key)
+            if len(self._keys) > self.max_entries:
+                self._evict()
+        else:
+            if count:
+                entry[0] = value
+            entry[1] += count
+            entry[2] = max(entry[2], last_used)
+
+    def count(self, value):
+        entry = self._entries.get(normalize_query(value))
+        if entry is None:
+            return 0
+        return entry[1]
+
+    def remove(self, value):
+        key = normalize_query(value)
+        self._short = None
+        if self._entries.pop(key, None) is not None:
+            del self._keys[bisect_left(self._keys, key)]
+
+    def _score(self, entry, now):
+        value, count, last_used = entry
+        age = max(0, now - last_used)
+        return count * 0.5 ** (age / float(SUGGEST_HALF_LIFE))
+
+    def _evict(self):
+        now = time.time()
+        key = min(self._keys,
+                  key=lambda k: (self._score(self._entries[k], now), k))
+        self.remove(key)
+
+    def _rank_short(self, now):
+        scored = {}
+        for key, entry in self._entries.iteritems():
+            score = (-self._score(entry, now), key)
+            for size in xrange(min(len(key), SUGGEST_SHORT_PREFIX) + 1):
+                scored.setdefault(key[:size], []).append(score)
+        self._short = dict((p, [k for score, k in
+                                heapq.nsmallest(SUGGEST_SHORT_TOP, lst)])
+                           for p, lst in scored.iteritems())
+        self._short_time = now
+
+    def suggest(self, prefix, limit=5):
+        """Return up to limit values starting with prefix, best first."""
+        key = normalize_query(prefix)
+        now = time.time()
+        if len(key) <= SUGGEST_SHORT_PREFIX and limit <= SUGGEST_SHORT_TOP:
+            if self._short is None or \
+                    now - self._short_time > SUGGEST_RANK_TTL:
+                self._rank_short(now)
+            ranked = self._short.get(key, [])[:limit]
+        else:
+            lo = bisect_left(self._keys, key)
+            hi = bisect_left(self._keys, key + u"\uffff", lo)
+            rank = lambda k: (-self._score(self._entries[k], now), k)
+            ranked = heapq.nsmallest(limit, self._keys[lo:hi], key=rank)
+        return [self._entries[k][0] for k in ranked]
+
+    def snapshot(self):
+        """Return a compact list of (value, count, last_used) tuples."""
+        return [tuple(self._entries[k]) for k in self._keys]
+
+    def restore(self, snapshot):
+        self._short = None
+        self._entries = {}
+        self._keys = []
+        for value, count, last_used in snapshot:
+            key = normalize_query(value)
+            if key and key not in self._entries:
+                self._entries[key] = [value, count, last_used]
+                self._keys.append(key)
+        self._keys.sort()
+
+
+class SuggestionStore(object):
+    """Prefix indexes of every prompt kind, persisted in plugin prefs."""
+
+    pref_name = "suggestions"
+
+    def __init__(self, prefs):
+        self.prefs = prefs
+        self._indexes = {}
+        self._seeded = set()
+        self._dirty = False
+
+        snapshot = prefs.get(self.pref_name, None) or {}
+        for kind, entries in snapshot.iteritems():
+            self.get(kind).restore(entries)
+
+    def get(self, kind):
+        index = self._indexes.get(kind)
+        if index is None:
+            index = self._indexes[kind] = PrefixIndex()
+        return index
+
+    def record(self, kind, value, last_used=None):
+        """Record a query the user has successfully searched for."""
+        self.get(kind).add(value, 1, last_used)
+        self._dirty = True
+
+    def seed(self, kind, value, last_used):
+        """Record a past use unless value already has uses recorded."""
+        index = self.get(kind)
+        if index.count(value):
+            return
+        index.add(value, 1, last_used)
+        self._dirty = True
+
+    def observe(self, kind, value):
+        """Make a value known (e.g. an artist seen in a playlist)
+        without counting it as a use."""
+        index = self.get(kind)
+        size = len(index)
+        index.add(value, 0)
+        if len(index) != size:
+            self._dirty = True
+
+    def needs_seed(self, kind):
+        """Return True the first time it is called for kind."""
+        if kind in self._seeded:
+            return False
+        self._seeded.add(kind)
+        return True
+
+    def suggest(self, kind, prefix, limit=5):
+        return self.get(kind).suggest(prefix, limit)
+
+    def save(self):
+        if not self._dirty:
+            return
+        self.prefs[self.pref_name] = \
+            dict((k, i.snapshot()) for k, i in self._indexes.iteritems())
+        self.prefs.save()
+        self._dirty = False
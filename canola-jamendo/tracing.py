@@ -0,0 +1,158 @@
+# Canola2 Jamendo Plugin
+# Authors: Vincent Lark <vincent.lark@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Additional permission under GNU GPL version 3 section 7
+#
+# If you modify this Program, or any covered work, by linking or combining it
+# with Canola2 and its core components (or a modified version of any of those),
+# containing parts covered by the terms of Instituto Nokia de Tecnologia End
+# User Software Agreement, the licensors of this Program grant you additional
+# permission to convey the resulting work.
+
+"""Lightweight tracing of the play path.
+
+Spans are recorded only when the tracer is enabled; otherwise begin()
+returns a shared no-op span, so instrumented code pays one attribute
+check. Traces are exported in the Chrome trace event format (load them
+in chrome://tracing).
+
+Time to first audio (from the click on a station to the first PLAYING
+state) is measured even when tracing is disabled and recorded as a
+metric.
+"""
+
+import os
+import time
+import thread
+import logging
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+
+log = logging.getLogger("plugins.canola-jamendo.trace")
+
+TRACE_MAX_EVENTS = 20000 # keep the last 20000 events
+
+
+class _NullSpan(object):
+    def end(self, **args):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Span(object):
+    def __init__(self, tracer, name, cat, args):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.tid = thread.get_ident()
+        self.start = time.time()
+
+    def end(self, **args):
+        if args:
+            self.args.update(args)
+        self.tracer.add_event({"name": self.name, "cat": self.cat,
+                               "ph": "X", "tid": self.tid,
+                               "ts": self.start * 1e6,
+                               "dur": (time.time() - self.start) * 1e6,
+                               "args": self.args})
+
+
+class Tracer(object):
+    def __init__(self, max_events=TRACE_MAX_EVENTS):
+        self.enabled = False
+        self.max_events = max_events
+        self.metrics = None
+        self._events = []
+        self._play_starts = {} # station name -> time play was requested
+
+    def begin(self, name, cat="play", **args):
+        """Start a span, call end() on the returned object to finish it."""
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, cat, args)
+
+    def instant(self, name, cat="play", **args):
+        if not self.enabled:
+            return
+        self.add_event({"name": name, "cat": cat, "ph": "i", "s": "p",
+                        "tid": thread.get_ident(), "ts": time.time() * 1e6,
+                        "args": args})
+
+    def add_event(self, event):
+        event["pid"] = os.getpid()
+        # list.append is atomic, trimming is done by a single thread at
+        # a time in practice and losing an event there is harmless
+        self._events.append(event)
+        if len(self._events) > self.max_events:
+            del self._events[:len(self._events) - self.max_events]
+
+    def clear(self):
+        self._events = []
+
+    def export(self, path):
+        """Write recorded events to path in Chrome trace event format."""
+        fd = open(path, "w")
+        try:
+            json.dump({"traceEvents": list(self._events),
+                       "displayTimeUnit": "ms"}, fd)
+        finally:
+            fd.close()
+
+    def play_started(self, name):
+        """The user asked to play station name."""
+        self._play_starts[name] = time.time()
+        self.instant("play requested", station=name)
+
+    def playing(self, name):
+        """The player of station name reached the PLAYING state.
+        The trace keeps the station of each time to first audio, the
+        metrics only their distribution."""
+        start = self._play_starts.pop(name, None)
+        if start is None:
+            return
+
+        elapsed = time.time() - start
+        log.info("time to first audio for '%s': %.3fs" % (name, elapsed))
+        self.instant("first audio", station=name, elapsed=elapsed)
+        if self.metrics is not None:
+            self.metrics.record("time_to_first_audio", elapsed)
+
+
+tracer = Tracer()
+
+
+def traced(name, cat="play"):
+    """Decorator recording calls of a function as spans."""
+    def decorator(func):
+        def new_def(*args, **kwds):
+            if not tracer.enabled:
+                return func(*args, **kwds)
+            span = Span(tracer, name, cat, {})
+            try:
+                return func(*args, **kwds)
+            finally:
+                span.end()
+        new_def.__name__ = func.__name__
+        new_def.__doc__ = func.__doc__
+        return new_def
+    return decorator
@@ -0,0 +1,182 @@
+# Canola2 Jamendo Plugin
+# Authors: Vincent Lark <vincent.lark@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Additional permission under GNU GPL version 3 section 7
+#
+# If you modify this Program, or any covered work, by linking or combining it
+# with Canola2 and its core components (or a modified version of any of those),
+# containing parts covered by the terms of Instituto Nokia de Tecnologia End
+# User Software Agreement, the licensors of this Program grant you additional
+# permission to convey the resulting work.
+
+import os
+import time
+import logging
+import threading
+
+from utils import normalize_path
+
+log = logging.getLogger("plugins.canola-jamendo.track_cache")
+
+TRACK_CACHE_BUDGET = 200 * 1024 * 1024 # keep up to 200MB of tracks
+TRACK_CACHE_SAVE_INTERVAL = 60 # save hits of cached tracks once a minute
+
+
+def track_key(model):
+    """Return the cache key of a track model (or client.Track)."""
+    mbid = getattr(model, "id", None) or getattr(model, "mbid", None)
+    if mbid:
+        return "id-%s" % normalize_path(str(mbid))
+    artist = getattr(model, "artist", None)
+    artist = getattr(artist, "name", artist) or ""
+    title = getattr(model, "title", None) or getattr(model, "name", "")
+    return "%s - %s" % (normalize_path(artist), normalize_path(title))
+
+
+class TrackCache(object):
+    """Audio files of played and pinned tracks, kept within a byte budget.
+
+    The index maps keys to [size, last_used, hits, pinned] and is stored
+    in a dict-like object with a save() method (plugin prefs). Eviction
+    drops tracks heard only once before repeatedly heard ones, least
+    recently used first; pinned tracks are never evicted.
+    """
+
+    def __init__(self, path, index, budget=TRACK_CACHE_BUDGET):
+        self.path = path
+        self.index = index
+        self.budget = budget
+        self._lock = threading.Lock()
+        self._saved = time.time()
+
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+        # forget files removed behind our back
+        for key in self.index.keys():
+            if not os.path.exists(self.get_path(key)):
+                del self.index[key]
+
+        self._sweep()
+
+    def _sweep(self):
+        """Remove partial downloads (.part, .part.tmp, .part.state) and
+        streams left by a killed plugin. They are outside the budget,
+        and stream urls can not be used again to resume them."""
+        for name in os.listdir(self.path):
+            if ".part" not in name and not name.endswith(".stream"):
+                continue
+            try:
+                os.unlink(os.path.join(self.path, name))
+                log.info("removed leftover %s" % name)
+            except OSError, e:
+                log.warning("unable to remove %s: %s" % (name, e))
+
+    def get_path(self, key):
+        return os.path.join(self.path, key + ".mp3")
+
+    def get_partial_path(self, key):
+        return os.path.join(self.path, key + ".part")
+
+    def get_stream_path(self, key):
+        return os.path.join(self.path, key + ".stream")
+
+    def total_size(self):
+        return sum([e[0] for e in self.index.values()])
+
+    def lookup(self, key):
+        """Return the local path of a cached track or None."""
+        self._lock.acquire()
+        try:
+            entry = self.index.get(key)
+            if entry is None:
+                return None
+            now = time.time()
+            entry[1] = now
+            entry[2] += 1
+            self.index[key] = entry
+            # hits decide eviction, keep them across restarts
+            if now - self._saved >= TRACK_CACHE_SAVE_INTERVAL:
+                self._save()
+        finally:
+            self._lock.release()
+        return self.get_path(key)
+
+    def contains(self, key):
+        return key in self.index
+
+    def store(self, key, filename, pinned=False):
+        """Move a downloaded file into the cache."""
+        path = self.get_path(key)
+        self._lock.acquire()
+        try:
+            os.rename(filename, path)
+            entry = self.index.get(key) or [0, 0, 0, False]
+            entry[0] = os.path.getsize(path)
+            entry[1] = time.time()
+            entry[3] = entry[3] or pinned
+            self.index[key] = entry
+            self._evict(key)
+            self._save()
+        finally:
+            self._lock.release()
+        log.info("track cached: %s" % key)
+        return path
+
+    def pin(self, key, pinned=True):
+        """Keep a cached track out of eviction. Return False if the
+        track is not cached, see store() to pin it once downloaded."""
+        self._lock.acquire()
+        try:
+            entry = self.index.get(key)
+            if entry is None:
+                return False
+            entry[3] = pinned
+            self.index[key] = entry
+            self._save()
+            return True
+        finally:
+            self._lock.release()
+
+    def _save(self):
+        self.index.save()
+        self._saved = time.time()
+
+    def is_pinned(self, key):
+        entry = self.index.get(key)
+        return entry is not None and entry[3]
+
+    def _evict(self, keep=None):
+        """Drop tracks until the cache fits its budget. keep, the track
+        being stored, is never dropped: the caller is about to play it."""
+        total = self.total_size()
+        if total <= self.budget:
+            return
+
+        # hits count replays: the first listen streamed the track
+        candidates = [(e[2] >= 1, e[1], k) for k, e in self.index.items()
+                      if not e[3] and k != keep]
+        candidates.sort()
+        for repeated, last_used, key in candidates:
+            if total <= self.budget:
+                break
+            total -= self.index[key][0]
+            del self.index[key]
+            try:
+                os.unlink(self.get_path(key))
+            except OSError:
+                pass
+            log.info("track evicted: %s" % key)
@@ -26,12 +26,18 @@ import logging
 
 from terra.core.manager import Manager
 from terra.ui.base import PluginThemeMixin
+from terra.core.threaded_func import ThreadedFunction
 
+from tracing import tracer, traced
+from probe import PROBE_AHEAD
+
+from manager import JamendoManager
 from model import AudioLocalModel, PromptModelFolder, HistoryModelFolder, \
     HistoryOptionsModel
 
 
 manager = Manager()
+jam_manager = JamendoManager()
 CanolaError = manager.get_class("Model/Notify/Error")
 YesNoDialogModel = manager.get_class("Model/YesNoDialog")
 EntryDialogModel = manager.get_class("Model/EntryDialog")
@@ -67,20 +73,28 @@ class ListController(BaseListController, OptionsControllerMixin):
         """Display a message in a notify window."""
         self.parent.show_notify(err)
 
+    def _play_started(self, model):
+        """Start measuring time to first audio if model is a station."""
+        get_station_url = getattr(model, "get_station_url", None)
+        if get_station_url is not None and get_station_url():
+            tracer.play_started(model.name)
+
     def cb_on_clicked(self, view, index):
         model = self.model.children[index]
 
         if not isinstance(model, PromptModelFolder) or \
                 not model.prompt_based:
+            self._play_started(model)
             BaseListController.cb_on_clicked(self, view, index)
             return
 
         def do_search(ignored, text):
             if text is not None:
                 model.query = text
+                self._play_started(model)
                 BaseListController.cb_on_clicked(self, view, index)
 
-        dialog = EntryDialogModel(model.prompt_title, model.prompt_label,
+        dialog = EntryDialogModel(model.prompt_title, model.get_prompt_label(),
                                   model.prompt_value, do_search)
         self.parent.show_notify(dialog)
 
@@ -99,6 +113,7 @@ class HistoryListController(ListController):
 
     def cb_on_clicked(self, view, index):
         # History doesn't depend on searching, so we just use original function
+        self._play_started(self.model.children[index])
         BaseListController.cb_on_clicked(self, view, index)
 
     def clear_history(self):
@@ -232,6 +247,7 @@ class AudioPlayerController(PluginThemeMixin, BaseAudioPlayerController):
 
         self.initialize_list()
 
+    @traced("player.initialize_list")
     def initialize_list(self, ok=False):
         if not self.parent_model.children:
             return
@@ -260,6 +276,9 @@ class AudioPlayerController(PluginThemeMixin, BaseAudioPlayerController):
             # could not read from resource
             # try to go to the next music
             self.unable_to_read_count += 1
+            if self.model.remote_uri and self.model.local_path is None:
+                jam_manager.prober.failed(self.model.remote_uri)
+            self.drop_upcoming()
             if self.unable_to_read_count < self.MAX_FAILS_ALLOWED:
                 self.next()
             else:
@@ -299,17 +318,81 @@ class AudioPlayerController(PluginThemeMixin, BaseAudioPlayerController):
         BaseAudioPlayerController.play(self)
         self.set_volume(self.volume) # XXX: force volume
 
+    def _player_state_changed(self, state):
+        BaseAudioPlayerController._player_state_changed(self, state)
+        if state == self.STATE_PLAYING:
+            tracer.playing(self.parent_model.name)
+
     def set_uri(self, uri):
         BaseAudioPlayerController.set_uri(self, uri, False)
 
+    @traced("player.change_model")
     def _change_model(self):
         log.warning("changing model")
         self.change_ban_state(False)
         self.change_love_state(False)
         self.refresh_remote_cover()
         self.update_trackbar()
-        self.model.uri = self.model.remote_uri
+        if self.model.track is not None:
+            url = self.parent_model.get_station_url()
+            jam_manager.played.mark(url, self.model.track)
+            jam_manager.similar.observe_play(self.model.track, url)
+        self.model.local_path = self.model.get_cached_path()
+        if self.model.local_path is not None:
+            log.warning("playing cached copy %s" % self.model.local_path)
+            self.model.uri = self.model.local_path
+        else:
+            self.model.uri = self.model.stream_track()
         self.setup_model(view=False)
+        self.prefetch()
+        self.probe()
+
+    def prefetch(self):
+        """Fetch covers and the next playlist segment ahead, as far as
+        the measured throughput allows."""
+        depth = jam_manager.stats.throughput.prefetch_depth()
+        if not depth:
+            return
+
+        children = self.parent_model.children
+        current = self.parent_model.current
+        for model in children[current + 1:current + 1 + depth]:
+            model.request_cover()
+
+        if len(children) - current - 1 < depth:
+            self.parent_model.prefetch_segment()
+
+    def probe(self):
+        """Check the next tracks in background and drop the ones that
+        can not be played before they reach the player."""
+        children = self.parent_model.children
+        current = self.parent_model.current
+        models = [m for m in children[current + 1:current + 1 + PROBE_AHEAD]
+                  if m.remote_uri and not m.is_cached()]
+        if not models:
+            return
+
+        def probe_finished(exception, retval):
+            if exception is not None:
+                log.error("unable to probe tracks: %s" % exception)
+            elif self.init_ok and self.model is not None:
+                dead = [m for m in models if retval.get(m.remote_uri) is False]
+                self.drop_upcoming(dead)
+
+        ThreadedFunction(probe_finished, jam_manager.prober.probe_many,
+                         [m.remote_uri for m in models]).start()
+
+    def drop_upcoming(self, dead=()):
+        """Remove dead models and tracks of blocked hosts after the
+        current one."""
+        children = self.parent_model.children
+        current = self.parent_model.current
+        for model in children[current + 1:]:
+            if model.is_cached() or not model.remote_uri:
+                continue
+            if model in dead or not jam_manager.prober.allow(model.remote_uri):
+                log.warning("dropping unplayable track %s" % model.remote_uri)
+                children.remove(model)
 
     def transition_in_finished_cb(self, obj, emission, source):
         BaseAudioPlayerController.transition_in_finished_cb(self,
@@ -347,7 +430,10 @@ class AudioPlayerController(PluginThemeMixin, BaseAudioPlayerController):
     def delete(self):
         if self.media_buttons is not None:
             self.media_buttons.delete()
+        if self.init_ok:
+            self.parent_model.cache_unplayed(self.parent_model.current + 1)
         BaseAudioPlayerController.delete(self)
+        jam_manager.streams.cancel_streams()
         self.parent_model.callback_notify = None
         self.parent_model.callback_search_finished = None
         self.model = None
@@ -55,6 +55,23 @@ def get_cover_path():
     return path
 
 
+def get_cover_file(artist, title):
+    """Return the local cover image path of a track."""
+    return os.path.join(get_cover_path(),
+                        "%s - %s.jpg" % (normalize_path(artist),
+                                         normalize_path(title)))
+
+
+def get_data_path():
+    """Return the directory where the plugin keeps its local data."""
+    path = os.path.join(os.path.expanduser("~"), ".canola", "jamendo")
+
+    if not os.path.exists(path):
+        os.makedirs(path)
+
+    return path
+
+
 def remove_old_covers(cover_path):
     """Remove old covers based on last access time."""
     lst = []
@@ -0,0 +1,145 @@
+# Canola2 Jamendo Plugin
+# Authors: Vincent Lark <vincent.lark@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Additional permission under GNU GPL version 3 section 7
+#
+# If you modify this Program, or any covered work, by linking or combining it
+# with Canola2 and its core components (or a modified version of any of those),
+# containing parts covered by the terms of Instituto Nokia de Tecnologia End
+# User Software Agreement, the licensors of this Program grant you additional
+# permission to convey the resulting work.
+
+"""Background warmup of the stations the user is likely to play.
+
+After the main folder is loaded, the first playlist segment and the
+first covers of the last played station and of the most recent history
+stations are fetched, one station at a time from an idler, and kept in
+the playlist cache so that tapping one of them starts at once.
+"""
+
+import os
+import ecore
+import logging
+
+from terra.core.threaded_func import ThreadedFunction
+
+from utils import get_cover_file
+
+
+log = logging.getLogger("plugins.canola-jamendo.warmup")
+
+WARMUP_BUDGET = 512 * 1024 # bytes spent on warmup per session
+WARMUP_STATIONS = 3 # history stations warmed besides the last played
+WARMUP_COVERS = 2 # covers fetched per station
+
+
+class StationWarmup(object):
+    """Warms stations until the data budget is spent.
+
+    @parm client: client.Client used to fetch playlists.
+    @parm playlists: PlaylistCache receiving the playlists.
+    @parm budget: bytes that may be downloaded, playlists and covers.
+    """
+
+    def __init__(self, client, playlists, budget=WARMUP_BUDGET):
+        self.client = client
+        self.playlists = playlists
+        self.budget = budget
+        self.used = 0
+        self._urls = []
+        self._idler = None
+        self._running = False
+        self._generation = 0
+
+    def start(self, urls):
+        """Warm the given station urls, most likely first."""
+        self.stop()
+        self._urls = []
+        for url in urls:
+            if url and url not in self._urls and \
+                    not self.playlists.count(url) and \
+                    not self.client.is_bad_station(url):
+                self._urls.append(url)
+        self._schedule()
+
+    def stop(self):
+        """Stop warming; a station being fetched is dropped."""
+        self._generation += 1
+        self._urls = []
+        if self._idler is not None:
+            self._idler.delete()
+            self._idler = None
+
+    def _schedule(self):
+        if self._urls and self._idler is None and not self._running:
+            self._idler = ecore.idler_add(self._step)
+
+    def _step(self):
+        self._idler = None
+        if self.used >= self.budget:
+            log.warning("warmup budget spent, %d stations left" % \
+                            len(self._urls))
+            self._urls = []
+            return False
+        if self.client.stats.throughput.prefetch_depth() == 0:
+            log.warning("link too slow, warmup stopped")
+            self._urls = []
+            return False
+
+        url = self._urls.pop(0)
+        generation = self._generation
+
+        def warm_finished(exception, retval):
+            self._running = False
+            if exception is not None:
+                log.error("unable to warm %s: %s" % (url, exception))
+            else:
+                tracks, used = retval
+                self.used += used
+                if generation == self._generation:
+                    log.warning("warmed %d tracks of %s" % (len(tracks), url))
+                    self.playlists.put(url, tracks)
+            self._schedule()
+
+        self._running = True
+        ThreadedFunction(warm_finished, self._warm, url).start()
+        return False
+
+    def _bytes_in(self):
+        return sum([ep["bytes_in"] for ep in
+                    self.client.stats.snapshot().itervalues()])
+
+    def _warm(self, url):
+        before = self._bytes_in()
+        tracks = self.client.get_station_tracks(url, background=True)
+        used = self._bytes_in() - before
+
+        for track in tracks[:WARMUP_COVERS]:
+            if self.used + used >= self.budget:
+                break
+            if not track.image or track.image.find("/noimage/cover") >= 0 \
+                    or track.artist is None:
+                continue
+            path = get_cover_file(track.artist.name, track.name)
+            if os.path.exists(path):
+                continue
+            try:
+                self.client.fetch_file(track.image, path)
+                used += os.path.getsize(path)
+            except Exception, e:
+                log.error("unable to fetch cover %s: %s" % (track.image, e))
+
+        return tracks, used